@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+
+class asgiApp:
+    """Runs a WSGI app, the Flask app, under an ASGI server.
+
+    Requests are handled by a2wsgi's WSGIMiddleware, which runs the app
+    on a thread pool and hands it the request body as it arrives instead
+    of reading it all first. The routes are not async, so each request
+    holds a thread while its response is being made, as it would under
+    waitress, but connections and keep-alive are handled on the event loop.
+
+    On top of that this adds the lifespan hook, and joins repeated Cookie
+    headers, which HTTP/2 clients send one per cookie, with "; " instead
+    of "," so the session cookie can still be read."""
+
+    def __init__(self, wsgiApp, threads=8, db=None, images=None):
+        """Set up the app.
+
+        Keyword arguments:
+        wsgiApp -- the WSGI app to run
+        threads -- the number of threads requests run on
+        db      -- the database, closed when the server shuts down
+        images  -- the image processor, closed when the server shuts down"""
+        self.wsgi = WSGIMiddleware(wsgiApp, workers=threads)
+        self.executor = self.wsgi.executor
+        self.db = db
+        self.images = images
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.wsgi(self.joinCookies(scope), receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+
+    def joinCookies(self, scope):
+        """Get a scope with its Cookie headers joined into one."""
+        cookies = [value for name, value in scope["headers"] if name.lower() == b"cookie"]
+        if len(cookies) < 2:
+            return scope
+        headers = [(name, value) for name, value in scope["headers"] if name.lower() != b"cookie"]
+        return {**scope, "headers": headers + [(b"cookie", b"; ".join(cookies))]}
+
+    async def lifespan(self, receive, send):
+        """Check the database when the server starts,
+        and finish image jobs and close the database when it stops.
+        These block, so they are run on the threads."""
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.db is not None:
+                    await loop.run_in_executor(self.executor, self.db.getSchemaVersion)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.images is not None:
+                    await loop.run_in_executor(self.executor, self.images.close)
+                if self.db is not None:
+                    await loop.run_in_executor(self.executor, self.db.close)
+                self.executor.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
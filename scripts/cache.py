@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import collections
+import threading
+import time
+
+class lruCache:
+    """A thread safe least recently used cache with a time to live.
+
+    When the cache is full the least recently used entry is evicted,
+    and entries older than ttl seconds are treated as missing.
+    A cache with a maxSize of 0 is disabled and never stores anything."""
+
+    def __init__(self, maxSize=1024, ttl=300):
+        """Set up the cache.
+
+        Keyword arguments:
+        maxSize -- the maximum number of entries, 0 to disable the cache
+        ttl     -- seconds before an entry expires, None to never expire"""
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def enabled(self):
+        return self.maxSize > 0
+
+    def get(self, key, default=None):
+        """Get a value from the cache, or default if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        """Add a value to the cache, evicting the least recently used if full."""
+        if not self.enabled:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def delete(self, key):
+        """Remove a value from the cache if it is there."""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def deleteWhere(self, predicate):
+        """Remove every value whose key the predicate returns True for."""
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    def items(self):
+        """Get a list of every key and value in the cache,
+        without counting them as hits or changing their order."""
+        with self.lock:
+            return [(key, value) for key, (value, expires) in self.entries.items()]
+
+    def clear(self):
+        """Remove everything from the cache."""
+        with self.lock:
+            self.entries.clear()
+
+    def getStats(self):
+        """Get the hit, miss and eviction counters and the current size."""
+        with self.lock:
+            return {**self.stats, "size": len(self.entries), "maxSize": self.maxSize}
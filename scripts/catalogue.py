@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+try:
+    from scripts.database import gameColumns
+except ModuleNotFoundError:
+    from database import gameColumns
+
+# Genres and publishers are joined with this in CSV files
+listSeparator = "|"
+csvColumns = ["name", "description", "releaseDate", "genres", "publishers", "image"]
+
+def getFormat(path, format=None):
+    """Get the format of a catalogue file, csv or jsonl, from its extension if not given."""
+    if format is None:
+        format = os.path.splitext(path)[1].lower().lstrip(".")
+    format = {"ndjson": "jsonl", "json": "jsonl"}.get(format, format)
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown catalogue format '{format}', must be csv, jsonl or ndjson")
+    return format
+
+def getText(row, name):
+    """Get a text field of a row, "" if it is missing.
+    Raises ValueError if it isn't text."""
+    value = row.get(name)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be text")
+    return value
+
+def splitList(value):
+    """Get a list of names from a list or a separated string.
+    Raises ValueError if it is neither, or a name isn't text."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(listSeparator)
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError("Genres and publishers must be text")
+    return [name.strip() for name in value if name.strip()]
+
+def makeRow(row):
+    """Make a row from a CSV row or a decoded JSON line.
+    Raises ValueError if it isn't an object or a field is the wrong type."""
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    return {
+        "name":        getText(row, "name").strip(),
+        "description": getText(row, "description"),
+        "releaseDate": getText(row, "releaseDate").strip(),
+        "genres":      splitList(row.get("genres")),
+        "publishers":  splitList(row.get("publishers", row.get("developers"))),
+        "image":       getText(row, "image") or None
+    }
+
+def readRows(f, format):
+    """Read games from a catalogue file a row at a time.
+    Each row is a dictionary with name, description, releaseDate,
+    lists of genres and publishers and the filename of an image, if any.
+    Rows that can't be read, like a line that isn't JSON or a name that
+    isn't text, are None, so they are skipped without stopping the import
+    and the row numbers used to resume stay the same."""
+    if format == "csv":
+        rows = csv.DictReader(f)
+    else:
+        rows = (line for line in f if line.strip())
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except csv.Error:
+            yield None
+            continue
+        try:
+            row = makeRow(row if format == "csv" else json.loads(row))
+        except ValueError:
+            # JSONDecodeError is a ValueError too
+            row = None
+        yield row
+
+class catalogueImporter:
+    """Imports games from a catalogue file in large batches.
+
+    Each batch is one transaction, with the games and their genre and
+    publisher links inserted with executemany. Genres and publishers are
+    looked up from the vocabulary and missing ones are added. How many rows
+    are done is saved in the same transaction, so an interrupted import
+    starts again after the last committed batch. Invalid rows, rows with a
+    new genre or publisher whose name isn't valid and games that already
+    exist are skipped.
+
+    Images are read from the image directory on a thread pool and handed to
+    the image processor after their batch is committed, so images are only
+    made for games that were added."""
+
+    def __init__(self, db, images=None, imageDirectory=None, batchSize=1000, workers=8):
+        """Set up the importer.
+
+        Keyword arguments:
+        db             -- the database to import into
+        images         -- the imageProcessor to give promo images to
+        imageDirectory -- the folder image filenames are relative to
+        batchSize      -- the number of rows in each transaction
+        workers        -- the number of image files to read at the same time"""
+        self.db = db
+        self.images = images
+        self.imageDirectory = imageDirectory
+        self.batchSize = batchSize
+        self.workers = workers
+        # Stop adding images once this many are waiting to be processed
+        self.maxQueuedImages = max(batchSize, 256)
+        self.queuedImages = []
+
+    def getImportID(self, path):
+        """Get an ID for an import that stays the same until the file changes."""
+        stat = os.stat(path)
+        return hashlib.sha256(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+    def getRowsDone(self, importID):
+        """Get how many rows of an import have been committed."""
+        rows = self.db.executeQuery("SELECT rowsDone FROM imports WHERE importID = ?", (importID,))
+        return rows[0][0] if rows else 0
+
+    def importFile(self, path, format=None, onProgress=None):
+        """Import a catalogue file, "-" reads from stdin and can't be resumed.
+        Returns the stats of the import.
+
+        Keyword arguments:
+        path       -- the path of the file to import
+        format     -- csv or jsonl, from the file extension if None
+        onProgress -- called with the stats after each batch"""
+        format = getFormat(path, format)
+        if path == "-":
+            return self.importRows(readRows(io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig"), format),
+                None, onProgress)
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return self.importRows(readRows(f, format), self.getImportID(path), onProgress)
+
+    def importRows(self, rows, importID=None, onProgress=None):
+        """Import rows from readRows, resuming after the rows already done if importID is given."""
+        start = time.perf_counter()
+        rowsDone = self.getRowsDone(importID) if importID is not None else 0
+        stats = {"resumedAt": rowsDone, "rows": rowsDone, "imported": 0, "skipped": 0,
+                 "images": 0, "imageErrors": 0, "seconds": 0.0, "rowsPerSecond": 0.0}
+        self.loadVocabulary()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="catalogueImages") as executor:
+                batch = []
+                for number, row in enumerate(rows):
+                    if number < rowsDone:
+                        continue
+                    batch.append(row)
+                    if len(batch) == self.batchSize:
+                        self.importBatch(batch, importID, stats, executor)
+                        batch = []
+                        self.updateStats(stats, start, onProgress)
+                if batch:
+                    self.importBatch(batch, importID, stats, executor)
+                    self.updateStats(stats, start, onProgress)
+        finally:
+            # The committed batches are kept even if the import stops
+            self.db.gameChanged()
+        return stats
+
+    def loadVocabulary(self, cur=None):
+        """Get the IDs of the existing genres and publishers by their lowercase names,
+        read with cur if given."""
+        vocabulary = self.db.getVocabulary() if cur is None else self.db.readVocabulary(cur)
+        self.vocabularyVersion = vocabulary["version"]
+        self.vocabulary = {kind: {name: ID for name, (ID, _) in vocabulary[kind].items()}
+                           for kind in ("genres", "publishers")}
+
+    def updateStats(self, stats, start, onProgress):
+        stats["seconds"] = time.perf_counter() - start
+        stats["rowsPerSecond"] = (stats["rows"] - stats["resumedAt"]) / stats["seconds"] if stats["seconds"] else 0.0
+        if onProgress is not None:
+            onProgress(stats)
+
+    def isValid(self, row):
+        """Check a row could be read and has a valid name and release date."""
+        return (row is not None
+            and self.db.validator.gameTitleLength(row["name"])[0]
+                and self.db.validator.releaseDate(row["releaseDate"])[0])
+
+    def namesValid(self, row):
+        """Check every genre and publisher of a row either exists
+        or has a name that could be added from the website."""
+        for kind, validate in (("genres", self.db.validator.genreName), ("publishers", self.db.validator.publisherName)):
+            for name in row[kind]:
+                if name.lower() not in self.vocabulary[kind] and not validate(name)[0]:
+                    return False
+        return True
+
+    def getNameID(self, cur, kind, name):
+        """Get the ID of a genre or publisher, adding it if it doesn't exist.
+        Returns the ID and whether it was added."""
+        ID = self.vocabulary[kind].get(name.lower())
+        if ID is not None:
+            return ID, False
+        if kind == "genres":
+            cur.execute("INSERT INTO gameGenres (genre) VALUES (?)", (name,))
+        else:
+            cur.execute("INSERT INTO gamePublishers (publisherName) VALUES (?)", (name,))
+        self.vocabulary[kind][name.lower()] = cur.lastrowid
+        return cur.lastrowid, True
+
+    def getExisting(self, cur, names):
+        """Get which of a list of lowercase game names already exist."""
+        existing = set()
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            cur.execute("SELECT LOWER(gameName) FROM games WHERE LOWER(gameName) IN (" +
+                ",".join("?" * len(chunk)) + ")", chunk)
+            existing.update(name for name, in cur.fetchall())
+        return existing
+
+    def importBatch(self, batch, importID, stats, executor):
+        """Import a batch of rows in one transaction."""
+        con, cur = self.db.connect()
+        added = False
+        try:
+            valid = [row for row in batch if self.isValid(row)]
+            existing = self.getExisting(cur, [row["name"].lower() for row in valid])
+            games = []
+            for row in valid:
+                if row["name"].lower() not in existing:
+                    existing.add(row["name"].lower())
+                    games.append(row)
+            # Take the write lock so the game IDs given out can't be used by anyone else,
+            # and check again for games added since
+            cur.execute("BEGIN IMMEDIATE")
+            # Another process may have added or deleted genres or publishers since the last batch,
+            # nothing can change them now until this batch is committed
+            if self.db.readVocabularyVersion(cur) != self.vocabularyVersion:
+                self.loadVocabulary(cur)
+            existing = self.getExisting(cur, [row["name"].lower() for row in games])
+            games = [row for row in games if row["name"].lower() not in existing and self.namesValid(row)]
+            cur.execute("SELECT IFNULL(MAX(gameID), 0) FROM games")
+            firstID = cur.fetchone()[0] + 1
+            genreLinks, publisherLinks = [], []
+            for gameID, row in enumerate(games, firstID):
+                for kind, links in (("genres", genreLinks), ("publishers", publisherLinks)):
+                    IDs = {}
+                    for name in row[kind]:
+                        ID, new = self.getNameID(cur, kind, name)
+                        IDs[ID] = None
+                        added |= new
+                    links.extend((gameID, ID) for ID in IDs)
+            # Links go in before their games, so the search index gets each game once
+            # with its genres and publishers instead of being updated for every link
+            cur.execute("PRAGMA defer_foreign_keys = ON")
+            cur.executemany("INSERT INTO gameGenresLink (gameID, genreID) VALUES (?, ?)", genreLinks)
+            cur.executemany("INSERT INTO gamePublishersLink (gameID, publisherID) VALUES (?, ?)", publisherLinks)
+            cur.executemany(
+                "INSERT INTO games (gameID, gameName, gameDescription, releaseDate, approved) VALUES (?, ?, ?, ?, 0)",
+                [(gameID, row["name"], row["description"], row["releaseDate"]) for gameID, row in enumerate(games, firstID)])
+            if importID is not None:
+                cur.execute(
+                    "INSERT INTO imports (importID, rowsDone) VALUES (?, ?) \
+                    ON CONFLICT (importID) DO UPDATE SET rowsDone = excluded.rowsDone",
+                    (importID, stats["rows"] + len(batch)))
+            # Adding genres and publishers bumped the version, they are already in self.vocabulary
+            vocabularyVersion = self.db.readVocabularyVersion(cur)
+            con.commit()
+            self.vocabularyVersion = vocabularyVersion
+        except BaseException:
+            con.rollback()
+            if added:
+                # The added genres and publishers were rolled back too
+                self.loadVocabulary()
+            raise
+        finally:
+            con.close()
+        stats["rows"] += len(batch)
+        stats["imported"] += len(games)
+        stats["skipped"] += len(batch) - len(games)
+        # Images are queued once their games are committed, after giving up the write lock
+        # so reading them doesn't hold up other writes
+        self.queueImages(games, stats, executor)
+
+    def queueImages(self, games, stats, executor):
+        """Read the images of a batch of games in parallel and give them to the image processor."""
+        if self.images is None or self.imageDirectory is None:
+            return
+
+        def queueImage(row):
+            with open(os.path.join(self.imageDirectory, row["image"]), "rb") as f:
+                data = f.read()
+            return self.images.submit("promo", hashlib.md5(row["name"].lower().encode()).hexdigest(), data)
+
+        # Wait for the image processor to catch up so staged images don't pile up
+        self.queuedImages = [jobID for jobID in self.queuedImages
+                             if self.images.getJob(jobID)["status"] in ("queued", "processing")]
+        while len(self.queuedImages) > self.maxQueuedImages:
+            self.images.wait(self.queuedImages.pop(0))
+        futures = [executor.submit(queueImage, row) for row in games if row["image"]]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                self.queuedImages.append(future.result())
+                stats["images"] += 1
+            except (OSError, ValueError):
+                stats["imageErrors"] += 1
+
+def exportGames(db, f, format, imageDirectory=None, batchSize=1000):
+    """Write every game to a catalogue file in gameID order, a batch at a time.
+    Returns the number of games written.
+
+    Keyword arguments:
+    db             -- the database to export from
+    f              -- the text file to write to
+    format         -- csv or jsonl
+    imageDirectory -- the folder to copy promo images to, None to leave them out
+    batchSize      -- the number of games read at a time"""
+    writer = None
+    if format == "csv":
+        writer = csv.DictWriter(f, csvColumns)
+        writer.writeheader()
+    if imageDirectory is not None:
+        os.makedirs(imageDirectory, exist_ok=True)
+    lastID, written = 0, 0
+    while True:
+        rows = db.executeQuery(
+            f"SELECT {gameColumns} FROM games WHERE games.gameID > ? \
+            ORDER BY games.gameID LIMIT ?", (lastID, batchSize))
+        if not rows:
+            return written
+        for row in rows:
+            stored = db.makeGame(row)
+            game = {"name": stored["name"], "description": stored["description"], "releaseDate": stored["releaseDate"],
+                    "genres": stored["genres"], "publishers": stored["developers"], "image": None}
+            if imageDirectory is not None:
+                gameTitleHash = hashlib.md5(game["name"].lower().encode()).hexdigest()
+                source = os.path.join(db.directory, "images/promo", gameTitleHash + ".png")
+                if os.path.exists(source):
+                    game["image"] = gameTitleHash + ".png"
+                    with open(source, "rb") as src, open(os.path.join(imageDirectory, game["image"]), "wb") as dst:
+                        dst.write(src.read())
+            if writer is not None:
+                writer.writerow({**game, "genres": listSeparator.join(game["genres"]),
+                                 "publishers": listSeparator.join(game["publishers"]), "image": game["image"] or ""})
+            else:
+                f.write(json.dumps(game) + "\n")
+            written += 1
+        lastID = rows[-1][0]
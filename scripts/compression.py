@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import flask
+import gzip
+import os
+import threading
+import time
+import zlib
+
+# Brotli is optional, only gzip is used if it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class compressor:
+    """Compresses responses for browsers that accept it.
+
+    Static files are compressed once into a cache folder and sent
+    as they are, so they are never compressed per request.
+    Other responses above a minimum size are compressed as they are sent,
+    streamed responses are compressed a chunk at a time. A streamed response
+    is read ahead until it reaches the minimum size before deciding,
+    so a short one is sent as it is.
+    The compression ratio and CPU time are recorded for each route."""
+
+    compressibleTypes = ("text/", "application/javascript", "application/json", "image/svg+xml")
+    staticExtensions = (".css", ".js", ".html", ".svg", ".json", ".txt")
+
+    def __init__(self, directory, minimumSize=1024, gzipLevel=6, brotliQuality=5):
+        """Set up the compressor.
+
+        Keyword arguments:
+        directory     -- the folder to keep precompressed static files in
+        minimumSize   -- responses smaller than this many bytes are not compressed
+        gzipLevel     -- the gzip level for responses, static files always use 9
+        brotliQuality -- the brotli quality for responses, static files always use 11"""
+        self.directory = directory
+        self.minimumSize = minimumSize
+        self.gzipLevel = gzipLevel
+        self.brotliQuality = brotliQuality
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        self.variants = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def precompress(self, staticDirectory):
+        """Make gzip and brotli copies of every compressible file in a folder,
+        unless an up to date copy already exists.
+        Returns the number of copies made."""
+        made = 0
+        staticDirectory = os.path.abspath(staticDirectory)
+        for root, _, filenames in os.walk(staticDirectory):
+            for filename in filenames:
+                if not filename.lower().endswith(self.staticExtensions):
+                    continue
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, staticDirectory)
+                for encoding in self.encodings:
+                    variant = os.path.join(self.directory, relative + "." + encoding)
+                    if not os.path.exists(variant) or os.path.getmtime(variant) < os.path.getmtime(path):
+                        with open(path, "rb") as f:
+                            data = self.compressStatic(f.read(), encoding)
+                        os.makedirs(os.path.dirname(variant), exist_ok=True)
+                        with open(variant + ".tmp", "wb") as f:
+                            f.write(data)
+                        os.replace(variant + ".tmp", variant)
+                        made += 1
+                    with self.lock:
+                        self.variants[(path, encoding)] = variant
+        return made
+
+    def compressStatic(self, data, encoding):
+        """Compress a static file as small as possible."""
+        if encoding == "br":
+            return brotli.compress(data, quality=11)
+        return gzip.compress(data, 9, mtime=0)
+
+    def acceptedEncoding(self):
+        """Get the best encoding the request accepts, or None."""
+        accepted = flask.request.accept_encodings
+        for encoding in self.encodings:
+            if accepted[encoding] > 0:
+                return encoding
+        return None
+
+    def getVariant(self, path):
+        """Get the best precompressed copy of a static file for the request.
+        Returns a tuple of (encoding, path), or None if there isn't one."""
+        encoding = self.acceptedEncoding()
+        if encoding is None:
+            return None
+        with self.lock:
+            variant = self.variants.get((os.path.abspath(path), encoding))
+        if variant is None or os.path.getmtime(variant) < os.path.getmtime(path):
+            return None
+        return encoding, variant
+
+    def newCompressor(self, encoding):
+        """Get a compressor object for streaming, with compress and flush methods."""
+        if encoding == "br":
+            return brotliStream(self.brotliQuality)
+        return zlib.compressobj(self.gzipLevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def record(self, route, bytesIn, bytesOut, cpuSeconds):
+        """Add a compressed response to the stats for its route."""
+        with self.lock:
+            stats = self.stats.setdefault(route, {"responses": 0, "bytesIn": 0, "bytesOut": 0, "cpuSeconds": 0.0})
+            stats["responses"] += 1
+            stats["bytesIn"] += bytesIn
+            stats["bytesOut"] += bytesOut
+            stats["cpuSeconds"] += cpuSeconds
+
+    def getStats(self):
+        """Get the compression stats for each route, with the compression ratio."""
+        with self.lock:
+            return {route: {**stats, "ratio": stats["bytesOut"] / stats["bytesIn"] if stats["bytesIn"] else 1.0}
+                    for route, stats in self.stats.items()}
+
+    def readAhead(self, chunks):
+        """Read a streamed response until it has at least minimumSize bytes or ends.
+        Returns a tuple of (the chunks read, the rest of the chunks or None if it ended first)."""
+        read = []
+        size = 0
+        iterator = iter(chunks)
+        for chunk in iterator:
+            read.append(chunk)
+            size += len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            if size >= self.minimumSize:
+                return read, iterator
+        if hasattr(chunks, "close"):
+            chunks.close()
+        return read, None
+
+    def joinChunks(self, read, rest, chunks):
+        """Send the chunks read ahead and then the rest of a streamed response,
+        closing the original when done."""
+        try:
+            yield from read
+            yield from rest
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def streamCompressed(self, chunks, encoding, route):
+        """Compress a streamed response a chunk at a time.
+        Each chunk is flushed so the browser gets it straight away."""
+        compressor = self.newCompressor(encoding)
+        bytesIn = bytesOut = 0
+        cpuSeconds = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                start = time.thread_time()
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                cpuSeconds += time.thread_time() - start
+                bytesIn += len(chunk)
+                bytesOut += len(data)
+                if data:
+                    yield data
+            start = time.thread_time()
+            data = compressor.flush()
+            cpuSeconds += time.thread_time() - start
+            bytesOut += len(data)
+            yield data
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            self.record(route, bytesIn, bytesOut, cpuSeconds)
+
+    def afterRequest(self, response):
+        """Compress a response if it is big enough and the browser accepts it."""
+        if (response.status_code != 200
+                or flask.request.method == "HEAD"
+                or "Content-Encoding" in response.headers
+                or response.direct_passthrough
+                or not response.mimetype.startswith(self.compressibleTypes)):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.acceptedEncoding()
+        if encoding is None:
+            return response
+        route = flask.request.endpoint or "unknown"
+        if response.is_streamed:
+            chunks = response.response
+            read, rest = self.readAhead(chunks)
+            if rest is None:
+                # It ended before reaching the minimum size
+                response.response = read
+                return response
+            response.response = self.streamCompressed(self.joinChunks(read, rest, chunks), encoding, route)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.minimumSize:
+                return response
+            start = time.thread_time()
+            compressor = self.newCompressor(encoding)
+            compressed = compressor.compress(data) + compressor.flush()
+            self.record(route, len(data), len(compressed), time.thread_time() - start)
+            response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        if response.get_etag()[0]:
+            etag, weak = response.get_etag()
+            response.set_etag(etag + "." + encoding, weak)
+        return response
+
+class brotliStream:
+    """Wraps brotli's compressor to work like zlib's compressobj."""
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self, mode=None):
+        if mode is None:
+            return self.compressor.finish()
+        return self.compressor.flush()
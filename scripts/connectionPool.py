@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import queue
+import sqlite3
+import threading
+import time
+
+class poolClosedError(Exception):
+    """Raised when a connection is requested from a closed pool."""
+
+class pooledConnection:
+    """A connection borrowed from a connectionPool.
+
+    Behaves like a sqlite3 connection, but close() returns
+    the connection to the pool instead of closing it, so the
+    connection's PRAGMAs and page cache are kept between requests."""
+
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+
+    def __getattr__(self, name):
+        connection = self.__dict__.get("connection")
+        if connection is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if excType is None:
+                self.commit()
+        finally:
+            self.close()
+
+    def close(self):
+        """Give the connection back to the pool.
+        Closing more than once does nothing."""
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            self.pool.release(connection)
+
+    def __del__(self):
+        # A connection that was never closed goes back to the pool
+        # when it is garbage collected, rather than holding its slot forever
+        if self.__dict__.get("connection") is not None:
+            self.close()
+
+class connectionPool:
+    """A bounded pool of SQLite connections shared between threads.
+
+    Connections are created lazily up to size, checked with a cheap
+    query before being handed out, and reused until the pool is closed.
+    Connections that have been idle for longer than maxIdle seconds are
+    health checked before being reused."""
+
+    def __init__(self, filename, size=8, timeout=30, maxIdle=30, onConnect=None):
+        """Set up the pool, no connections are opened until needed.
+
+        Keyword arguments:
+        filename  -- the sqlite database file
+        size      -- the maximum number of open connections
+        timeout   -- seconds to wait for a free connection before failing
+        maxIdle   -- seconds a connection can be idle before it is health checked
+        onConnect -- a function called with each new sqlite3 connection"""
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1")
+        self.filename = filename
+        self.size = size
+        self.timeout = timeout
+        self.maxIdle = maxIdle
+        self.onConnect = onConnect
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.closed = False
+        self.stats = {"hits": 0, "misses": 0, "discarded": 0, "waits": 0}
+
+    def newConnection(self):
+        """Open and set up a new connection."""
+        con = sqlite3.connect(self.filename, timeout=self.timeout, check_same_thread=False)
+        try:
+            if self.onConnect is not None:
+                self.onConnect(con)
+        except:
+            con.close()
+            raise
+        return con
+
+    def healthy(self, con):
+        """Check that a connection is still usable."""
+        try:
+            con.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def discard(self, con):
+        """Close a connection and forget about it."""
+        with self.lock:
+            self.connections.discard(con)
+            self.stats["discarded"] += 1
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        """Get a connection from the pool, opening one if none are idle.
+        Blocks for up to timeout seconds if every connection is in use."""
+        if self.closed:
+            raise poolClosedError("The connection pool has been closed")
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats["waits"] += 1
+            if not self.slots.acquire(timeout=self.timeout):
+                raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        try:
+            while True:
+                try:
+                    con, lastUsed = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                if time.monotonic() - lastUsed < self.maxIdle or self.healthy(con):
+                    with self.lock:
+                        self.stats["hits"] += 1
+                    return pooledConnection(self, con)
+                self.discard(con)
+            con = self.newConnection()
+            with self.lock:
+                self.connections.add(con)
+                self.stats["misses"] += 1
+            return pooledConnection(self, con)
+        except:
+            self.slots.release()
+            raise
+
+    def release(self, con):
+        """Return a connection to the pool.
+        Any uncommitted transaction is rolled back."""
+        try:
+            if self.closed:
+                self.discard(con)
+                return
+            try:
+                if con.in_transaction:
+                    con.rollback()
+            except sqlite3.Error:
+                self.discard(con)
+                return
+            self.idle.put((con, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    def getStats(self):
+        """Get the hit/miss counters and the number of open connections."""
+        with self.lock:
+            return {**self.stats, "open": len(self.connections), "idle": self.idle.qsize(), "size": self.size}
+
+    def close(self):
+        """Close every idle connection and stop handing out new ones.
+        Connections that are in use are closed when they are released."""
+        self.closed = True
+        while True:
+            try:
+                con, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(con)
+
+    def reopen(self):
+        """Allow a closed pool to hand out connections again."""
+        self.close()
+        self.closed = False
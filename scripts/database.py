@@ -1,24 +1,262 @@
 #!/usr/bin/env python3
 
-import bcrypt
+import base64
+import copy
+import json
 import os
+import re
 import sqlite3
+import threading
+import time
+
+try:
+    from scripts.cache import lruCache
+    from scripts.connectionPool import connectionPool
+    from scripts.passwordHasher import hasherBusyError, passwordHasher
+except ModuleNotFoundError:
+    from cache import lruCache
+    from connectionPool import connectionPool
+    from passwordHasher import hasherBusyError, passwordHasher
+
+# PRAGMAs applied to every connection, in the order they are set.
+# durable  -- every commit is synced to disk, survives power loss
+# balanced -- WAL with NORMAL sync, only the last commits can be lost on power loss
+# fast     -- no syncing at all, for testing and throwaway data
+performanceProfiles = {
+    "durable": {
+        "busy_timeout": 10000,
+        "journal_mode": "wal",
+        "synchronous":  2,
+        "mmap_size":    0,
+        "cache_size":   -8000,
+        "temp_store":   0
+    },
+    "balanced": {
+        "busy_timeout": 5000,
+        "journal_mode": "wal",
+        "synchronous":  1,
+        "mmap_size":    64 * 1024 * 1024,
+        "cache_size":   -32000,
+        "temp_store":   2
+    },
+    "fast": {
+        "busy_timeout": 5000,
+        "journal_mode": "wal",
+        "synchronous":  0,
+        "mmap_size":    256 * 1024 * 1024,
+        "cache_size":   -128000,
+        "temp_store":   2
+    }
+}
+
+# The columns the games list can be sorted by
+gamesPageOrders = {
+    "name":        "LOWER(games.gameName)",
+    "releaseDate": "games.releaseDate",
+    "id":          "games.gameID"
+}
+
+# The type of the sort value in a page cursor for each order, the columns are all NOT NULL
+gamesPageSortTypes = {
+    "name":        str,
+    "releaseDate": str,
+    "id":          int
+}
+
+# The columns of a game. Genres and publishers are each aggregated in their own
+# subquery so they don't multiply each other's rows, and as JSON arrays so names
+# can contain commas. They are in the order they were added, like getVocabulary.
+gameColumns = "\
+    games.gameID, \
+    games.approved, \
+    games.gameName, \
+    games.gameDescription, \
+    games.releaseDate, \
+    (SELECT json_group_array(genre) FROM ( \
+        SELECT g.genre FROM gameGenresLink gl \
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID \
+        WHERE gl.gameID = games.gameID ORDER BY g.genreID)), \
+    (SELECT json_group_array(publisherName) FROM ( \
+        SELECT p.publisherName FROM gamePublishersLink pl \
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID \
+        WHERE pl.gameID = games.gameID ORDER BY p.publisherID)), \
+    games.contentVersion, \
+    (SELECT json_array(reviews, ratingSum, stars1, stars2, stars3, stars4, stars5) \
+        FROM gameRatings WHERE gameRatings.gameID = games.gameID)"
+
+# How far apart games added to the end of a list are, a game moved between two others
+# goes halfway between them, so this many halvings can happen before the list is renumbered
+listPositionGap = 1024
+
+# The columns of a review, for queries joining gameReviews r, users u and games g
+reviewColumns = "\
+    r.reviewID, \
+    u.username, \
+    r.gameID, \
+    g.gameName, \
+    r.datePosted, \
+    r.rating, \
+    r.reviewText"
+
+class gamesPage:
+    """A page of games that is read from a database cursor while it is
+    iterated over, so it can be streamed into a template a few rows
+    at a time. The cursors for the previous and next pages are set
+    while iterating, prev after the first game and next at the end.
+
+    Pages going backwards are read the other way round by the query,
+    so they have to be read fully before being reversed,
+    but that is at most one page."""
+
+    fetchSize = 64
+
+    def __init__(self, db, query, params, limit, backwards, hasCursor):
+        self.db = db
+        self.query = query
+        self.params = params
+        self.limit = limit
+        self.backwards = backwards
+        self.hasCursor = hasCursor
+        self.next = None
+        self.prev = None
+
+    def readRows(self):
+        """Read up to limit + 1 rows from the database, a few at a time."""
+        con, cur = self.db.connect()
+        try:
+            cur.execute(self.query, self.params)
+            while True:
+                rows = cur.fetchmany(self.fetchSize)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            con.close()
+
+    def __iter__(self):
+        rows = self.readRows()
+        if self.backwards:
+            rows = list(rows)
+            more = len(rows) > self.limit
+            rows = rows[:self.limit][::-1]
+            if rows:
+                self.prev = self.db.encodeCursor(rows[0][3], rows[0][0]) if more else None
+                self.next = self.db.encodeCursor(rows[-1][3], rows[-1][0]) if self.hasCursor else None
+        try:
+            for count, row in enumerate(rows):
+                if count == self.limit:
+                    self.next = self.db.encodeCursor(last[3], last[0])
+                    break
+                if count == 0 and self.hasCursor and not self.backwards:
+                    self.prev = self.db.encodeCursor(row[3], row[0])
+                last = row
+                yield {"gameID": row[0], "name": row[1], "releaseDate": row[2]}
+        finally:
+            if hasattr(rows, "close"):
+                rows.close()
 
 class database:
-    def __init__(self, directory, validator):
-        """Set up database."""
+    def __init__(self, directory, validator, poolSize=8, profile="balanced",
+                 gameCacheSize=1024, gameCacheTTL=300, gameCacheCheck=1, hasher=None):
+        """Set up database.
+
+        Keyword arguments:
+        directory      -- the directory to store the database and images in
+        validator      -- the validator class to use
+        poolSize       -- the maximum number of open connections to keep
+        profile        -- the name of the performance profile to use
+        gameCacheSize  -- the maximum number of games to cache, 0 to disable
+        gameCacheTTL   -- seconds a cached game is kept for
+        gameCacheCheck -- seconds between checks for games changed by other processes
+        hasher         -- the passwordHasher to use, one with the defaults if None"""
+        if profile not in performanceProfiles:
+            raise ValueError(f"Unknown database profile '{profile}', must be one of: " + ", ".join(performanceProfiles))
         self.directory = directory
         self.filename = os.path.join(self.directory, "database.db")
         os.makedirs(os.path.join(self.directory, "images/pfp"), exist_ok=True)
         os.makedirs(os.path.join(self.directory, "images/promo"), exist_ok=True)
+        self.profileName = profile
+        self.profile = performanceProfiles[profile]
+        self.pool = connectionPool(self.filename, size=poolSize, onConnect=self.configureConnection)
+        self.hasher = passwordHasher() if hasher is None else hasher
+        # Games are cached by ("id", gameID), names are cached as ("name", lowercase name) -> gameID
+        # so invalidating a game only needs its ID. Other processes can change games too,
+        # so every gameCacheCheck seconds the games version in the database is read,
+        # and if it has changed the cached games are checked against their content versions
+        self.gameCache = lruCache(gameCacheSize, gameCacheTTL)
+        self.gameCacheCheck = gameCacheCheck
+        self.gamesVersion = None
+        self.gamesCheckedAt = None
+        self.gamesCheckLock = threading.Lock()
+        # Counts calls to gameChanged, with the count when each game last changed
+        # and when every game last did, so a game read from the database while it
+        # was being changed isn't put in the cache after gameChanged has run
+        self.gameChanges = 0
+        self.gameChangedAt = {}
+        self.allGamesChangedAt = 0
+        self.gameChangesLock = threading.Lock()
+        # Called with a gameID after that game changes, or None after
+        # a change that could affect any game, so other caches can be invalidated
+        self.gameListeners = []
+        # Genres and publishers rarely change, so they are loaded once and reloaded
+        # when their version in the database changes, which any process can bump
+        self.vocabulary = None
         self.validator = validator(self)
 
+    def configureConnection(self, con):
+        """Apply the performance profile to a new connection,
+        then read the PRAGMAs back to check they were applied.
+        mmap_size is allowed to be lower than asked for,
+        as SQLite may have been compiled with a smaller limit.
+        Foreign keys are enforced whatever the profile,
+        as deleting a game, genre or publisher relies on them to remove its links."""
+        con.execute("PRAGMA foreign_keys = ON")
+        if con.execute("PRAGMA foreign_keys").fetchone() != (1,):
+            raise sqlite3.OperationalError("SQLite was compiled without foreign key support")
+        for pragma, value in self.profile.items():
+            con.execute(f"PRAGMA {pragma} = {value}").fetchall()
+        settings = self.readSettings(con)
+        for pragma, value in self.profile.items():
+            if pragma == "mmap_size" and settings[pragma] <= value:
+                continue
+            if settings[pragma] != value:
+                raise sqlite3.OperationalError(
+                    f"PRAGMA {pragma} is {settings[pragma]} but the {self.profileName} profile needs {value}")
+
+    def readSettings(self, con):
+        """Read the profile PRAGMAs from a connection."""
+        settings = {}
+        for pragma in self.profile:
+            value = con.execute(f"PRAGMA {pragma}").fetchone()[0]
+            settings[pragma] = value.lower() if isinstance(value, str) else value
+        return settings
+
+    def getSettings(self):
+        """Get the effective performance settings of the database."""
+        con, cur = self.connect()
+        try:
+            settings = self.readSettings(con)
+        finally:
+            con.close()
+        return settings
+
     def connect(self):
-        """Access the database."""
-        con = sqlite3.connect(self.filename)
+        """Access the database.
+        The connection is borrowed from the pool,
+        and calling close on it gives it back."""
+        con = self.pool.acquire()
         cur = con.cursor()
         return con, cur
 
+    def getPoolStats(self):
+        """Get the connection pool hit/miss counters."""
+        return self.pool.getStats()
+
+    def close(self):
+        """Close all pooled connections and stop the password hashing workers."""
+        self.pool.close()
+        self.hasher.close()
+
     def executeScript(self, filename):
         """Execute a script file.
         
@@ -27,9 +265,50 @@ class database:
         with open(os.path.join(os.path.dirname(__file__), filename), "r") as f:
             script = f.read()
         con, cur = self.connect()
-        cur.executescript(script)
-        con.commit()
-        con.close()
+        try:
+            cur.executescript(script)
+            con.commit()
+        finally:
+            con.close()
+
+    def getMigrations(self):
+        """Get a sorted list of (version, filename) for every migration.
+        Migrations are sql files in the migrations folder,
+        named with their version number first, e.g. 001_name.sql"""
+        migrations = []
+        for filename in os.listdir(os.path.join(os.path.dirname(__file__), "migrations")):
+            match = re.match(r"^(\d+)_.*\.sql$", filename)
+            if match:
+                migrations.append((int(match.group(1)), filename))
+        return sorted(migrations)
+
+    def getSchemaVersion(self):
+        """Get the version of the last migration applied to the database."""
+        return self.executeQuery("PRAGMA user_version", ())[0][0]
+
+    def migrate(self):
+        """Upgrade the database in place by running any migrations
+        newer than the database's schema version.
+        Each migration runs in its own transaction,
+        so a failed migration leaves the database as it was before it.
+        Returns the list of versions that were applied."""
+        applied = []
+        for version, filename in self.getMigrations():
+            if version <= self.getSchemaVersion():
+                continue
+            with open(os.path.join(os.path.dirname(__file__), "migrations", filename), "r") as f:
+                script = f.read()
+            con, cur = self.connect()
+            try:
+                cur.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+            except:
+                if con.in_transaction:
+                    con.rollback()
+                raise
+            finally:
+                con.close()
+            applied.append(version)
+        return applied
 
     def executeQuery(self, query, params):
         """Execute a query and return the result.
@@ -38,34 +317,37 @@ class database:
         query  -- the query to execute
         params -- the parameters to pass to the query"""
         con, cur = self.connect()
-        cur.execute(query, params)
-        results = cur.fetchall()
-        con.close()
+        try:
+            cur.execute(query, params)
+            results = cur.fetchall()
+        finally:
+            con.close()
         return results
 
     def addUser(self, username, password, email, dateOfBirth, phoneNumber):
         """Add a user to the database.
         
         The password will be hashed using BCrypt.
-        The user will be given a default role of user."""
-        salt = bcrypt.gensalt()
-        password = password.encode("utf-8")
-        passwordHash = bcrypt.hashpw(password, salt)
+        The user will be given a default role of user.
+        Raises hasherBusyError if the password hashing workers are overloaded."""
+        passwordHash = self.hasher.hash(password)
         con, cur = self.connect()
-        cur.execute(
-            "INSERT INTO users (\
-                roleID, \
-                username, \
-                passwordHash, \
-                email, \
-                dateOfBirth, \
-                phoneNumber \
-            ) VALUES (\
-                (SELECT roleID from userRoles WHERE role = 'user'), \
-                ?, ?, ?, ?, ?)",
-            (username, passwordHash, email, dateOfBirth, phoneNumber))
-        con.commit()
-        con.close()
+        try:
+            cur.execute(
+                "INSERT INTO users (\
+                    roleID, \
+                    username, \
+                    passwordHash, \
+                    email, \
+                    dateOfBirth, \
+                    phoneNumber \
+                ) VALUES (\
+                    (SELECT roleID from userRoles WHERE role = 'user'), \
+                    ?, ?, ?, ?, ?)",
+                (username, passwordHash, email, dateOfBirth, phoneNumber))
+            con.commit()
+        finally:
+            con.close()
 
 
     def getUser(self, where, value):
@@ -75,19 +357,21 @@ class database:
         Used by getUserByUsername and getUserByEmail to avoid code duplication.
         Do not use this function directly."""
         con, cur = self.connect()
-        cur.execute(
-            "SELECT \
-                users.username, \
-                users.passwordHash, \
-                users.email, \
-                users.dateOfBirth, \
-                users.phoneNumber, \
-                userRoles.role \
-            FROM users \
-            INNER JOIN userRoles ON users.roleID = userRoles.roleID \
-            WHERE LOWER(users." + where + ") = ?", (value.lower(),))
-        user = cur.fetchone()
-        con.close()
+        try:
+            cur.execute(
+                "SELECT \
+                    users.username, \
+                    users.passwordHash, \
+                    users.email, \
+                    users.dateOfBirth, \
+                    users.phoneNumber, \
+                    userRoles.role \
+                FROM users \
+                INNER JOIN userRoles ON users.roleID = userRoles.roleID \
+                WHERE LOWER(users." + where + ") = ?", (value.lower(),))
+            user = cur.fetchone()
+        finally:
+            con.close()
         try:
             return {
                 "username":     user[0],
@@ -117,6 +401,9 @@ class database:
     def checkPassword(self, username, password):
         """Check if a password is correct for a user.
         Returns True if the password is correct, False if not.
+        If the password is correct but was hashed with a different
+        cost factor than the hasher's, it is hashed again and saved.
+        Raises hasherBusyError if the password hashing workers are overloaded.
         
         Keyword arguments:
         username -- the username of the user to check
@@ -124,9 +411,23 @@ class database:
         user = self.getUserByUsername(username)
         if user is None:
             return False
-        password = password.encode("utf-8")
         passwordHash = user["passwordHash"]
-        return bcrypt.checkpw(password, passwordHash)
+        if not self.hasher.check(password, passwordHash):
+            return False
+        if self.hasher.needsRehash(passwordHash):
+            try:
+                newHash = self.hasher.hash(password)
+            except hasherBusyError:
+                return True
+            con, cur = self.connect()
+            try:
+                cur.execute(
+                    "UPDATE users SET passwordHash = ? WHERE LOWER(username) = ? AND passwordHash = ?",
+                    (newHash, username.lower(), passwordHash))
+                con.commit()
+            finally:
+                con.close()
+        return True
     
     def changeUserRole(self, username, role):
         """Change a user's role.
@@ -135,16 +436,18 @@ class database:
         username -- the username of the user to change
         role     -- the new role of the user"""
         con, cur = self.connect()
-        cur.execute(
-            "UPDATE users SET roleID = (\
-                (SELECT roleID from userRoles WHERE role = ?) \
-            ) WHERE LOWER(username) = ?", (role, username.lower()))
-        con.commit()
-        con.close()
+        try:
+            cur.execute(
+                "UPDATE users SET roleID = (\
+                    (SELECT roleID from userRoles WHERE role = ?) \
+                ) WHERE LOWER(username) = ?", (role, username.lower()))
+            con.commit()
+        finally:
+            con.close()
 
     def addGame(self, name, description, releaseDate, genres, publishers):
         """Add a game to the database.
-        Will not add genres or publishers that do not already exist.
+        Raises ValueError if any of the genres or publishers do not exist.
         
         Keyword arguments:
         name        -- the name of the game
@@ -152,34 +455,87 @@ class database:
         releaseDate -- the release date of the game
         genres      -- an array of the genres of the game
         publishers  -- an array of developers and publishers of the game"""
+        vocabulary = self.getVocabulary()
+        unknown = [genre for genre in genres if genre.lower() not in vocabulary["genres"]] + \
+            [publisher for publisher in publishers if publisher.lower() not in vocabulary["publishers"]]
+        if unknown:
+            raise ValueError("Unknown genres or publishers: " + ", ".join(unknown))
+        genreIDs = dict.fromkeys(vocabulary["genres"][genre.lower()][0] for genre in genres)
+        publisherIDs = dict.fromkeys(vocabulary["publishers"][publisher.lower()][0] for publisher in publishers)
         con, cur = self.connect()
-        cur.execute(
-            "INSERT INTO games (gameName, gameDescription, releaseDate, approved) VALUES (?, ?, ?, 0)",
-            (name, description, releaseDate))
-        gameID = cur.lastrowid
-        for genre in genres:
-            cur.execute("SELECT genreID from gameGenres WHERE LOWER(genre) = ?", (genre.lower(),))
-            genreID = cur.fetchone()
-            if genreID is not None:
-                genreID = genreID[0]
-                cur.execute("INSERT INTO gameGenresLink (gameID, genreID) VALUES (?, ?)", (gameID, genreID))
-        for publisher in publishers:
-            cur.execute("SELECT publisherID from gamePublishers WHERE LOWER(publisherName) = ?", (publisher.lower(),))
-            publisherID = cur.fetchone()
-            if publisherID is not None:
-                publisherID = publisherID[0]
-                cur.execute("INSERT INTO gamePublishersLink (gameID, publisherID) VALUES (?, ?)", (gameID, publisherID))
-        con.commit()
-        con.close()
-
-    def unConcat(self, string):
-        """Split group_concat into an array.
-        
-        Keyword arguments:
-        string -- the string to remove the trailing comma from"""
-        if string is None:
-            return []
-        return string.split(",")
+        try:
+            cur.execute(
+                "INSERT INTO games (gameName, gameDescription, releaseDate, approved) VALUES (?, ?, ?, 0)",
+                (name, description, releaseDate))
+            gameID = cur.lastrowid
+            cur.executemany("INSERT INTO gameGenresLink (gameID, genreID) VALUES (?, ?)",
+                [(gameID, genreID) for genreID in genreIDs])
+            cur.executemany("INSERT INTO gamePublishersLink (gameID, publisherID) VALUES (?, ?)",
+                [(gameID, publisherID) for publisherID in publisherIDs])
+            con.commit()
+        finally:
+            con.close()
+        self.gameCache.delete(("name", name.lower()))
+        self.gameChanged(gameID)
+
+    def readVocabularyVersion(self, cur):
+        """Read the version of the genres and publishers, which goes up
+        whenever one is added, renamed or deleted by any process."""
+        cur.execute("SELECT version FROM cacheVersions WHERE name = 'vocabulary'")
+        return cur.fetchone()[0]
+
+    def getVocabulary(self):
+        """Get every genre and publisher, loading them from the database
+        only if one has been added, renamed or deleted since they were last loaded.
+        Checking costs one primary key lookup.
+        Returns a dictionary with the version they were loaded at, and genres and publishers,
+        each mapping the lowercase name to a tuple of (ID, name),
+        in the order they were added."""
+        con, cur = self.connect()
+        try:
+            return self.readVocabulary(cur)
+        finally:
+            con.close()
+
+    def readVocabulary(self, cur):
+        """Like getVocabulary, but using a cursor that is already open,
+        so it can be read inside a transaction."""
+        # The version is read first, so if they change while being loaded
+        # they are only loaded again next time
+        version = self.readVocabularyVersion(cur)
+        vocabulary = self.vocabulary
+        if vocabulary is None or vocabulary["version"] != version:
+            cur.execute("SELECT genreID, genre FROM gameGenres ORDER BY genreID")
+            genres = cur.fetchall()
+            cur.execute("SELECT publisherID, publisherName FROM gamePublishers ORDER BY publisherID")
+            publishers = cur.fetchall()
+            vocabulary = {
+                "version": version,
+                "genres": {genre.lower(): (genreID, genre) for genreID, genre in genres},
+                "publishers": {publisher.lower(): (publisherID, publisher) for publisherID, publisher in publishers}
+            }
+            self.vocabulary = vocabulary
+        return vocabulary
+
+    def makeGame(self, row):
+        """Make a game's dictionary from a row of gameColumns.
+        Its rating is None if it has no reviews, stars is how many reviews
+        gave one to five stars."""
+        rating = None
+        if row[8] is not None:
+            reviews, ratingSum, *stars = json.loads(row[8])
+            rating = {"reviews": reviews, "average": ratingSum / reviews, "stars": stars}
+        return {
+            "gameID":       row[0],
+            "approved":     bool(row[1]),
+            "name":         row[2],
+            "description":  row[3],
+            "releaseDate":  row[4],
+            "genres":       json.loads(row[5]),
+            "developers":   json.loads(row[6]),
+            "version":      row[7],
+            "rating":       rating
+        }
 
     def getGame(self, where, value):
         """Get a game from the database.
@@ -190,34 +546,12 @@ class database:
         where -- what to get the game by
         value -- the value to get the game by"""
         con, cur = self.connect()
-        cur.execute(
-            "SELECT \
-                games.gameID, \
-                games.approved, \
-                games.gameName, \
-                games.gameDescription, \
-                games.releaseDate, \
-                GROUP_CONCAT(DISTINCT g.genre), \
-                GROUP_CONCAT(DISTINCT p.publisherName) \
-            FROM games \
-            LEFT OUTER JOIN gameGenresLink gl     ON games.gameID = gl.gameID \
-            LEFT OUTER JOIN gameGenres g          ON gl.genreID = g.genreID \
-            LEFT OUTER JOIN gamePublishersLink pl ON games.gameID = pl.gameID \
-            LEFT OUTER JOIN gamePublishers p      ON pl.publisherID = p.publisherID \
-            WHERE " + where + " = ? ", (value,))
-        game = cur.fetchone()
-        con.close()
-        if game[0] is not None:
-            return {
-                "gameID":       game[0],
-                "approved":     bool(game[1]),
-                "name":         game[2],
-                "description":  game[3],
-                "releaseDate":  game[4],
-                "genres":       self.unConcat(game[5]),
-                "developers":   self.unConcat(game[6])
-            }
-        return None
+        try:
+            cur.execute(f"SELECT {gameColumns} FROM games WHERE " + where + " = ?", (value,))
+            game = cur.fetchone()
+        finally:
+            con.close()
+        return None if game is None else self.makeGame(game)
 
     def getGameByName(self, name):
         """Get a game from the database by its name.
@@ -225,7 +559,14 @@ class database:
         
         Keyword arguments:
         name -- the name of the game to get"""
-        return self.getGame("LOWER(games.gameName)", name.lower())
+        self.checkGames()
+        gameID = self.gameCache.get(("name", name.lower()))
+        game = None if gameID is None else self.gameCache.get(("id", gameID))
+        if game is None:
+            changes = self.gameChanges
+            game = self.getGame("LOWER(games.gameName)", name.lower())
+            self.cacheGame(game, changes)
+        return copy.deepcopy(game)
 
     def getGameByID(self, gameID):
         """Get a game from the database by its ID.
@@ -233,26 +574,257 @@ class database:
         
         Keyword arguments:
         gameID -- the ID of the game to get"""
-        return self.getGame("games.gameID", gameID)
+        self.checkGames()
+        game = self.gameCache.get(("id", gameID))
+        if game is None:
+            changes = self.gameChanges
+            game = self.getGame("games.gameID", gameID)
+            self.cacheGame(game, changes)
+        return copy.deepcopy(game)
+
+    def getGamesByIDs(self, ids):
+        """Get several games from the database by their IDs in one query,
+        games that are cached are not fetched again.
+        Returns a list of the games in the same order as the IDs,
+        IDs of games that don't exist are left out.
+
+        Keyword arguments:
+        ids -- the IDs of the games to get"""
+        self.checkGames()
+        games = {}
+        missing = []
+        for gameID in ids:
+            game = self.gameCache.get(("id", gameID))
+            if game is None:
+                missing.append(gameID)
+            else:
+                games[gameID] = game
+        if missing:
+            changes = self.gameChanges
+            for row in self.executeQuery(
+                f"SELECT {gameColumns} FROM games \
+                WHERE games.gameID IN (SELECT value FROM json_each(?))", (json.dumps(missing),)):
+                game = self.makeGame(row)
+                self.cacheGame(game, changes)
+                games[game["gameID"]] = game
+        return [copy.deepcopy(games[gameID]) for gameID in ids if gameID in games]
+
+    def checkGames(self):
+        """Check the cached games against the database if any game has changed
+        since the last check, as another process could have changed or deleted them
+        without this one being told. The version is read at most once every
+        gameCacheCheck seconds, by one thread while the others carry on."""
+        now = time.monotonic()
+        if self.gamesCheckedAt is not None and now - self.gamesCheckedAt < self.gameCacheCheck:
+            return
+        if not self.gamesCheckLock.acquire(blocking=False):
+            return
+        try:
+            self.gamesCheckedAt = now
+            con, cur = self.connect()
+            try:
+                cur.execute("SELECT version FROM cacheVersions WHERE name = 'games'")
+                version = cur.fetchone()[0]
+            finally:
+                con.close()
+            # The version is read first, so a change made while checking is checked again next time
+            if version != self.gamesVersion:
+                # Games being read now could be from before the change, so they aren't cached
+                with self.gameChangesLock:
+                    self.gameChanges += 1
+                    self.allGamesChangedAt = self.gameChanges
+                self.currentGames([game for key, game in self.gameCache.items() if key[0] == "id"])
+                self.gamesVersion = version
+        finally:
+            self.gamesCheckLock.release()
+
+    def currentGames(self, games):
+        """Check cached games against the database in one query.
+        Games whose content version or name has changed are removed from the cache.
+        Returns the set of IDs of the games that are still current.
+
+        Keyword arguments:
+        games -- the cached games to check"""
+        games = list(games)
+        if not games:
+            return set()
+        rows = self.executeQuery(
+            "SELECT gameID, contentVersion, gameName FROM games \
+            WHERE gameID IN (SELECT value FROM json_each(?))", (json.dumps([game["gameID"] for game in games]),))
+        versions = {gameID: (version, name) for gameID, version, name in rows}
+        current = set()
+        for game in games:
+            if versions.get(game["gameID"]) == (game["version"], game["name"]):
+                current.add(game["gameID"])
+            else:
+                self.gameCache.delete(("id", game["gameID"]))
+        return current
+
+    def cacheGame(self, game, changes):
+        """Add a game to the game cache, games that don't exist are not cached,
+        nor are games that gameChanged was called for since the game was read.
+
+        Keyword arguments:
+        game    -- the game to cache
+        changes -- gameChanges from before the game was read"""
+        if game is None:
+            return
+        # Held while checking and caching, so gameChanged can't run in between
+        # and have nothing to remove
+        with self.gameChangesLock:
+            if max(self.gameChangedAt.get(game["gameID"], 0), self.allGamesChangedAt) > changes:
+                return
+            self.gameCache.set(("id", game["gameID"]), game)
+            self.gameCache.set(("name", game["name"].lower()), game["gameID"])
+
+    def gameChanged(self, gameID=None):
+        """Remove a game from the game cache and tell the game listeners it changed.
+
+        Keyword arguments:
+        gameID -- the ID of the game that changed, None if any game could have"""
+        with self.gameChangesLock:
+            self.gameChanges += 1
+            # Only as many games as the cache holds are tracked, past that every game counts as changed
+            if gameID is None or len(self.gameChangedAt) >= max(self.gameCache.maxSize, 1):
+                self.gameChangedAt.clear()
+                self.allGamesChangedAt = self.gameChanges
+            else:
+                self.gameChangedAt[gameID] = self.gameChanges
+        if gameID is None:
+            self.gameCache.clear()
+        else:
+            self.gameCache.delete(("id", gameID))
+        for listener in self.gameListeners:
+            listener(gameID)
+
+    def getGameCacheStats(self):
+        """Get the game cache hit, miss and eviction counters."""
+        return self.gameCache.getStats()
 
     def getAllGames(self):
         """Get an array of all game titles in the database."""
         con, cur = self.connect()
-        cur.execute("SELECT gameName FROM games")
-        games = cur.fetchall()
-        con.close()
+        try:
+            cur.execute("SELECT gameName FROM games")
+            games = cur.fetchall()
+        finally:
+            con.close()
         return games
 
+    def encodeCursor(self, sortValue, gameID):
+        """Make an opaque page cursor from a row's sort value and ID."""
+        return base64.urlsafe_b64encode(json.dumps([sortValue, gameID]).encode()).decode().rstrip("=")
+
+    def decodeCursor(self, cursor, sortType):
+        """Get the sort value and ID back from a page cursor.
+        Both are checked so a bad cursor can't fail the query
+        after the page has started being sent.
+        Raises ValueError if the cursor is invalid.
+
+        Keyword arguments:
+        cursor   -- the cursor from encodeCursor
+        sortType -- the type the sort value must be, str or int"""
+        try:
+            sortValue, gameID = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid page cursor")
+        for value, valueType in ((sortValue, sortType), (gameID, int)):
+            # bool is an int too, and SQLite integers are 64 bit
+            if type(value) is not valueType or (valueType is int and not -2 ** 63 <= value < 2 ** 63):
+                raise ValueError("Invalid page cursor")
+        return sortValue, gameID
+
+    def getGamesPage(self, after=None, before=None, limit=50, order="name"):
+        """Get one page of games using keyset pagination,
+        so each page costs the same no matter how far into the list it is.
+        Returns a dictionary with the list of games and the cursors
+        for the next and previous pages, which are None at either end.
+
+        Keyword arguments:
+        after  -- the cursor to get the page after
+        before -- the cursor to get the page before
+        limit  -- the maximum number of games on the page
+        order  -- what to sort by, name, releaseDate or id"""
+        page = self.streamGamesPage(after, before, limit, order)
+        games = list(page)
+        return {"games": games, "next": page.next, "prev": page.prev}
+
+    def streamGamesPage(self, after=None, before=None, limit=50, order="name"):
+        """Get one page of games as a gamesPage, which reads the games
+        from a database cursor as it is iterated over instead of all at once.
+        Takes the same arguments as getGamesPage.
+        Raises ValueError straight away if the cursor or order is invalid."""
+        if order not in gamesPageOrders:
+            raise ValueError(f"Can't sort games by '{order}'")
+        sortKey = gamesPageOrders[order]
+        cursor = before if before is not None else after
+        where, params = "", ()
+        if cursor is not None:
+            # Written out instead of as a row value so SQLite can seek the index
+            comparison = "<" if before is not None else ">"
+            where = f"WHERE {sortKey} {comparison}= ? AND ({sortKey} {comparison} ? OR games.gameID {comparison} ?)"
+            sortValue, gameID = self.decodeCursor(cursor, gamesPageSortTypes[order])
+            params = (sortValue, sortValue, gameID)
+        direction = "DESC" if before is not None else "ASC"
+        return gamesPage(self,
+            f"SELECT \
+                games.gameID, \
+                games.gameName, \
+                games.releaseDate, \
+                {sortKey} \
+            FROM games {where} \
+            ORDER BY {sortKey} {direction}, games.gameID {direction} \
+            LIMIT ?", (*params, limit + 1), limit, before is not None, cursor is not None)
+
+    def searchGames(self, query, limit=20, namesOnly=False, highlight=("[", "]")):
+        """Search for games by name, description, genre and publisher.
+        The last word is matched as a prefix so partly typed words match.
+        Returns a list of dictionaries, best match first,
+        with the name and a snippet of the description
+        with the matching words wrapped in the highlight markers.
+
+        Keyword arguments:
+        query     -- the text to search for
+        limit     -- the maximum number of results
+        namesOnly -- only match game names, for autocomplete
+        highlight -- the strings to put before and after matching words"""
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        match = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        if namesOnly:
+            match = "gameName : (" + match + ")"
+        start, end = highlight
+        return [{
+                "gameID":    row[0],
+                "name":      row[1],
+                "highlight": row[2],
+                "snippet":   row[3]
+            } for row in self.executeQuery(
+            "SELECT \
+                rowid, \
+                gameName, \
+                highlight(gameSearch, 0, ?, ?), \
+                snippet(gameSearch, 1, ?, ?, '...', 24) \
+            FROM gameSearch \
+            WHERE gameSearch MATCH ? \
+            ORDER BY rank \
+            LIMIT ?", (start, end, start, end, match, limit))]
+
     def deleteGameByID(self, id):
         """Delete a game from the database by its name.
+        Its genre, publisher and list links and its images are deleted with it.
         
         Keyword arguments:
         id -- the id of the game to delete"""
         con, cur = self.connect()
-        cur.execute(
-            "DELETE FROM games WHERE gameID = ?", (id,))
-        con.commit()
-        con.close()
+        try:
+            cur.execute(
+                "DELETE FROM games WHERE gameID = ?", (id,))
+            con.commit()
+        finally:
+            con.close()
+        self.gameChanged(id)
 
     def addGenre(self, genre):
         """Add a genre to the database.
@@ -260,10 +832,12 @@ class database:
         Keyword arguments:
         genre -- the genre to add"""
         con, cur = self.connect()
-        cur.execute(
-            "INSERT INTO gameGenres (genre) VALUES (?)", (genre,))
-        con.commit()
-        con.close()
+        try:
+            cur.execute(
+                "INSERT INTO gameGenres (genre) VALUES (?)", (genre,))
+            con.commit()
+        finally:
+            con.close()
 
     def addPublisher(self, publisher):
         """Add a publisher to the database.
@@ -271,28 +845,20 @@ class database:
         Keyword arguments:
         publisher -- the publisher to add"""
         con, cur = self.connect()
-        cur.execute(
-            "INSERT INTO gamePublishers (publisherName) VALUES (?)", (publisher,))
-        con.commit()
-        con.close()
+        try:
+            cur.execute(
+                "INSERT INTO gamePublishers (publisherName) VALUES (?)", (publisher,))
+            con.commit()
+        finally:
+            con.close()
 
     def getGenres(self):
         """Get all genres from the database."""
-        con, cur = self.connect()
-        cur.execute(
-            "SELECT genre FROM gameGenres")
-        genres = cur.fetchall()
-        con.close()
-        return [genre[0] for genre in genres]
+        return [genre for _, genre in self.getVocabulary()["genres"].values()]
 
     def getPublishers(self):
         """Get all publishers from the database."""
-        con, cur = self.connect()
-        cur.execute(
-            "SELECT publisherName FROM gamePublishers")
-        publishers = cur.fetchall()
-        con.close()
-        return [publisher[0] for publisher in publishers]
+        return [publisher for _, publisher in self.getVocabulary()["publishers"].values()]
 
     def deleteGenre(self, genre):
         """Delete a genre from the database.
@@ -300,10 +866,21 @@ class database:
         Keyword arguments:
         genre -- the genre to delete"""
         con, cur = self.connect()
-        cur.execute(
-            "DELETE FROM gameGenres WHERE genre = ?", (genre,))
-        con.commit()
-        con.close()
+        try:
+            # The games are found in the same transaction, so none can be linked in between
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "SELECT l.gameID FROM gameGenresLink l \
+                INNER JOIN gameGenres g ON l.genreID = g.genreID WHERE g.genre = ?", (genre,))
+            gameIDs = [gameID for gameID, in cur.fetchall()]
+            cur.execute(
+                "DELETE FROM gameGenres WHERE genre = ?", (genre,))
+            con.commit()
+        finally:
+            con.close()
+        # Only the games that had it have changed
+        for gameID in gameIDs:
+            self.gameChanged(gameID)
 
     def deletePublisher(self, publisher):
         """Delete a publisher from the database.
@@ -311,12 +888,399 @@ class database:
         Keyword arguments:
         publisher -- the publisher to delete"""
         con, cur = self.connect()
-        cur.execute(
-            "DELETE FROM gamePublishers WHERE publisherName = ?", (publisher,))
-        con.commit()
-        con.close()
+        try:
+            # The games are found in the same transaction, so none can be linked in between
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "SELECT l.gameID FROM gamePublishersLink l \
+                INNER JOIN gamePublishers p ON l.publisherID = p.publisherID WHERE p.publisherName = ?", (publisher,))
+            gameIDs = [gameID for gameID, in cur.fetchall()]
+            cur.execute(
+                "DELETE FROM gamePublishers WHERE publisherName = ?", (publisher,))
+            con.commit()
+        finally:
+            con.close()
+        # Only the games that had it have changed
+        for gameID in gameIDs:
+            self.gameChanged(gameID)
+
+    def makeReview(self, row):
+        """Make a review's dictionary from a row of reviewColumns."""
+        return {
+            "reviewID":   row[0],
+            "username":   row[1],
+            "gameID":     row[2],
+            "gameName":   row[3],
+            "datePosted": row[4],
+            "rating":     row[5],
+            "text":       row[6]
+        }
+
+    def addReview(self, username, gameID, rating, text):
+        """Add a user's review of a game, replacing their review of it if they have one.
+        Returns the ID of the review, or None if the user or game does not exist.
+
+        Keyword arguments:
+        username -- the user writing the review
+        gameID   -- the ID of the game being reviewed
+        rating   -- the number of stars, 1 to 5
+        text     -- what the user wrote about the game"""
+        con, cur = self.connect()
+        try:
+            cur.execute(
+                "INSERT INTO gameReviews (userID, gameID, datePosted, rating, reviewText) \
+                SELECT users.userID, games.gameID, DATE('now'), ?, ? FROM users, games \
+                WHERE LOWER(users.username) = ? AND games.gameID = ? \
+                ON CONFLICT (userID, gameID) DO UPDATE SET \
+                    datePosted = excluded.datePosted, \
+                    rating = excluded.rating, \
+                    reviewText = excluded.reviewText",
+                (rating, text, username.lower(), gameID))
+            reviewID = None
+            if cur.rowcount:
+                cur.execute(
+                    "SELECT reviewID FROM gameReviews \
+                    WHERE userID = (SELECT userID FROM users WHERE LOWER(username) = ?) AND gameID = ?",
+                    (username.lower(), gameID))
+                reviewID = cur.fetchone()[0]
+            con.commit()
+        finally:
+            con.close()
+        if reviewID is not None:
+            self.gameChanged(gameID)
+        return reviewID
+
+    def editReview(self, reviewID, rating, text):
+        """Change the rating and text of a review.
+        Returns False if the review does not exist.
+
+        Keyword arguments:
+        reviewID -- the ID of the review to change
+        rating   -- the new number of stars, 1 to 5
+        text     -- the new text of the review"""
+        con, cur = self.connect()
+        try:
+            cur.execute("SELECT gameID FROM gameReviews WHERE reviewID = ?", (reviewID,))
+            row = cur.fetchone()
+            if row is not None:
+                cur.execute(
+                    "UPDATE gameReviews SET rating = ?, reviewText = ? WHERE reviewID = ?",
+                    (rating, text, reviewID))
+            con.commit()
+        finally:
+            con.close()
+        if row is None:
+            return False
+        self.gameChanged(row[0])
+        return True
+
+    def deleteReview(self, reviewID):
+        """Delete a review.
+        Returns False if the review does not exist.
+
+        Keyword arguments:
+        reviewID -- the ID of the review to delete"""
+        con, cur = self.connect()
+        try:
+            cur.execute("SELECT gameID FROM gameReviews WHERE reviewID = ?", (reviewID,))
+            row = cur.fetchone()
+            if row is not None:
+                cur.execute("DELETE FROM gameReviews WHERE reviewID = ?", (reviewID,))
+            con.commit()
+        finally:
+            con.close()
+        if row is None:
+            return False
+        self.gameChanged(row[0])
+        return True
+
+    def getReview(self, where, params):
+        """Get a single review from the database, or None if it does not exist.
+        Use getReviewByID or getUserReview instead of this function."""
+        rows = self.executeQuery(
+            f"SELECT {reviewColumns} FROM gameReviews r \
+            INNER JOIN users u ON r.userID = u.userID \
+            INNER JOIN games g ON r.gameID = g.gameID \
+            WHERE {where}", params)
+        return self.makeReview(rows[0]) if rows else None
+
+    def getReviewByID(self, reviewID):
+        """Get a review by its ID.
+
+        Keyword arguments:
+        reviewID -- the ID of the review to get"""
+        return self.getReview("r.reviewID = ?", (reviewID,))
+
+    def getUserReview(self, username, gameID):
+        """Get a user's review of a game.
+
+        Keyword arguments:
+        username -- the user who wrote the review
+        gameID   -- the ID of the game reviewed"""
+        return self.getReview(
+            "r.userID = (SELECT userID FROM users WHERE LOWER(username) = ?) AND r.gameID = ?",
+            (username.lower(), gameID))
+
+    def getReviewsPage(self, where, params, after, limit):
+        """Get a page of reviews, newest first, using keyset pagination on the reviewID.
+        Use getReviewsByGame or getReviewsByUser instead of this function."""
+        if after is not None:
+            where += " AND r.reviewID < ?"
+            params = (*params, after)
+        rows = self.executeQuery(
+            f"SELECT {reviewColumns} FROM gameReviews r \
+            INNER JOIN users u ON r.userID = u.userID \
+            INNER JOIN games g ON r.gameID = g.gameID \
+            WHERE {where} \
+            ORDER BY r.reviewID DESC \
+            LIMIT ?", (*params, limit + 1))
+        reviews = [self.makeReview(row) for row in rows[:limit]]
+        return {"reviews": reviews, "next": reviews[-1]["reviewID"] if len(rows) > limit else None}
+
+    def getReviewsByGame(self, gameID, after=None, limit=20):
+        """Get a page of a game's reviews, newest first.
+        Returns a dictionary with the list of reviews and the cursor
+        for the next page, which is None on the last page.
+
+        Keyword arguments:
+        gameID -- the ID of the game to get the reviews of
+        after  -- the cursor to get the page after
+        limit  -- the maximum number of reviews on the page"""
+        return self.getReviewsPage("r.gameID = ?", (gameID,), after, limit)
+
+    def getReviewsByUser(self, username, after=None, limit=20):
+        """Get a page of a user's reviews, newest first.
+        Returns the same as getReviewsByGame.
+
+        Keyword arguments:
+        username -- the user to get the reviews of
+        after    -- the cursor to get the page after
+        limit    -- the maximum number of reviews on the page"""
+        return self.getReviewsPage(
+            "r.userID = (SELECT userID FROM users WHERE LOWER(username) = ?)",
+            (username.lower(),), after, limit)
+
+    def getTopRatedGames(self, limit=10, minReviews=1):
+        """Get the games with the highest average rating, most reviewed first for ties.
+
+        Keyword arguments:
+        limit      -- the maximum number of games to get
+        minReviews -- how many reviews a game needs to be included"""
+        return [{"gameID": row[0], "name": row[1], "average": row[2], "reviews": row[3]}
+            for row in self.executeQuery(
+                "SELECT r.gameID, g.gameName, r.averageRating, r.reviews FROM gameRatings r \
+                INNER JOIN games g ON r.gameID = g.gameID \
+                WHERE r.reviews >= ? \
+                ORDER BY r.averageRating DESC, r.reviews DESC \
+                LIMIT ?", (minReviews, limit))]
+
+    def makeList(self, row):
+        """Make a game list's dictionary from a row of a gameLists query."""
+        return {
+            "listID":    row[0],
+            "username":  row[1],
+            "name":      row[2],
+            "public":    bool(row[3]),
+            "gameCount": row[4]
+        }
+
+    def createList(self, username, name, public=False):
+        """Create an empty game list for a user.
+        Returns the ID of the list, or None if the user does not exist.
+
+        Keyword arguments:
+        username -- the user the list belongs to
+        name     -- the name of the list
+        public   -- if other users can see the list"""
+        con, cur = self.connect()
+        try:
+            cur.execute(
+                "INSERT INTO gameLists (userID, listName, public) \
+                SELECT userID, ?, ? FROM users WHERE LOWER(username) = ?",
+                (name, public, username.lower()))
+            listID = cur.lastrowid if cur.rowcount else None
+            con.commit()
+        finally:
+            con.close()
+        return listID
+
+    def renameList(self, listID, name):
+        """Rename a game list.
+        Returns False if the list does not exist.
+
+        Keyword arguments:
+        listID -- the ID of the list to rename
+        name   -- the new name of the list"""
+        con, cur = self.connect()
+        try:
+            cur.execute("UPDATE gameLists SET listName = ? WHERE listID = ?", (name, listID))
+            renamed = cur.rowcount > 0
+            con.commit()
+        finally:
+            con.close()
+        return renamed
+
+    def deleteList(self, listID):
+        """Delete a game list and everything in it.
+        Returns False if the list does not exist.
+
+        Keyword arguments:
+        listID -- the ID of the list to delete"""
+        con, cur = self.connect()
+        try:
+            cur.execute("DELETE FROM gameLists WHERE listID = ?", (listID,))
+            deleted = cur.rowcount > 0
+            con.commit()
+        finally:
+            con.close()
+        return deleted
+
+    def getList(self, listID):
+        """Get a game list's details without its games, or None if it does not exist.
+
+        Keyword arguments:
+        listID -- the ID of the list to get"""
+        rows = self.executeQuery(
+            "SELECT l.listID, u.username, l.listName, l.public, l.gameCount FROM gameLists l \
+            INNER JOIN users u ON l.userID = u.userID \
+            WHERE l.listID = ?", (listID,))
+        return self.makeList(rows[0]) if rows else None
+
+    def getUserLists(self, username, includePrivate=True):
+        """Get a user's game lists without their games, oldest first.
+
+        Keyword arguments:
+        username       -- the user to get the lists of
+        includePrivate -- if lists other users can't see are included"""
+        return [self.makeList(row) for row in self.executeQuery(
+            "SELECT l.listID, u.username, l.listName, l.public, l.gameCount FROM gameLists l \
+            INNER JOIN users u ON l.userID = u.userID \
+            WHERE LOWER(u.username) = ? AND (l.public OR ?) \
+            ORDER BY l.listID", (username.lower(), includePrivate))]
+
+    def addGamesToList(self, listID, gameIDs):
+        """Add games to the end of a list in one transaction, in the order given.
+        Games already in the list and IDs of games that don't exist are skipped.
+        Returns how many games were added, or None if the list does not exist.
+
+        Keyword arguments:
+        listID  -- the ID of the list to add to
+        gameIDs -- the IDs of the games to add"""
+        con, cur = self.connect()
+        try:
+            # Take the write lock first so no one else can use the same positions
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "SELECT (SELECT IFNULL(MAX(position), 0) FROM gameListLink WHERE listID = ?) \
+                FROM gameLists WHERE listID = ?", (listID, listID))
+            row = cur.fetchone()
+            added = None
+            if row is not None:
+                cur.execute(
+                    "INSERT OR IGNORE INTO gameListLink (listID, gameID, position) \
+                    SELECT ?, games.gameID, ? + (ids.key + 1) * ? FROM json_each(?) ids \
+                    INNER JOIN games ON games.gameID = ids.value",
+                    (listID, row[0], listPositionGap, json.dumps(list(gameIDs))))
+                added = cur.rowcount
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+        return added
+
+    def removeGamesFromList(self, listID, gameIDs):
+        """Remove games from a list in one transaction.
+        Returns how many games were removed.
+
+        Keyword arguments:
+        listID  -- the ID of the list to remove from
+        gameIDs -- the IDs of the games to remove"""
+        con, cur = self.connect()
+        try:
+            cur.execute(
+                "DELETE FROM gameListLink WHERE listID = ? AND gameID IN (SELECT value FROM json_each(?))",
+                (listID, json.dumps(list(gameIDs))))
+            removed = cur.rowcount
+            con.commit()
+        finally:
+            con.close()
+        return removed
+
+    def moveGameInList(self, listID, gameID, afterGameID=None):
+        """Move a game in a list to just after another game, or to the start.
+        Only the moved game's position changes, unless there is no gap left
+        between its new neighbours and the whole list is renumbered.
+        Returns False if either game is not in the list.
+
+        Keyword arguments:
+        listID      -- the ID of the list
+        gameID      -- the ID of the game to move
+        afterGameID -- the ID of the game it goes after, None for the start of the list"""
+        con, cur = self.connect()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for renumbered in (False, True):
+                cur.execute(
+                    "SELECT gameID, position FROM gameListLink WHERE listID = ? AND gameID IN (?, ?)",
+                    (listID, gameID, afterGameID))
+                positions = dict(cur.fetchall())
+                if gameID not in positions or (afterGameID is not None and afterGameID not in positions):
+                    con.commit()
+                    return False
+                before = positions[afterGameID] if afterGameID is not None else 0
+                cur.execute(
+                    "SELECT MIN(position) FROM gameListLink WHERE listID = ? AND position > ? AND gameID != ?",
+                    (listID, before, gameID))
+                after = cur.fetchone()[0]
+                position = before + listPositionGap if after is None else (before + after) // 2
+                if position != before and position != after:
+                    break
+                # There's no room between them, so spread every game out again
+                cur.execute(
+                    "SELECT gameID FROM gameListLink WHERE listID = ? ORDER BY position, gameID", (listID,))
+                cur.executemany(
+                    "UPDATE gameListLink SET position = ? WHERE listID = ? AND gameID = ?",
+                    [((i + 1) * listPositionGap, listID, row[0]) for i, row in enumerate(cur.fetchall())])
+            cur.execute(
+                "UPDATE gameListLink SET position = ? WHERE listID = ? AND gameID = ?",
+                (position, listID, gameID))
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            con.close()
+        return True
+
+    def getListGames(self, listID, after=None, limit=50):
+        """Get one page of the games in a list, in the list's order,
+        using keyset pagination so pages deep into a long list cost the same as the first.
+        Returns a dictionary with the list of games and the cursor
+        for the next page, which is None on the last page.
+
+        Keyword arguments:
+        listID -- the ID of the list
+        after  -- the cursor to get the page after
+        limit  -- the maximum number of games on the page
+        Raises ValueError if the cursor is invalid."""
+        where, params = "", ()
+        if after is not None:
+            position, gameID = self.decodeCursor(after, int)
+            # Written out instead of as a row value so SQLite can seek the index
+            where, params = "AND l.position >= ? AND (l.position > ? OR l.gameID > ?)", (position, position, gameID)
+        rows = self.executeQuery(
+            f"SELECT l.position, games.gameID, games.gameName, games.releaseDate FROM gameListLink l \
+            INNER JOIN games ON l.gameID = games.gameID \
+            WHERE l.listID = ? {where} \
+            ORDER BY l.position, l.gameID \
+            LIMIT ?", (listID, *params, limit + 1))
+        games = [{"gameID": row[1], "name": row[2], "releaseDate": row[3]} for row in rows[:limit]]
+        return {"games": games, "next": self.encodeCursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None}
 
 if __name__ == "__main__":
     from validator import validator
     db = database(os.path.join(os.path.dirname(__file__), "../data/"), validator)
     db.executeScript("databaseStructure.sql")
+    db.migrate()
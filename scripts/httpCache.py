@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import flask
+import hashlib
+import mimetypes
+import os
+import threading
+
+class fileVersions:
+    """Sends files with strong ETags and long lived caching.
+
+    The version of a file is a hash of its contents, worked out once
+    and kept until the file's modification time or size changes.
+    It is used as the file's ETag and put in its URL as ?v=, so when a
+    request has the current version the response can be cached forever,
+    and when the file changes its URL changes too."""
+
+    immutableMaxAge = 365 * 24 * 60 * 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+
+    def getVersion(self, path):
+        """Get the version of a file, or None if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.versions.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        version = sha.hexdigest()[:20]
+        with self.lock:
+            self.versions[path] = (key, version)
+        return version
+
+    def url(self, url, path):
+        """Add the version of a file to its URL.
+
+        Keyword arguments:
+        url  -- the URL the file is served from
+        path -- the path of the file on disk"""
+        version = self.getVersion(path)
+        separator = "&" if "?" in url else "?"
+        return f"{url}{separator}v={version}" if version is not None else url
+
+    def send(self, path, urlVersion=None, variant=None):
+        """Send a file with its ETag, replying 304 if the browser already has it.
+        If the request's ?v= matches the file it is cached for a year,
+        otherwise the browser has to check it each time.
+        Raises FileNotFoundError if the file doesn't exist.
+
+        Keyword arguments:
+        path       -- the path of the file to send
+        urlVersion -- the version the URL should have, if the file is
+                      made from another file that the URL is versioned by
+        variant    -- a tuple of (encoding, path) of a compressed copy to send instead"""
+        version = self.getVersion(path)
+        if version is None:
+            raise FileNotFoundError(path)
+        immutable = flask.request.args.get("v") == (urlVersion or version)
+        maxAge = self.immutableMaxAge if immutable else 0
+        if variant is None:
+            response = flask.send_file(os.path.abspath(path), etag=version, max_age=maxAge, conditional=True)
+        else:
+            encoding, variantPath = variant
+            response = flask.send_file(os.path.abspath(variantPath), etag=version + "." + encoding,
+                mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                max_age=maxAge, conditional=True)
+            response.headers["Content-Encoding"] = encoding
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
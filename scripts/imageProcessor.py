@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from PIL import Image, features
+
+class imageProcessor:
+    """Resizes and saves uploaded images on background worker threads.
+
+    Uploads are written to a staging folder and a job is queued,
+    the final image is written to a temporary file and then moved into
+    place, so the old or default image is served until the job is done.
+    Staged uploads left over from a restart are queued again by resume.
+
+    Some kinds of image also get smaller derivatives made, one for each
+    width bucket that is smaller than the image, in each format.
+    They are saved next to the full image as name.width.format"""
+
+    # The folder final images go in and the size they are resized to, None to keep the size
+    kinds = {
+        "pfp":   ("images/pfp",   (512, 512)),
+        "promo": ("images/promo", None)
+    }
+    # The widths of the derivatives made for each kind of image
+    derivativeWidths = {
+        "promo": (128, 256, 512, 1024)
+    }
+    # The arguments each derivative format is saved with, best compression first
+    formatOptions = {
+        "avif": {"quality": 60},
+        "webp": {"quality": 80, "method": 4},
+        "png":  {"optimize": True}
+    }
+    maxJobs = 1024
+    # Seconds the status of a finished job is kept on disk for
+    jobFileAge = 60 * 60
+
+    def __init__(self, directory, workers=2, formats=None):
+        """Set up the image processor, the workers are started when first needed.
+
+        Keyword arguments:
+        directory -- the data directory images are stored in
+        workers   -- the number of images to process at the same time
+        formats   -- the derivative formats to make, by default avif
+                     if Pillow supports it, then webp and png"""
+        if formats is None:
+            formats = [format for format in self.formatOptions
+                       if format == "png" or features.check(format)]
+        self.formats = formats
+        self.directory = directory
+        self.staging = os.path.join(directory, "images/staging")
+        os.makedirs(self.staging, exist_ok=True)
+        # Finished jobs are written here so any server process can report on them
+        self.jobsDirectory = os.path.join(directory, "images/jobs")
+        os.makedirs(self.jobsDirectory, exist_ok=True)
+        for folder, _ in self.kinds.values():
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def getExecutor(self):
+        """Get the worker pool, starting it if needed."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="imageProcessor")
+            return self.executor
+
+    def getPath(self, kind, name):
+        """Get the path of a finished image."""
+        return os.path.join(self.directory, self.kinds[kind][0], name + ".png")
+
+    def getDerivativePath(self, kind, name, width, format):
+        """Get the path of a derivative of a finished image."""
+        return os.path.join(self.directory, self.kinds[kind][0], f"{name}.{width}.{format}")
+
+    def findDerivative(self, kind, name, width=None, formats=("png",)):
+        """Find the best existing file to send for an image.
+        This is the smallest derivative at least as wide as width,
+        in the first of formats that it exists in.
+        If width is wider than every derivative, or the derivative
+        doesn't exist, the full image path is returned.
+        Returns None if the image doesn't exist.
+
+        Keyword arguments:
+        kind    -- the kind of image
+        name    -- the name of the image
+        width   -- the width the image will be shown at, None for the full image
+        formats -- the formats the client accepts, in order of preference"""
+        if width is not None:
+            for bucket in self.derivativeWidths.get(kind, ()):
+                if bucket >= width:
+                    for format in formats:
+                        path = self.getDerivativePath(kind, name, bucket, format)
+                        if os.path.exists(path):
+                            return path
+                    break
+        path = self.getPath(kind, name)
+        return path if os.path.exists(path) else None
+
+    def makeDerivatives(self, kind, name, image, onProgress=None):
+        """Save a resized copy of an image for each width and format.
+        Widths that are not smaller than the image are skipped,
+        so the full image is used for them instead.
+        Each file is written to a temporary file and then moved into place.
+
+        Keyword arguments:
+        kind       -- the kind of image
+        name       -- the name of the image
+        image      -- the full size Pillow image
+        onProgress -- called with the fraction done after each file"""
+        widths = [width for width in self.derivativeWidths.get(kind, ()) if width < image.width]
+        for width in self.derivativeWidths.get(kind, ()):
+            for format in self.formatOptions:
+                path = self.getDerivativePath(kind, name, width, format)
+                if width not in widths and os.path.exists(path):
+                    os.remove(path)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        done, total = 0, len(widths) * len(self.formats)
+        for width in widths:
+            resized = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+            for format in self.formats:
+                path = self.getDerivativePath(kind, name, width, format)
+                resized.save(path + ".tmp", format.upper(), **self.formatOptions[format])
+                os.replace(path + ".tmp", path)
+                done += 1
+                if onProgress is not None:
+                    onProgress(done / total)
+
+    def backfill(self, kind="promo", onProgress=None):
+        """Make the derivatives that are missing for existing images,
+        using the worker pool to process images in parallel.
+        Returns the number of images that derivatives were made for.
+
+        Keyword arguments:
+        kind       -- the kind of image to backfill
+        onProgress -- called with (done, total) after each image"""
+        folder = os.path.join(self.directory, self.kinds[kind][0])
+        names = [filename[:-4] for filename in os.listdir(folder)
+                 if re.match(r"^\w+\.png$", filename)]
+
+        def backfillImage(name):
+            with Image.open(self.getPath(kind, name)) as image:
+                widths = [width for width in self.derivativeWidths.get(kind, ()) if width < image.width]
+                if all(os.path.exists(self.getDerivativePath(kind, name, width, format))
+                       for width in widths for format in self.formats):
+                    return False
+                image.load()
+                self.makeDerivatives(kind, name, image)
+                return True
+
+        made = 0
+        futures = [self.getExecutor().submit(backfillImage, name) for name in names]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            made += future.result()
+            if onProgress is not None:
+                onProgress(done, len(futures))
+        return made
+
+    def submit(self, kind, name, data):
+        """Stage an uploaded image and queue it to be processed.
+        Returns the ID of the job.
+
+        Keyword arguments:
+        kind -- the kind of image, pfp or promo
+        name -- the name of the final image, without the extension
+        data -- the bytes of the uploaded image"""
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown image kind '{kind}'")
+        if not re.match(r"^\w+$", name):
+            raise ValueError("Image names can only contain letters, numbers and underscores")
+        jobID = secrets.token_hex(8)
+        staged = os.path.join(self.staging, f"{kind}.{name}.{jobID}")
+        with open(staged, "wb") as f:
+            f.write(data)
+        self.queue(jobID, kind, name, staged)
+        return jobID
+
+    def queue(self, jobID, kind, name, staged):
+        """Add a job for a staged image and give it to a worker."""
+        job = {"kind": kind, "name": name, "status": "queued", "progress": 0, "error": None}
+        with self.lock:
+            self.jobs[jobID] = job
+            finished = [job for job, info in self.jobs.items() if info["status"] in ("done", "failed")]
+            for job in finished[:max(len(self.jobs) - self.maxJobs, 0)]:
+                del self.jobs[job]
+        for filename in os.listdir(self.jobsDirectory):
+            path = os.path.join(self.jobsDirectory, filename)
+            try:
+                if os.path.getmtime(path) < time.time() - self.jobFileAge:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        future = self.getExecutor().submit(self.process, jobID, staged)
+        # The job could already be finished and evicted by another queue, so it is set on the local dict
+        with self.lock:
+            job["future"] = future
+
+    def resume(self):
+        """Queue any staged images left over from before a restart.
+        Returns the IDs of the queued jobs."""
+        jobIDs = []
+        for filename in sorted(os.listdir(self.staging)):
+            parts = filename.split(".")
+            if len(parts) == 3 and parts[0] in self.kinds:
+                kind, name, jobID = parts
+                self.queue(jobID, kind, name, os.path.join(self.staging, filename))
+                jobIDs.append(jobID)
+        return jobIDs
+
+    def update(self, jobID, status, progress, error=None):
+        """Set the status of a job, finished jobs are also written to disk."""
+        with self.lock:
+            self.jobs[jobID].update(status=status, progress=progress, error=error)
+            kind = self.jobs[jobID]["kind"]
+        if status in ("done", "failed"):
+            path = os.path.join(self.jobsDirectory, jobID + ".json")
+            with open(path + ".tmp", "w") as f:
+                json.dump({"kind": kind, "status": status, "progress": progress, "error": error}, f)
+            os.replace(path + ".tmp", path)
+
+    def process(self, jobID, staged):
+        """Resize and save a staged image, runs on a worker thread."""
+        job = self.jobs[jobID]
+        destination = self.getPath(job["kind"], job["name"])
+        temporary = destination + "." + jobID + ".tmp"
+        try:
+            self.update(jobID, "processing", 10)
+            with Image.open(staged) as image:
+                image.load()
+                self.update(jobID, "processing", 20)
+                size = self.kinds[job["kind"]][1]
+                if size is not None:
+                    image = image.resize(size, Image.LANCZOS)
+                self.update(jobID, "processing", 30)
+                self.makeDerivatives(job["kind"], job["name"], image,
+                    lambda done: self.update(jobID, "processing", 30 + int(done * 60)))
+                image.save(temporary, "PNG")
+            os.replace(temporary, destination)
+            self.update(jobID, "done", 100)
+        except Exception as e:
+            self.update(jobID, "failed", 100, str(e))
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        finally:
+            os.remove(staged)
+
+    def getJob(self, jobID):
+        """Get the status of a job, or None if there is no job with that ID.
+        Jobs run by other processes are found from the files they leave,
+        they are queued while staged and finished once written to disk."""
+        with self.lock:
+            job = self.jobs.get(jobID)
+            if job is not None:
+                return {key: job[key] for key in ("kind", "status", "progress", "error")}
+        if not re.match(r"^[0-9a-f]+$", jobID):
+            return None
+        try:
+            with open(os.path.join(self.jobsDirectory, jobID + ".json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        for filename in os.listdir(self.staging):
+            parts = filename.split(".")
+            if len(parts) == 3 and parts[2] == jobID:
+                return {"kind": parts[0], "status": "queued", "progress": 0, "error": None}
+        return None
+
+    def wait(self, jobID, timeout=None):
+        """Wait for a job to finish and return its status."""
+        with self.lock:
+            future = self.jobs.get(jobID, {}).get("future")
+        if future is not None:
+            concurrent.futures.wait([future], timeout)
+        return self.getJob(jobID)
+
+    def close(self):
+        """Finish the queued jobs and stop the workers."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
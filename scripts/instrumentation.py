@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+import collections
+import contextlib
+import contextvars
+import flask
+import functools
+import os
+import re
+import sys
+import threading
+import time
+
+class timedCursor:
+    """Wraps a sqlite3 cursor so the time spent running queries
+    and fetching their rows is added to the db phase."""
+
+    def __init__(self, cursor, instruments):
+        self.cursor = cursor
+        self.instruments = instruments
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def time(self, method, queries, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.instruments.addPhase("db", time.perf_counter() - start, queries)
+
+    def execute(self, *args):
+        self.time(self.cursor.execute, 1, *args)
+        return self
+
+    def executemany(self, *args):
+        self.time(self.cursor.executemany, 1, *args)
+        return self
+
+    def executescript(self, *args):
+        self.time(self.cursor.executescript, 1, *args)
+        return self
+
+    def fetchone(self):
+        return self.time(self.cursor.fetchone, 0)
+
+    def fetchmany(self, *args):
+        return self.time(self.cursor.fetchmany, 0, *args)
+
+    def fetchall(self):
+        return self.time(self.cursor.fetchall, 0)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+class instrumentedResponse:
+    """Wraps a WSGI response so the request is finished when it has been sent,
+    streamed responses are still being made until then."""
+
+    def __init__(self, instruments, record, iterable):
+        self.instruments = instruments
+        self.record = record
+        self.iterable = iterable
+        self.chunks = None
+        self.finished = False
+
+    def __iter__(self):
+        self.chunks = iter(self.iterable)
+        return self
+
+    def __next__(self):
+        # Under ASGI each chunk can be made on a different thread
+        self.instruments.current.set(self.record)
+        self.record["thread"] = threading.get_ident()
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self.finish()
+            raise
+        finally:
+            self.record["thread"] = None
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.instruments.finishRequest(self.record)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, "close"):
+                self.iterable.close()
+        finally:
+            self.finish()
+
+class instrumentation:
+    """Times every request, and breaks the time down into the phases
+    it was spent in: SQLite queries, password hashing, image processing
+    and rendering templates.
+
+    Phases are timed by wrapping the methods that do the work, so the time
+    is added to the request running on the current thread (or context under
+    ASGI), and to the totals for the phase. Work done on background threads,
+    like processing uploaded images, only counts towards the totals."""
+
+    phases = ("db", "hash", "image", "render")
+    # Upper bounds in seconds of the request duration histogram buckets
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, profiler=None):
+        """Set up the instrumentation, nothing is timed until
+        an app is instrumented with instrumentApp.
+
+        Keyword arguments:
+        profiler -- a samplingProfiler to sample slow requests with, or None"""
+        self.profiler = profiler
+        self.current = contextvars.ContextVar("instrumentationRequest", default=None)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.phaseTotals = {phase: {"seconds": 0.0, "calls": 0} for phase in self.phases}
+
+    def addPhase(self, phase, seconds, calls=1):
+        """Add time spent in a phase to the current request and the totals."""
+        record = self.current.get()
+        if record is not None:
+            record[phase] += seconds
+            record[phase + "Calls"] += calls
+        with self.lock:
+            self.phaseTotals[phase]["seconds"] += seconds
+            self.phaseTotals[phase]["calls"] += calls
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Time the code in a with block as a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addPhase(phase, time.perf_counter() - start)
+
+    def wrap(self, target, name, phase):
+        """Replace a method of an object with one that times each call as a phase.
+
+        Keyword arguments:
+        target -- the object with the method, e.g. the password hasher
+        name   -- the name of the method
+        phase  -- the phase to add the time to"""
+        method = getattr(target, name)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            with self.phase(phase):
+                return method(*args, **kwargs)
+        setattr(target, name, timed)
+
+    def instrumentDatabase(self, db):
+        """Time every query the database runs and count them per request.
+        Waiting for a pooled connection counts as db time, but not as a query."""
+        connect = db.connect
+
+        @functools.wraps(connect)
+        def timedConnect():
+            start = time.perf_counter()
+            con, cur = connect()
+            self.addPhase("db", time.perf_counter() - start, 0)
+            return con, timedCursor(cur, self)
+        db.connect = timedConnect
+
+    def instrumentApp(self, app):
+        """Time every request to a Flask app and the templates it renders."""
+        app.wsgi_app = self.middleware(app.wsgi_app)
+        app.before_request(self.beforeRequest)
+        flask.before_render_template.connect(self.beforeRender, app, weak=False)
+        flask.template_rendered.connect(self.afterRender, app, weak=False)
+
+    def middleware(self, wsgiApp):
+        """Wrap a WSGI app so each request is timed until its response is sent."""
+        @functools.wraps(wsgiApp)
+        def app(environ, startResponse):
+            record = self.startRequest(environ)
+
+            def start(status, headers, exc_info=None):
+                record["status"] = status.split(" ", 1)[0]
+                return startResponse(status, headers, exc_info)
+            try:
+                iterable = wsgiApp(environ, start)
+            except BaseException:
+                self.finishRequest(record)
+                raise
+            finally:
+                record["thread"] = None
+            # Files sent by the server's file wrapper are only fast if they aren't wrapped again,
+            # so those requests are finished before the file is sent
+            fileWrapper = environ.get("wsgi.file_wrapper")
+            if isinstance(fileWrapper, type) and isinstance(iterable, fileWrapper):
+                self.finishRequest(record)
+                return iterable
+            return instrumentedResponse(self, record, iterable)
+        return app
+
+    def startRequest(self, environ):
+        """Start timing a request on this thread."""
+        record = {phase: 0.0 for phase in self.phases}
+        record.update({phase + "Calls": 0 for phase in self.phases})
+        record.update(start=time.perf_counter(), method=environ.get("REQUEST_METHOD", "GET"),
+            endpoint=None, status="500", thread=threading.get_ident(), renders=[])
+        self.current.set(record)
+        if self.profiler is not None:
+            self.profiler.add(record)
+        return record
+
+    def beforeRequest(self):
+        """Record which route is handling the request."""
+        record = self.current.get()
+        if record is not None:
+            record["endpoint"] = flask.request.endpoint
+
+    def beforeRender(self, sender, template, context, **extra):
+        record = self.current.get()
+        if record is not None:
+            record["renders"].append((time.perf_counter(), record["db"]))
+
+    def afterRender(self, sender, template, context, **extra):
+        """Add the time a template took to render to the render phase.
+        Streamed templates read from the database as they render,
+        so db time during the render is taken out."""
+        record = self.current.get()
+        if record is None or not record["renders"]:
+            return
+        start, db = record["renders"].pop()
+        self.addPhase("render", max(time.perf_counter() - start - (record["db"] - db), 0.0))
+
+    def finishRequest(self, record):
+        """Add a finished request to the stats for its route and status."""
+        seconds = time.perf_counter() - record["start"]
+        endpoint = record["endpoint"] or "unknown"
+        self.current.set(None)
+        with self.lock:
+            stats = self.requests.setdefault(endpoint, {}).setdefault(record["status"], {
+                "count": 0, "seconds": 0.0, "maxSeconds": 0.0,
+                "buckets": {str(bucket): 0 for bucket in self.buckets},
+                "phases": {phase: {"seconds": 0.0, "calls": 0} for phase in self.phases}})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["maxSeconds"] = max(stats["maxSeconds"], seconds)
+            for bucket in self.buckets:
+                if seconds <= bucket:
+                    stats["buckets"][str(bucket)] += 1
+            for phase in self.phases:
+                stats["phases"][phase]["seconds"] += record[phase]
+                stats["phases"][phase]["calls"] += record[phase + "Calls"]
+        if self.profiler is not None:
+            self.profiler.finish(record, endpoint, seconds)
+
+    def getStats(self):
+        """Get the request stats by route and status, and the totals for each phase."""
+        with self.lock:
+            return {
+                "requests": {endpoint: {status: {
+                    **stats, "buckets": dict(stats["buckets"]),
+                    "phases": {phase: dict(values) for phase, values in stats["phases"].items()}}
+                    for status, stats in statuses.items()} for endpoint, statuses in self.requests.items()},
+                "phases": {phase: dict(values) for phase, values in self.phaseTotals.items()}
+            }
+
+class samplingProfiler:
+    """Samples the stack of each thread handling a request every few
+    milliseconds. When a request takes longer than the threshold its
+    samples are written to a file in the collapsed stack format, one
+    "outer;inner;innermost count" line per stack, which flamegraph.pl,
+    speedscope and inferno can draw as a flame graph."""
+
+    def __init__(self, directory, threshold=0.5, interval=0.005):
+        """Set up the profiler, call start to start sampling.
+
+        Keyword arguments:
+        directory -- the folder to write the stacks of slow requests to
+        threshold -- requests that take at least this many seconds are written
+        interval  -- seconds between samples"""
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.written = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, record):
+        """Start sampling a request."""
+        record["samples"] = collections.Counter()
+        with self.lock:
+            self.active[id(record)] = record
+
+    def finish(self, record, endpoint, seconds):
+        """Stop sampling a request, writing its stacks if it was slow."""
+        with self.lock:
+            self.active.pop(id(record), None)
+        if seconds < self.threshold or not record["samples"]:
+            return
+        name = re.sub(r"[^\w.-]", "_", endpoint)
+        path = os.path.join(self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}.{name}.{int(seconds * 1000)}ms.{os.getpid()}.{id(record):x}.folded")
+        with open(path, "w") as f:
+            for stack, count in record["samples"].most_common():
+                f.write(f"{stack} {count}\n")
+        with self.lock:
+            self.written += 1
+
+    def collapse(self, frame):
+        """Turn a stack into a semicolon separated list of functions, outermost first."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":"))
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def sample(self):
+        """Take one sample of every thread handling a request."""
+        frames = sys._current_frames()
+        with self.lock:
+            for record in self.active.values():
+                frame = frames.get(record["thread"])
+                if frame is not None:
+                    record["samples"][self.collapse(frame)] += 1
+
+    def start(self):
+        """Start sampling on a background thread."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.loop, name="samplingProfiler", daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        """Stop sampling."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def getStats(self):
+        with self.lock:
+            return {"active": len(self.active), "written": self.written}
+
+def metricName(*parts):
+    """Make a Prometheus metric name from camelCase parts."""
+    name = "_".join(re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", part) for part in parts).lower()
+    return re.sub(r"[^a-z0-9_]", "_", name)
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+def formatPrometheus(metrics, prefix="teammung", labelNames={"compression": "route"}):
+    """Format metrics, like those from server.getMetrics or readMetrics,
+    in the Prometheus text exposition format.
+
+    The requests and phases from instrumentation are written as a histogram
+    and counters. Every other section is written as gauges named after it and
+    its keys, sections of dictionaries use the key as a label, named by labelNames."""
+    samples = collections.OrderedDict()
+
+    def add(name, kind, labels, value, suffix=""):
+        samples.setdefault(name, (kind, []))[1].append((suffix, labels, value))
+
+    for endpoint, statuses in metrics.get("requests", {}).items():
+        for status, stats in statuses.items():
+            labels = {"endpoint": endpoint, "status": status}
+            name = f"{prefix}_request_duration_seconds"
+            for bucket, count in sorted(stats["buckets"].items(), key=lambda item: float(item[0])):
+                add(name, "histogram", {**labels, "le": bucket}, count, "_bucket")
+            add(name, "histogram", {**labels, "le": "+Inf"}, stats["count"], "_bucket")
+            add(name, "histogram", labels, stats["seconds"], "_sum")
+            add(name, "histogram", labels, stats["count"], "_count")
+            add(f"{prefix}_request_max_seconds", "gauge", labels, stats["maxSeconds"])
+            for phase, values in stats["phases"].items():
+                add(f"{prefix}_request_phase_seconds_total", "counter", {**labels, "phase": phase}, values["seconds"])
+                add(f"{prefix}_request_phase_calls_total", "counter", {**labels, "phase": phase}, values["calls"])
+    for phase, values in metrics.get("phases", {}).items():
+        add(f"{prefix}_phase_seconds_total", "counter", {"phase": phase}, values["seconds"])
+        add(f"{prefix}_phase_calls_total", "counter", {"phase": phase}, values["calls"])
+
+    isNumber = lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+    for section, values in metrics.items():
+        if section in ("requests", "phases"):
+            continue
+        if isNumber(values):
+            add(metricName(prefix, section), "gauge", {}, values)
+        elif isinstance(values, dict):
+            for key, value in values.items():
+                if isNumber(value):
+                    add(metricName(prefix, section, key), "gauge", {}, value)
+                elif isinstance(value, dict):
+                    for stat, number in value.items():
+                        if isNumber(number):
+                            add(metricName(prefix, section, stat), "gauge", {labelNames.get(section, "name"): key}, number)
+
+    lines = []
+    for name, (kind, values) in samples.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{suffix}{formatLabels(labels)} {value}" for suffix, labels, value in values)
+    return "\n".join(lines) + "\n"
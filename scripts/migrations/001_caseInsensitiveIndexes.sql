@@ -0,0 +1,14 @@
+-- Indexes for the case-insensitive lookups.
+-- The expressions must match the WHERE clauses exactly for SQLite to use them.
+
+CREATE INDEX IF NOT EXISTS usersUsernameLower ON users (LOWER(username));
+
+CREATE INDEX IF NOT EXISTS usersEmailLower ON users (LOWER(email));
+
+CREATE INDEX IF NOT EXISTS gamesGameNameLower ON games (LOWER(gameName));
+
+CREATE INDEX IF NOT EXISTS gameGenresGenreLower ON gameGenres (LOWER(genre));
+
+CREATE INDEX IF NOT EXISTS gamePublishersPublisherNameLower ON gamePublishers (LOWER(publisherName));
+
+CREATE INDEX IF NOT EXISTS userRolesRole ON userRoles (role);
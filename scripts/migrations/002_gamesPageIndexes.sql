@@ -0,0 +1,5 @@
+-- Indexes for keyset pagination of the games list.
+-- Every index ends with the rowid (gameID), so each one covers
+-- the (sort key, gameID) pairs the page cursors are made from.
+
+CREATE INDEX IF NOT EXISTS gamesReleaseDate ON games (releaseDate);
@@ -0,0 +1,88 @@
+-- Full text search over games, kept in sync with triggers.
+-- The rowid of each row is the gameID, genres and publishers
+-- are stored as space separated names so they can be matched too.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS gameSearch USING fts5(
+    gameName,
+    gameDescription,
+    genres,
+    publishers,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '1 2 3'
+);
+
+-- Names count the most, then genres and publishers, then the description
+INSERT INTO gameSearch (gameSearch, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0, 3.0)');
+
+INSERT INTO gameSearch (rowid, gameName, gameDescription, genres, publishers)
+    SELECT
+        games.gameID,
+        games.gameName,
+        games.gameDescription,
+        (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+            INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = games.gameID),
+        (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+            INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = games.gameID)
+    FROM games;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGameInsert AFTER INSERT ON games BEGIN
+    INSERT INTO gameSearch (rowid, gameName, gameDescription, genres, publishers)
+        VALUES (new.gameID, new.gameName, new.gameDescription, '', '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGameUpdate AFTER UPDATE OF gameName, gameDescription ON games BEGIN
+    UPDATE gameSearch SET gameName = new.gameName, gameDescription = new.gameDescription
+        WHERE rowid = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGameDelete AFTER DELETE ON games BEGIN
+    DELETE FROM gameSearch WHERE rowid = old.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGenreLinkInsert AFTER INSERT ON gameGenresLink BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = new.gameID)
+        WHERE rowid = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGenreLinkDelete AFTER DELETE ON gameGenresLink BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = old.gameID)
+        WHERE rowid = old.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGenreChange AFTER UPDATE OF genre ON gameGenres BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = gameSearch.rowid)
+        WHERE rowid IN (SELECT gameID FROM gameGenresLink WHERE genreID = new.genreID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchGenreDelete AFTER DELETE ON gameGenres BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = gameSearch.rowid)
+        WHERE rowid IN (SELECT gameID FROM gameGenresLink WHERE genreID = old.genreID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchPublisherLinkInsert AFTER INSERT ON gamePublishersLink BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = new.gameID)
+        WHERE rowid = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchPublisherLinkDelete AFTER DELETE ON gamePublishersLink BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = old.gameID)
+        WHERE rowid = old.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchPublisherChange AFTER UPDATE OF publisherName ON gamePublishers BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = gameSearch.rowid)
+        WHERE rowid IN (SELECT gameID FROM gamePublishersLink WHERE publisherID = new.publisherID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameSearchPublisherDelete AFTER DELETE ON gamePublishers BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = gameSearch.rowid)
+        WHERE rowid IN (SELECT gameID FROM gamePublishersLink WHERE publisherID = old.publisherID);
+END;
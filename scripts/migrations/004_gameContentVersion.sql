@@ -0,0 +1,45 @@
+-- A version number for each game that goes up whenever anything shown
+-- on its page changes, so rendered pages can be cached by (gameID, contentVersion).
+
+ALTER TABLE games ADD COLUMN contentVersion INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionGameUpdate
+AFTER UPDATE OF gameName, gameDescription, releaseDate, approved ON games BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionGenreLinkInsert AFTER INSERT ON gameGenresLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionGenreLinkDelete AFTER DELETE ON gameGenresLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = old.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionGenreChange AFTER UPDATE OF genre ON gameGenres BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1
+        WHERE gameID IN (SELECT gameID FROM gameGenresLink WHERE genreID = new.genreID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionGenreDelete AFTER DELETE ON gameGenres BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1
+        WHERE gameID IN (SELECT gameID FROM gameGenresLink WHERE genreID = old.genreID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionPublisherLinkInsert AFTER INSERT ON gamePublishersLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionPublisherLinkDelete AFTER DELETE ON gamePublishersLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = old.gameID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionPublisherChange AFTER UPDATE OF publisherName ON gamePublishers BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1
+        WHERE gameID IN (SELECT gameID FROM gamePublishersLink WHERE publisherID = new.publisherID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS gameVersionPublisherDelete AFTER DELETE ON gamePublishers BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1
+        WHERE gameID IN (SELECT gameID FROM gamePublishersLink WHERE publisherID = old.publisherID);
+END;
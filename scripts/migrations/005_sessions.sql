@@ -0,0 +1,11 @@
+-- Logged in sessions, shared by every server process.
+-- Expired sessions are deleted in the background using the expires index.
+
+CREATE TABLE IF NOT EXISTS sessions (
+    sessionID       VARCHAR(22) NOT NULL,
+    data            TEXT NOT NULL,
+    expires         REAL NOT NULL,
+    PRIMARY KEY (sessionID)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS sessionsExpires ON sessions (expires);
@@ -0,0 +1,27 @@
+-- How many rows of each catalogue import have been committed,
+-- updated in the same transaction as the rows so an import can resume exactly.
+
+CREATE TABLE IF NOT EXISTS imports (
+    importID        VARCHAR(64) NOT NULL,
+    rowsDone        INTEGER NOT NULL,
+    PRIMARY KEY (importID)
+) WITHOUT ROWID;
+
+-- The search and content version triggers look up links by game and by genre or publisher,
+-- without these every linked game inserted scans the whole link table
+CREATE INDEX IF NOT EXISTS gameGenresLinkGame ON gameGenresLink (gameID);
+CREATE INDEX IF NOT EXISTS gameGenresLinkGenre ON gameGenresLink (genreID);
+CREATE INDEX IF NOT EXISTS gamePublishersLinkGame ON gamePublishersLink (gameID);
+CREATE INDEX IF NOT EXISTS gamePublishersLinkPublisher ON gamePublishersLink (publisherID);
+
+-- New games get their genres and publishers in the search index straight away,
+-- so bulk imports can insert the links first and add each game to the index once
+DROP TRIGGER IF EXISTS gameSearchGameInsert;
+CREATE TRIGGER gameSearchGameInsert AFTER INSERT ON games BEGIN
+    INSERT INTO gameSearch (rowid, gameName, gameDescription, genres, publishers)
+        VALUES (new.gameID, new.gameName, new.gameDescription,
+            (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+                INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = new.gameID),
+            (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+                INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = new.gameID));
+END;
@@ -0,0 +1,125 @@
+-- The link tables had no primary key, so they took duplicate rows, and nothing
+-- removed their rows when a game, genre, publisher or list was deleted.
+-- They are rebuilt keyed on both IDs, without a rowid so each lookup is one
+-- b-tree search, with an index the other way round for the reverse lookups.
+-- Duplicate rows are dropped, as are rows whose game, genre, publisher or list is gone.
+-- Foreign keys are enforced on every connection, so deletes now cascade to the links.
+
+-- The rows are kept in temporary tables while the tables are recreated under the same name,
+-- renaming a new table into place fails as the genre and publisher triggers use the old one
+CREATE TEMP TABLE gameGenresLinkRows AS
+    SELECT DISTINCT gameID, genreID FROM gameGenresLink
+    WHERE gameID IN (SELECT gameID FROM games) AND genreID IN (SELECT genreID FROM gameGenres);
+
+DROP TABLE gameGenresLink;
+
+CREATE TABLE gameGenresLink (
+    gameID          INTEGER NOT NULL,
+    genreID         INTEGER NOT NULL,
+    PRIMARY KEY (gameID, genreID),
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE,
+    FOREIGN KEY (genreID) REFERENCES gameGenres(genreID) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+INSERT INTO gameGenresLink (gameID, genreID) SELECT gameID, genreID FROM gameGenresLinkRows;
+DROP TABLE gameGenresLinkRows;
+CREATE INDEX gameGenresLinkGenre ON gameGenresLink (genreID, gameID);
+
+CREATE TEMP TABLE gamePublishersLinkRows AS
+    SELECT DISTINCT gameID, publisherID FROM gamePublishersLink
+    WHERE gameID IN (SELECT gameID FROM games) AND publisherID IN (SELECT publisherID FROM gamePublishers);
+
+DROP TABLE gamePublishersLink;
+
+CREATE TABLE gamePublishersLink (
+    gameID          INTEGER NOT NULL,
+    publisherID     INTEGER NOT NULL,
+    PRIMARY KEY (gameID, publisherID),
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE,
+    FOREIGN KEY (publisherID) REFERENCES gamePublishers(publisherID) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+INSERT INTO gamePublishersLink (gameID, publisherID) SELECT gameID, publisherID FROM gamePublishersLinkRows;
+DROP TABLE gamePublishersLinkRows;
+CREATE INDEX gamePublishersLinkPublisher ON gamePublishersLink (publisherID, gameID);
+
+CREATE TEMP TABLE gameListLinkRows AS
+    SELECT DISTINCT listID, gameID FROM gameListLink
+    WHERE listID IN (SELECT listID FROM gameLists) AND gameID IN (SELECT gameID FROM games);
+
+DROP TABLE gameListLink;
+
+CREATE TABLE gameListLink (
+    listID          INTEGER NOT NULL,
+    gameID          INTEGER NOT NULL,
+    PRIMARY KEY (listID, gameID),
+    FOREIGN KEY (listID) REFERENCES gameLists(listID) ON DELETE CASCADE,
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+INSERT INTO gameListLink (listID, gameID) SELECT listID, gameID FROM gameListLinkRows;
+DROP TABLE gameListLinkRows;
+CREATE INDEX gameListLinkGame ON gameListLink (gameID, listID);
+
+-- Images go with their game too, so deleting a game with images doesn't break the foreign key
+CREATE TEMP TABLE gameImagesRows AS
+    SELECT imageID, gameID, imageHash, imageType FROM gameImages
+    WHERE gameID IN (SELECT gameID FROM games);
+
+DROP TABLE gameImages;
+
+CREATE TABLE gameImages (
+    imageID         INTEGER NOT NULL,
+    gameID          INTEGER NOT NULL,
+    imageHash       VARCHAR(32) NOT NULL,
+    imageType       VARCHAR(4) NOT NULL,
+    PRIMARY KEY (imageID AUTOINCREMENT),
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE
+);
+
+INSERT INTO gameImages (imageID, gameID, imageHash, imageType)
+    SELECT imageID, gameID, imageHash, imageType FROM gameImagesRows;
+DROP TABLE gameImagesRows;
+CREATE INDEX gameImagesGame ON gameImages (gameID);
+
+-- Dropping the tables dropped their triggers, these are the same as before
+
+CREATE TRIGGER gameSearchGenreLinkInsert AFTER INSERT ON gameGenresLink BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = new.gameID)
+        WHERE rowid = new.gameID;
+END;
+
+CREATE TRIGGER gameSearchGenreLinkDelete AFTER DELETE ON gameGenresLink BEGIN
+    UPDATE gameSearch SET genres = (SELECT IFNULL(GROUP_CONCAT(g.genre, ' '), '') FROM gameGenresLink gl
+        INNER JOIN gameGenres g ON gl.genreID = g.genreID WHERE gl.gameID = old.gameID)
+        WHERE rowid = old.gameID;
+END;
+
+CREATE TRIGGER gameSearchPublisherLinkInsert AFTER INSERT ON gamePublishersLink BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = new.gameID)
+        WHERE rowid = new.gameID;
+END;
+
+CREATE TRIGGER gameSearchPublisherLinkDelete AFTER DELETE ON gamePublishersLink BEGIN
+    UPDATE gameSearch SET publishers = (SELECT IFNULL(GROUP_CONCAT(p.publisherName, ' '), '') FROM gamePublishersLink pl
+        INNER JOIN gamePublishers p ON pl.publisherID = p.publisherID WHERE pl.gameID = old.gameID)
+        WHERE rowid = old.gameID;
+END;
+
+CREATE TRIGGER gameVersionGenreLinkInsert AFTER INSERT ON gameGenresLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER gameVersionGenreLinkDelete AFTER DELETE ON gameGenresLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = old.gameID;
+END;
+
+CREATE TRIGGER gameVersionPublisherLinkInsert AFTER INSERT ON gamePublishersLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER gameVersionPublisherLinkDelete AFTER DELETE ON gamePublishersLink BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = old.gameID;
+END;
@@ -0,0 +1,104 @@
+-- Reviews get one row per user and game, indexes to page through them by game
+-- and by user newest first, and are deleted with their game or user.
+-- Each game's review count, rating total and how many reviews gave each number of stars
+-- are kept in gameRatings by triggers, so showing a game's rating reads one row
+-- and the top rated games are read from an index instead of averaging every review.
+
+CREATE TEMP TABLE gameReviewsRows AS
+    SELECT reviewID, userID, gameID, datePosted, rating, reviewText FROM gameReviews
+    WHERE reviewID IN (SELECT MAX(reviewID) FROM gameReviews GROUP BY userID, gameID)
+        AND userID IN (SELECT userID FROM users) AND gameID IN (SELECT gameID FROM games)
+        AND rating BETWEEN 1 AND 5;
+
+DROP TABLE gameReviews;
+
+CREATE TABLE gameReviews (
+    reviewID        INTEGER NOT NULL,
+    userID          INTEGER NOT NULL,
+    gameID          INTEGER NOT NULL,
+    datePosted      DATE NOT NULL,
+    rating          INTEGER(1) NOT NULL CHECK (rating BETWEEN 1 AND 5),
+    reviewText      VARCHAR(1024) NOT NULL,
+    PRIMARY KEY (reviewID AUTOINCREMENT),
+    UNIQUE (userID, gameID),
+    FOREIGN KEY (userID) REFERENCES users(userID) ON DELETE CASCADE,
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE
+);
+
+INSERT INTO gameReviews (reviewID, userID, gameID, datePosted, rating, reviewText)
+    SELECT reviewID, userID, gameID, datePosted, rating, reviewText FROM gameReviewsRows;
+DROP TABLE gameReviewsRows;
+
+-- The reviewID is the rowid, so these are in newest first order for each game and user
+CREATE INDEX gameReviewsGame ON gameReviews (gameID);
+CREATE INDEX gameReviewsUser ON gameReviews (userID);
+
+CREATE TABLE gameRatings (
+    gameID          INTEGER NOT NULL,
+    reviews         INTEGER NOT NULL,
+    ratingSum       INTEGER NOT NULL,
+    stars1          INTEGER NOT NULL,
+    stars2          INTEGER NOT NULL,
+    stars3          INTEGER NOT NULL,
+    stars4          INTEGER NOT NULL,
+    stars5          INTEGER NOT NULL,
+    averageRating   REAL,
+    PRIMARY KEY (gameID),
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX gameRatingsTop ON gameRatings (averageRating DESC, reviews DESC);
+
+INSERT INTO gameRatings (gameID, reviews, ratingSum, stars1, stars2, stars3, stars4, stars5, averageRating)
+    SELECT gameID, COUNT(*), SUM(rating), SUM(rating = 1), SUM(rating = 2), SUM(rating = 3),
+        SUM(rating = 4), SUM(rating = 5), AVG(rating)
+    FROM gameReviews GROUP BY gameID;
+
+-- A game's reviews are on its page, so they change its content version too
+
+CREATE TRIGGER gameRatingsReviewInsert AFTER INSERT ON gameReviews BEGIN
+    INSERT INTO gameRatings (gameID, reviews, ratingSum, stars1, stars2, stars3, stars4, stars5, averageRating)
+        VALUES (new.gameID, 1, new.rating, new.rating = 1, new.rating = 2, new.rating = 3,
+            new.rating = 4, new.rating = 5, new.rating)
+        ON CONFLICT (gameID) DO UPDATE SET
+            reviews = reviews + 1,
+            ratingSum = ratingSum + excluded.ratingSum,
+            stars1 = stars1 + excluded.stars1,
+            stars2 = stars2 + excluded.stars2,
+            stars3 = stars3 + excluded.stars3,
+            stars4 = stars4 + excluded.stars4,
+            stars5 = stars5 + excluded.stars5,
+            averageRating = CAST(ratingSum + excluded.ratingSum AS REAL) / (reviews + 1);
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER gameRatingsReviewUpdate AFTER UPDATE OF rating ON gameReviews WHEN old.rating != new.rating BEGIN
+    UPDATE gameRatings SET
+        ratingSum = ratingSum - old.rating + new.rating,
+        stars1 = stars1 - (old.rating = 1) + (new.rating = 1),
+        stars2 = stars2 - (old.rating = 2) + (new.rating = 2),
+        stars3 = stars3 - (old.rating = 3) + (new.rating = 3),
+        stars4 = stars4 - (old.rating = 4) + (new.rating = 4),
+        stars5 = stars5 - (old.rating = 5) + (new.rating = 5),
+        averageRating = CAST(ratingSum - old.rating + new.rating AS REAL) / reviews
+        WHERE gameID = new.gameID;
+END;
+
+CREATE TRIGGER gameRatingsReviewDelete AFTER DELETE ON gameReviews BEGIN
+    UPDATE gameRatings SET
+        reviews = reviews - 1,
+        ratingSum = ratingSum - old.rating,
+        stars1 = stars1 - (old.rating = 1),
+        stars2 = stars2 - (old.rating = 2),
+        stars3 = stars3 - (old.rating = 3),
+        stars4 = stars4 - (old.rating = 4),
+        stars5 = stars5 - (old.rating = 5),
+        averageRating = CAST(ratingSum - old.rating AS REAL) / NULLIF(reviews - 1, 0)
+        WHERE gameID = old.gameID;
+    DELETE FROM gameRatings WHERE gameID = old.gameID AND reviews = 0;
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = old.gameID;
+END;
+
+CREATE TRIGGER gameVersionReviewUpdate AFTER UPDATE OF datePosted, rating, reviewText ON gameReviews BEGIN
+    UPDATE games SET contentVersion = contentVersion + 1 WHERE gameID = new.gameID;
+END;
@@ -0,0 +1,38 @@
+-- Games in a list are kept in the order the user chose by a position with gaps
+-- between neighbours, so moving a game only changes its own row until a gap runs out.
+-- Each list's game count is kept by triggers, so showing a user's lists
+-- doesn't count every game in them.
+
+ALTER TABLE gameLists ADD COLUMN gameCount INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX gameListsUser ON gameLists (userID);
+
+CREATE TEMP TABLE gameListLinkRows AS
+    SELECT listID, gameID, 1024 * ROW_NUMBER() OVER (PARTITION BY listID ORDER BY gameID) AS position
+    FROM gameListLink;
+
+DROP TABLE gameListLink;
+
+CREATE TABLE gameListLink (
+    listID          INTEGER NOT NULL,
+    gameID          INTEGER NOT NULL,
+    position        INTEGER NOT NULL,
+    PRIMARY KEY (listID, gameID),
+    FOREIGN KEY (listID) REFERENCES gameLists(listID) ON DELETE CASCADE,
+    FOREIGN KEY (gameID) REFERENCES games(gameID) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+INSERT INTO gameListLink (listID, gameID, position) SELECT listID, gameID, position FROM gameListLinkRows;
+DROP TABLE gameListLinkRows;
+CREATE INDEX gameListLinkGame ON gameListLink (gameID, listID);
+-- Also holds the gameID, so a page of a list is read in order straight from the index
+CREATE INDEX gameListLinkPosition ON gameListLink (listID, position);
+
+UPDATE gameLists SET gameCount = (SELECT COUNT(*) FROM gameListLink WHERE gameListLink.listID = gameLists.listID);
+
+CREATE TRIGGER gameListCountInsert AFTER INSERT ON gameListLink BEGIN
+    UPDATE gameLists SET gameCount = gameCount + 1 WHERE listID = new.listID;
+END;
+
+CREATE TRIGGER gameListCountDelete AFTER DELETE ON gameListLink BEGIN
+    UPDATE gameLists SET gameCount = gameCount - 1 WHERE listID = old.listID;
+END;
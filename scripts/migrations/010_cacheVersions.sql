@@ -0,0 +1,36 @@
+-- Version numbers for data every server process caches, kept in the database
+-- so a process sees changes made by any other process, not only its own.
+-- Each is bumped by triggers in the same transaction as the change,
+-- so a cache checks one row before deciding whether to reload.
+
+CREATE TABLE cacheVersions (
+    name            VARCHAR(32) NOT NULL,
+    version         INTEGER NOT NULL,
+    PRIMARY KEY (name)
+) WITHOUT ROWID;
+
+INSERT INTO cacheVersions (name, version) VALUES ('vocabulary', 0);
+
+CREATE TRIGGER vocabularyGenreInsert AFTER INSERT ON gameGenres BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
+
+CREATE TRIGGER vocabularyGenreUpdate AFTER UPDATE ON gameGenres BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
+
+CREATE TRIGGER vocabularyGenreDelete AFTER DELETE ON gameGenres BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
+
+CREATE TRIGGER vocabularyPublisherInsert AFTER INSERT ON gamePublishers BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
+
+CREATE TRIGGER vocabularyPublisherUpdate AFTER UPDATE ON gamePublishers BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
+
+CREATE TRIGGER vocabularyPublisherDelete AFTER DELETE ON gamePublishers BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'vocabulary';
+END;
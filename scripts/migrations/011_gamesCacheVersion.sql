@@ -0,0 +1,18 @@
+-- A version number for every game at once, which goes up whenever any game
+-- is added, changed or deleted. Anything shown on a game's page bumps its
+-- contentVersion, so this covers its genres, publishers and reviews too.
+-- Cached games only need checking against the database when it has changed.
+
+INSERT INTO cacheVersions (name, version) VALUES ('games', 0);
+
+CREATE TRIGGER gamesVersionInsert AFTER INSERT ON games BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'games';
+END;
+
+CREATE TRIGGER gamesVersionUpdate AFTER UPDATE ON games BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'games';
+END;
+
+CREATE TRIGGER gamesVersionDelete AFTER DELETE ON games BEGIN
+    UPDATE cacheVersions SET version = version + 1 WHERE name = 'games';
+END;
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import shutil
+import threading
+
+try:
+    from scripts.cache import lruCache
+except ModuleNotFoundError:
+    from cache import lruCache
+
+class pageCache:
+    """Caches rendered HTML for game pages.
+
+    Keys are tuples starting with the kind of HTML and the gameID, followed
+    by anything else the HTML depends on, like the game's content version.
+    Because a change to the game changes its key, a stale entry is never
+    used, invalidate just frees the space early.
+
+    Entries are kept in memory, and if a directory is given, kinds listed
+    in diskKinds are also written to disk so they survive restarts
+    and are shared between processes. Each game's pages are kept in their
+    own folder, and writing a page removes the game's older pages of the
+    same kind, so only one of each kind is kept on disk per game."""
+
+    diskKinds = ("fragment",)
+
+    def __init__(self, maxSize=1024, directory=None):
+        """Set up the page cache.
+
+        Keyword arguments:
+        maxSize   -- the maximum number of pages to keep in memory, 0 to disable
+        directory -- the folder to keep pages on disk in, None to only use memory"""
+        self.memory = lruCache(maxSize, None)
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.stats = {"diskHits": 0, "diskMisses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self):
+        return self.memory.enabled
+
+    def getGameDirectory(self, gameID):
+        """Get the folder a game's pages are stored in on disk."""
+        return os.path.join(self.directory, str(gameID))
+
+    def getPath(self, key):
+        """Get the path a page is stored at on disk, in its game's folder
+        and named so the game's other pages of the same kind can be found."""
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.getGameDirectory(key[1]), f"{key[0]}.{digest}.html")
+
+    def usesDisk(self, key):
+        return self.directory is not None and key[0] in self.diskKinds
+
+    def get(self, key):
+        """Get a cached page, or None if it isn't cached."""
+        html = self.memory.get(key)
+        if html is not None or not self.enabled or not self.usesDisk(key):
+            return html
+        try:
+            with open(self.getPath(key), encoding="utf-8") as f:
+                html = f.read()
+        except OSError:
+            with self.lock:
+                self.stats["diskMisses"] += 1
+            return None
+        with self.lock:
+            self.stats["diskHits"] += 1
+        self.memory.set(key, html)
+        return html
+
+    def set(self, key, html):
+        """Cache a page."""
+        if not self.enabled:
+            return
+        self.memory.set(key, html)
+        if self.usesDisk(key):
+            self.write(key, html)
+
+    def write(self, key, html):
+        """Write a page to disk, removing the game's older pages of the same kind,
+        as a new key for a game means what the old ones depended on has changed."""
+        path = self.getPath(key)
+        directory, filename = os.path.split(path)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(temporary, path)
+        except FileNotFoundError:
+            # The game was invalidated while writing, it is still cached in memory
+            return
+        for other in os.listdir(directory):
+            if other != filename and other.startswith(f"{key[0]}.") and other.endswith(".html"):
+                self.remove(os.path.join(directory, other))
+
+    def remove(self, path):
+        """Remove a file or folder from the disk cache if it is still there.
+        A page written to a folder while it is being removed can be left behind,
+        but as a page's key has everything it depends on it is never stale."""
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, gameID=None):
+        """Remove every cached page for a game, or every page if gameID is None."""
+        with self.lock:
+            self.stats["invalidations"] += 1
+        if gameID is None:
+            self.memory.clear()
+        else:
+            self.memory.deleteWhere(lambda key: key[1] == gameID)
+        if self.directory is None:
+            return
+        if gameID is None:
+            for filename in os.listdir(self.directory):
+                self.remove(os.path.join(self.directory, filename))
+        else:
+            self.remove(self.getGameDirectory(gameID))
+
+    def getStats(self):
+        """Get the memory and disk hit and miss counters."""
+        with self.lock:
+            return {**self.memory.getStats(), **self.stats}
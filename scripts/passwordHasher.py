@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import bcrypt
+import concurrent.futures
+import threading
+import time
+
+class hasherBusyError(Exception):
+    """Raised when every hashing worker is busy and the queue is full."""
+
+def hashPassword(password, rounds):
+    """Hash a password with BCrypt, returns the hash and how long it took.
+    Runs in a worker process."""
+    start = time.perf_counter()
+    passwordHash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+    return passwordHash, time.perf_counter() - start
+
+def checkPassword(password, passwordHash):
+    """Check a password against a BCrypt hash, returns the result and how long it took.
+    Runs in a worker process."""
+    start = time.perf_counter()
+    valid = bcrypt.checkpw(password.encode("utf-8"), passwordHash)
+    return valid, time.perf_counter() - start
+
+class passwordHasher:
+    """Hashes and checks passwords in a pool of worker processes,
+    so a burst of logins can't tie up every server thread.
+
+    At most workers + queueDepth calls can be waiting at once,
+    any more fail straight away with hasherBusyError."""
+
+    def __init__(self, rounds=12, workers=2, queueDepth=16):
+        """Set up the hasher, the worker processes are started when first needed.
+
+        Keyword arguments:
+        rounds     -- the BCrypt cost factor for new hashes
+        workers    -- the number of worker processes, 0 to hash on the calling thread
+        queueDepth -- how many calls can wait for a free worker"""
+        if not 4 <= rounds <= 31:
+            raise ValueError("BCrypt rounds must be between 4 and 31")
+        self.rounds = rounds
+        self.workers = workers
+        self.queueDepth = queueDepth
+        self.slots = threading.BoundedSemaphore(max(workers, 1) + queueDepth)
+        self.executor = None
+        self.lock = threading.Lock()
+        self.stats = {
+            "hashes": 0,
+            "checks": 0,
+            "rejected": 0,
+            "queueWaitSeconds": 0.0,
+            "maxQueueWaitSeconds": 0.0,
+            "hashSeconds": 0.0,
+            "maxHashSeconds": 0.0
+        }
+
+    def getExecutor(self):
+        """Get the worker pool, starting it if needed."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+            return self.executor
+
+    def run(self, function, *args):
+        """Run a hashing function on a worker and record how long it waited and ran."""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats["rejected"] += 1
+            raise hasherBusyError("Too many passwords are being checked, try again soon")
+        try:
+            start = time.perf_counter()
+            if self.workers == 0:
+                result, hashTime = function(*args)
+            else:
+                result, hashTime = self.getExecutor().submit(function, *args).result()
+            queueWait = max(time.perf_counter() - start - hashTime, 0.0)
+        finally:
+            self.slots.release()
+        with self.lock:
+            self.stats["hashes" if function is hashPassword else "checks"] += 1
+            self.stats["queueWaitSeconds"] += queueWait
+            self.stats["maxQueueWaitSeconds"] = max(self.stats["maxQueueWaitSeconds"], queueWait)
+            self.stats["hashSeconds"] += hashTime
+            self.stats["maxHashSeconds"] = max(self.stats["maxHashSeconds"], hashTime)
+        return result
+
+    def hash(self, password):
+        """Hash a password using the configured cost factor."""
+        return self.run(hashPassword, password, self.rounds)
+
+    def check(self, password, passwordHash):
+        """Check if a password matches a hash."""
+        if isinstance(passwordHash, str):
+            passwordHash = passwordHash.encode("utf-8")
+        return self.run(checkPassword, password, passwordHash)
+
+    def needsRehash(self, passwordHash):
+        """Check if a hash was made with a different cost factor than the configured one."""
+        if isinstance(passwordHash, bytes):
+            passwordHash = passwordHash.decode("utf-8")
+        try:
+            return int(passwordHash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def getStats(self):
+        """Get the hashing counters and timings."""
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        """Stop the worker processes."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
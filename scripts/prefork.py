@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+# Workers restarting or failing is logged here, to stderr unless logging is set up
+logger = logging.getLogger("prefork")
+
+class preforkServer:
+    """Runs a server in several forked worker processes that share
+    one listening socket, so CPU heavy requests can use every core.
+
+    Workers share nothing after the fork, each opens its own database
+    connections. A worker that dies is started again, and on SIGHUP every
+    worker is replaced one at a time, the new worker starting before the
+    old one is asked to finish its requests and exit.
+    SIGTERM and SIGINT stop every worker and then the server."""
+
+    # Workers that die sooner than this after starting are restarted after a delay
+    minimumUptime = 1
+    # How long workers get to finish their requests before being killed
+    stopTimeout = 10
+
+    def __init__(self, host, port, workers, serve, beforeFork=None, afterFork=None, onExit=None):
+        """Set up the server, nothing is started until run is called.
+
+        Keyword arguments:
+        host       -- the host to listen on
+        port       -- the port to listen on
+        workers    -- the number of worker processes
+        serve      -- called in each worker with the listening socket,
+                      it should serve requests until KeyboardInterrupt
+        beforeFork -- called in the main process before the first worker starts
+        afterFork  -- called in each worker before serve
+        onExit     -- called in each worker after serve returns"""
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.serve = serve
+        self.beforeFork = beforeFork
+        self.afterFork = afterFork
+        self.onExit = onExit
+        self.socket = None
+        self.pids = {}
+        self.retiring = set()
+        self.reloading = False
+        self.stopping = False
+
+    def run(self):
+        """Start the workers and keep them running until told to stop."""
+        self.socket = socket.create_server((self.host, int(self.port)), backlog=2048)
+        if self.beforeFork is not None:
+            self.beforeFork()
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "reloading", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "stopping", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "stopping", True))
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while not self.stopping:
+                if self.reloading:
+                    self.reloading = False
+                    self.reload()
+                self.reap()
+                time.sleep(0.1)
+        finally:
+            self.stop()
+            self.socket.close()
+
+    def spawn(self):
+        """Fork a new worker."""
+        pid = os.fork()
+        if pid == 0:
+            self.runWorker()
+        self.pids[pid] = time.monotonic()
+        return pid
+
+    def runWorker(self):
+        """Serve requests in a worker process, never returns."""
+        status = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            if self.afterFork is not None:
+                self.afterFork()
+            try:
+                self.serve(self.socket)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if self.onExit is not None:
+                    self.onExit()
+        except BaseException as e:
+            logger.error(f"Worker {os.getpid()} failed: {e!r}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def reap(self):
+        """Collect exited workers, restarting any that weren't meant to stop."""
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.pids.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif started is not None and not self.stopping:
+                logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+                if time.monotonic() - started < self.minimumUptime:
+                    time.sleep(self.minimumUptime)
+                self.spawn()
+
+    def reload(self):
+        """Replace every worker with a new one."""
+        for pid in [pid for pid in self.pids if pid not in self.retiring]:
+            self.spawn()
+            self.retiring.add(pid)
+            self.signal(pid, signal.SIGTERM)
+
+    def signal(self, pid, signum):
+        """Send a signal to a worker that might have already exited."""
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        """Ask every worker to finish, killing any that take too long."""
+        self.stopping = True
+        for pid in self.pids:
+            self.signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.stopTimeout
+        while self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in self.pids:
+            self.signal(pid, signal.SIGKILL)
+        while self.pids:
+            pid, _ = os.waitpid(-1, 0)
+            self.pids.pop(pid, None)
+
+class metricsWriter:
+    """Writes a worker's metrics to a JSON file named after its process ID
+    every few seconds, so the metrics of every worker can be added up."""
+
+    def __init__(self, directory, collect, interval=5):
+        """Set up the writer, call start to start writing.
+
+        Keyword arguments:
+        directory -- the folder to write metrics files to
+        collect   -- returns a dictionary of the worker's metrics
+        interval  -- seconds between writes"""
+        self.directory = directory
+        self.collect = collect
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"worker.{os.getpid()}.json")
+
+    def write(self):
+        """Write the metrics now."""
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def start(self):
+        """Start writing the metrics on a background thread."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.loop, name="metricsWriter", daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while True:
+            self.write()
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop writing and remove the metrics file."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def addMetrics(total, metrics):
+    """Add one worker's metrics to a total, numbers are added together
+    except ones named max... which keep the largest and ratio which is left out."""
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            addMetrics(total.setdefault(key, {}), value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or key == "ratio":
+            continue
+        elif key.startswith("max"):
+            total[key] = max(total.get(key, value), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def readMetrics(directory):
+    """Add up the metrics of every worker that has written a metrics file,
+    files of workers that are no longer running are removed.
+    Returns a dictionary of the totals with the number of workers."""
+    total = {"workers": 0}
+    if not os.path.isdir(directory):
+        return total
+    for filename in os.listdir(directory):
+        parts = filename.split(".")
+        if len(parts) != 3 or parts[0] != "worker" or parts[2] != "json" or not parts[1].isdigit():
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            os.kill(int(parts[1]), 0)
+        except ProcessLookupError:
+            os.remove(path)
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(path) as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            continue
+        total["workers"] += 1
+        addMetrics(total, metrics)
+    return total
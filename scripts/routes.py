@@ -2,16 +2,93 @@
 
 import flask
 import hashlib
+import hmac
+import io
+import markupsafe
 import os
 from PIL import Image
+import urllib.parse
+import werkzeug.security
+
+try:
+    from scripts.httpCache import fileVersions
+    from scripts.instrumentation import formatPrometheus
+    from scripts.passwordHasher import hasherBusyError
+except ModuleNotFoundError:
+    from httpCache import fileVersions
+    from instrumentation import formatPrometheus
+    from passwordHasher import hasherBusyError
 
 gamelist = flask.Blueprint("gamelist", __name__, template_folder="templates")
+versions = fileVersions()
+
+# Put around matching words by search, they can't be typed into a game name
+highlightMarkers = ("\x02", "\x03")
+
+# How many reviews are shown on a game's page and on each page of its reviews
+reviewsPerPage = 10
+
+
+@gamelist.app_template_filter("highlight")
+def highlightFilter(text):
+    """Escape search result text and turn the highlight markers into <mark> tags"""
+    text = str(markupsafe.escape(text))
+    return markupsafe.Markup(text.replace(highlightMarkers[0], "<mark>").replace(highlightMarkers[1], "</mark>"))
+
+
+@gamelist.app_errorhandler(hasherBusyError)
+def hasherBusy(error):
+    """Tell the user to try again when the password hashing workers are overloaded"""
+    response = flask.make_response(flask.render_template("error.html",
+        title="503: Server busy", message=str(error)), 503)
+    response.headers["Retry-After"] = "2"
+    return response
+
+
+def staticPath(path):
+    """Get the path of a file in the static folder, or None if it is outside it"""
+    return werkzeug.security.safe_join(os.path.join(flask.current_app.root_path, "static"), path)
+
+
+def pfpPath(username):
+    """Get the path of a user's profile picture"""
+    usernameHash = hashlib.md5(username.lower().encode()).hexdigest()
+    return f"{db.directory}/images/pfp/{usernameHash}.png"
+
+
+def promoPath(gameTitleHash):
+    """Get the path of a game's full size promotional image"""
+    return f"{db.directory}/images/promo/{gameTitleHash}.png"
+
+
+@gamelist.app_template_global("staticURL")
+def staticURL(path):
+    """Get the URL of a static file with its version"""
+    return versions.url("/static/" + urllib.parse.quote(path), staticPath(path))
+
+
+@gamelist.app_template_global("pfpURL")
+def pfpURL(username):
+    """Get the URL of a user's profile picture with its version"""
+    return versions.url(f"/images/profile/{urllib.parse.quote(username)}.png", pfpPath(username))
+
+
+@gamelist.app_template_global("promoURL")
+def promoURL(gameTitleHash, width=None):
+    """Get the URL of a game's promotional image with its version"""
+    url = f"/images/promo/{gameTitleHash}.png" + (f"?w={width}" if width else "")
+    return versions.url(url, promoPath(gameTitleHash))
 
 
 @gamelist.route("/static/<path:path>", endpoint="static", methods=["GET"])
 def sendStatic(path):
     """Send all files in the static folder"""
-    return flask.send_from_directory("static", path)
+    file = staticPath(path)
+    if file is None or not os.path.isfile(file):
+        flask.abort(404)
+    response = versions.send(file, variant=compression.getVariant(file))
+    response.vary.add("Accept-Encoding")
+    return response
 
 
 @gamelist.route("/", endpoint="home", methods=["GET"])
@@ -37,6 +114,7 @@ def loginPost():
         return flask.render_template("login.html",
         passwordValid=passwordValid)
     
+    flask.session.regenerate()
     flask.session['username'] = username
     return flask.redirect(flask.url_for("gamelist.allGames"))
 
@@ -75,6 +153,7 @@ def registerPost():
 @gamelist.route("/logout", endpoint="logout", methods=["GET"])
 def logout():
     """Log out user and send logout page"""
+    flask.session.clear()
     return flask.render_template("logout.html")
 
 
@@ -88,15 +167,79 @@ def profile():
 
 @gamelist.route("/user", endpoint="user", methods=["GET"])
 def user():
-    """Send user page"""
-    return flask.render_template("user.html")
+    """Send a user's page with their lists and reviews,
+    ?username= picks the user, the logged in user if not given,
+    ?after= is the cursor for the next page of reviews"""
+    username = flask.request.args.get("username") or flask.session.get("username")
+    if username is None:
+        return flask.redirect(flask.url_for("gamelist.loginGet"))
+    user = db.getUserByUsername(username)
+    if user is None:
+        return flask.render_template("error.html", title="404: User not found", message="The user you are looking for does not exist."), 404
+    ownPage = user["username"].lower() == flask.session.get("username", "").lower()
+    after = flask.request.args.get("after", "")
+    return flask.render_template("user.html", username=user["username"], ownPage=ownPage,
+        lists=db.getUserLists(user["username"], includePrivate=ownPage),
+        reviews=db.getReviewsByUser(user["username"], after=int(after) if after.isdigit() else None, limit=reviewsPerPage))
+
+
+def bufferChunks(chunks, size=4096):
+    """Join the small pieces a streamed template yields into chunks of
+    at least size bytes, so each write and compression flush is worth it."""
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def streamTemplate(template, **context):
+    """Render a template as it is sent, so the start of the page goes out
+    before the rest of it has been read from the database.
+    Iterables in the context, like database pages, are read as the template loops over them."""
+    return flask.Response(flask.stream_with_context(
+        bufferChunks(flask.stream_template(template, **context))))
 
 
 @gamelist.route("/games", endpoint="allGames", methods=["GET"])
 def allGames():
-    """Send all games page"""
-    games = db.getAllGames()
-    return flask.render_template("allGames.html", games=games)
+    """Send a page of the games list,
+    ?after= and ?before= are the cursors for the next and previous pages"""
+    order = flask.request.args.get("order", "name")
+    limit = flask.request.args.get("limit", "50")
+    if not limit.isdigit() or not 1 <= int(limit) <= 200:
+        return flask.render_template("error.html", title="400: Bad request", message="The limit must be between 1 and 200."), 400
+    try:
+        page = db.streamGamesPage(
+            after=flask.request.args.get("after"),
+            before=flask.request.args.get("before"),
+            limit=int(limit), order=order)
+    except ValueError:
+        return flask.render_template("error.html", title="400: Bad request", message="The page or order is invalid."), 400
+    return streamTemplate("allGames.html", page=page, order=order, limit=int(limit))
+
+
+@gamelist.route("/search", endpoint="search", methods=["GET"])
+def search():
+    """Search for games,
+    ?format=json only matches names and is used for autocomplete"""
+    query = flask.request.args.get("q", "").strip()
+    limit = flask.request.args.get("limit", "20")
+    if not limit.isdigit() or not 1 <= int(limit) <= 100:
+        limit = "20"
+    asJSON = (flask.request.args.get("format") == "json"
+        or flask.request.accept_mimetypes.best == "application/json")
+    results = db.searchGames(query, int(limit), namesOnly=asJSON, highlight=highlightMarkers)
+    if asJSON:
+        return {"query": query, "results": [
+            {"gameID": result["gameID"], "name": result["name"],
+             "url": flask.url_for("gamelist.game", game=result["name"])}
+            for result in results]}
+    return flask.render_template("search.html", query=query, results=results)
 
 
 @gamelist.route("/game/<game>", endpoint="game", methods=["GET"])
@@ -106,23 +249,204 @@ def game(game):
     game = db.getGameByName(game)
     if game is None:
         return flask.render_template("error.html", title="404: Game not found", message="The game you are looking for does not exist."), 404
-    return flask.render_template("game.html", **game, gameTitleHash=gameTitleHash)
+    # The game's HTML only changes with the game, its promo image and its template,
+    # the nav changes with who is logged in so whole pages are only cached for logged out users
+    key = (game["gameID"], game["version"], versions.getVersion(promoPath(gameTitleHash)),
+           versions.getVersion(os.path.join(flask.current_app.root_path, "templates/gameContent.html")))
+    loggedIn = bool(flask.session.get("username"))
+    if not loggedIn:
+        page = pages.get(("page", *key))
+        if page is not None:
+            return page
+    content = pages.get(("fragment", *key))
+    if content is None:
+        # Reviews change the game's content version, so the latest ones can be cached with it
+        content = flask.render_template("gameContent.html", **game, gameTitleHash=gameTitleHash,
+            reviews=db.getReviewsByGame(game["gameID"], limit=reviewsPerPage))
+        pages.set(("fragment", *key), content)
+    ownReview = db.getUserReview(flask.session["username"], game["gameID"]) if loggedIn else None
+    ownLists = db.getUserLists(flask.session["username"]) if loggedIn else []
+    page = flask.render_template("game.html", content=markupsafe.Markup(content),
+        name=game["name"], gameID=game["gameID"], ownReview=ownReview, ownLists=ownLists)
+    if not loggedIn:
+        pages.set(("page", *key), page)
+    return page
+
+
+@gamelist.route("/game/<game>/reviews", endpoint="reviews", methods=["GET"])
+def reviews(game):
+    """Send a page of a game's reviews, newest first,
+    ?after= is the cursor for the next page"""
+    game = db.getGameByName(game)
+    if game is None:
+        return flask.render_template("error.html", title="404: Game not found", message="The game you are looking for does not exist."), 404
+    after = flask.request.args.get("after", "")
+    page = db.getReviewsByGame(game["gameID"], after=int(after) if after.isdigit() else None, limit=reviewsPerPage)
+    return flask.render_template("reviews.html", name=game["name"], rating=game["rating"], page=page)
+
+
+@gamelist.route("/game/<game>/reviews", endpoint="reviewPost", methods=["POST"])
+def reviewPost(game):
+    """Add the user's review of a game, or replace the one they already wrote"""
+    if "username" not in flask.session:
+        return flask.redirect(flask.url_for("gamelist.loginGet"))
+    game = db.getGameByName(game)
+    if game is None:
+        return flask.render_template("error.html", title="404: Game not found", message="The game you are looking for does not exist."), 404
+    rating = flask.request.form.get("rating", "")
+    text = flask.request.form.get("reviewText", "")
+    for value, validate in [
+        (rating, db.validator.rating),
+        (text, db.validator.reviewText)
+    ]:
+        valid, message = validate(value)
+        if not valid:
+            return flask.render_template("error.html", title="400: Bad request", message=message), 400
+    db.addReview(flask.session["username"], game["gameID"], int(rating), text)
+    return flask.redirect(flask.url_for("gamelist.game", game=game["name"]))
+
+
+@gamelist.route("/reviews/<int:reviewID>/delete", endpoint="reviewDelete", methods=["POST"])
+def reviewDelete(reviewID):
+    """Delete a review, users can delete their own and admins can delete any"""
+    if "username" not in flask.session:
+        return flask.redirect(flask.url_for("gamelist.loginGet"))
+    review = db.getReviewByID(reviewID)
+    if review is None:
+        return flask.render_template("error.html", title="404: Review not found", message="The review you are looking for does not exist."), 404
+    if review["username"].lower() != flask.session["username"].lower():
+        user = db.getUserByUsername(flask.session["username"])
+        if user is None or user["role"] != "admin":
+            return flask.render_template("error.html", title="403: Forbidden", message="You can only delete your own reviews."), 403
+    db.deleteReview(reviewID)
+    return flask.redirect(flask.url_for("gamelist.game", game=review["gameName"]))
 
 
 @gamelist.route("/lists", endpoint="lists", methods=["GET"])
 def lists():
-    """Send the lists page"""
-    return flask.render_template("lists.html")
+    """Send the logged in user's lists"""
+    if "username" not in flask.session:
+        return flask.redirect(flask.url_for("gamelist.loginGet"))
+    return flask.render_template("lists.html", lists=db.getUserLists(flask.session["username"]))
+
+
+@gamelist.route("/lists", endpoint="listCreate", methods=["POST"])
+def listCreate():
+    """Create a list for the logged in user"""
+    if "username" not in flask.session:
+        return flask.redirect(flask.url_for("gamelist.loginGet"))
+    name = flask.request.form.get("listName", "")
+    valid, message = db.validator.listName(name)
+    if not valid:
+        return flask.render_template("lists.html", lists=db.getUserLists(flask.session["username"]),
+            error=message, listName=name)
+    listID = db.createList(flask.session["username"], name.strip(), bool(flask.request.form.get("public")))
+    return flask.redirect(flask.url_for("gamelist.list", listID=listID))
+
+
+def getOwnList(listID):
+    """Get a list the logged in user owns, or the error response to send if they don't"""
+    if "username" not in flask.session:
+        return None, flask.redirect(flask.url_for("gamelist.loginGet"))
+    gameList = db.getList(listID)
+    if gameList is None or (not gameList["public"] and gameList["username"].lower() != flask.session["username"].lower()):
+        return None, (flask.render_template("error.html", title="404: List not found", message="The list you are looking for does not exist."), 404)
+    if gameList["username"].lower() != flask.session["username"].lower():
+        return None, (flask.render_template("error.html", title="403: Forbidden", message="You can only change your own lists."), 403)
+    return gameList, None
+
+
+def getGameIDs(form):
+    """Get the game IDs sent by a form, ignoring any that aren't numbers"""
+    return [int(gameID) for gameID in form.getlist("gameID") if gameID.isdigit()]
+
+
+@gamelist.route("/lists/<int:listID>", endpoint="list", methods=["GET"])
+def listPage(listID):
+    """Send a page of the games in a list, private lists can only be seen by their owner,
+    ?after= is the cursor for the next page"""
+    gameList = db.getList(listID)
+    ownList = gameList is not None and gameList["username"].lower() == flask.session.get("username", "").lower()
+    if gameList is None or not (gameList["public"] or ownList):
+        return flask.render_template("error.html", title="404: List not found", message="The list you are looking for does not exist."), 404
+    limit = flask.request.args.get("limit", "50")
+    if not limit.isdigit() or not 1 <= int(limit) <= 200:
+        return flask.render_template("error.html", title="400: Bad request", message="The limit must be between 1 and 200."), 400
+    try:
+        page = db.getListGames(listID, after=flask.request.args.get("after"), limit=int(limit))
+    except ValueError:
+        return flask.render_template("error.html", title="400: Bad request", message="The page is invalid."), 400
+    return flask.render_template("list.html", list=gameList, ownList=ownList, page=page, limit=int(limit))
+
+
+@gamelist.route("/lists/<int:listID>/rename", endpoint="listRename", methods=["POST"])
+def listRename(listID):
+    """Rename one of the logged in user's lists"""
+    gameList, error = getOwnList(listID)
+    if error is not None:
+        return error
+    name = flask.request.form.get("listName", "")
+    valid, message = db.validator.listName(name)
+    if not valid:
+        return flask.render_template("error.html", title="400: Bad request", message=message), 400
+    db.renameList(listID, name.strip())
+    return flask.redirect(flask.url_for("gamelist.list", listID=listID))
+
+
+@gamelist.route("/lists/<int:listID>/delete", endpoint="listDelete", methods=["POST"])
+def listDelete(listID):
+    """Delete one of the logged in user's lists"""
+    gameList, error = getOwnList(listID)
+    if error is not None:
+        return error
+    db.deleteList(listID)
+    return flask.redirect(flask.url_for("gamelist.lists"))
+
+
+@gamelist.route("/lists/<int:listID>/games", endpoint="listAdd", methods=["POST"])
+def listAdd(listID):
+    """Add every gameID in the form to the end of one of the logged in user's lists"""
+    gameList, error = getOwnList(listID)
+    if error is not None:
+        return error
+    db.addGamesToList(listID, getGameIDs(flask.request.form))
+    return flask.redirect(flask.url_for("gamelist.list", listID=listID))
+
+
+@gamelist.route("/lists/<int:listID>/games/remove", endpoint="listRemove", methods=["POST"])
+def listRemove(listID):
+    """Remove every gameID in the form from one of the logged in user's lists"""
+    gameList, error = getOwnList(listID)
+    if error is not None:
+        return error
+    db.removeGamesFromList(listID, getGameIDs(flask.request.form))
+    return flask.redirect(flask.url_for("gamelist.list", listID=listID))
+
+
+@gamelist.route("/lists/<int:listID>/games/move", endpoint="listMove", methods=["POST"])
+def listMove(listID):
+    """Move a game in one of the logged in user's lists to after another,
+    or to the start if no game to put it after is sent"""
+    gameList, error = getOwnList(listID)
+    if error is not None:
+        return error
+    gameID = flask.request.form.get("gameID", "")
+    after = flask.request.form.get("after", "")
+    if not gameID.isdigit() or not (after == "" or after.isdigit()):
+        return flask.render_template("error.html", title="400: Bad request", message="The games to move are invalid."), 400
+    if not db.moveGameInList(listID, int(gameID), int(after) if after else None):
+        return flask.render_template("error.html", title="404: Game not found", message="The game is not in the list."), 404
+    return flask.redirect(flask.url_for("gamelist.list", listID=listID))
 
 
 @gamelist.route("/images/profile/<username>.png", endpoint="pfpGet", methods=["GET"])
 def userProfilePicture(username):
-    """Get the profile picture of a user"""
-    usernameHash = hashlib.md5(username.lower().encode()).hexdigest()
-    file = f"{db.directory}/images/pfp/{usernameHash}.png"
-    if os.path.exists(file):
-        return flask.send_file(file)
-    return flask.redirect("/static/images/defaultPFP.png")
+    """Get the profile picture of a user,
+    or the default profile picture if they haven't uploaded one"""
+    try:
+        return versions.send(pfpPath(username))
+    except FileNotFoundError:
+        return versions.send(staticPath("images/defaultPFP.png"))
 
 
 @gamelist.route("/images/profile/upload", endpoint="pfpPost", methods=["POST"])
@@ -132,15 +456,26 @@ def userProfilePicture():
         return {"success": False, "error": "You are not logged in."}, 401
     username = flask.session["username"]
     usernameHash = hashlib.md5(username.lower().encode()).hexdigest()
-    file = f"{db.directory}/images/pfp/{usernameHash}.png"
     if "image" not in flask.request.files:
         return {"success": False, "error": "No file was sent."}, 400
-    image = Image.open(flask.request.files["image"])
+    data = flask.request.files["image"].read()
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        return {"success": False, "error": "File is not an image."}, 400
     if image.width < 64 or image.height < 64:
         return {"success": False, "error": "Image is too small."}, 400
-    image = image.resize((512, 512), Image.ANTIALIAS)
-    image.save(file, "PNG")
-    return {"success": True}
+    jobID = images.submit("pfp", usernameHash, data)
+    return {"success": True, "job": jobID}
+
+
+@gamelist.route("/images/jobs/<jobID>", endpoint="imageJob", methods=["GET"])
+def imageJob(jobID):
+    """Get the status of an uploaded image that is being processed"""
+    job = images.getJob(jobID)
+    if job is None:
+        return {"success": False, "error": "Job not found."}, 404
+    return {"success": True, **job}
 
 
 @gamelist.route("/games/add", endpoint="addGameGet", methods=["GET"])
@@ -154,9 +489,6 @@ def addGameGet():
 @gamelist.route("/games/add", endpoint="addGamePost", methods=["POST"])
 def addGamePost():
     """Processes the new game form and adds game to the database"""
-    genres = db.getGenres()
-    publishers = db.getPublishers()
-
     gameTitle = flask.request.form["gameName"]
     desc = flask.request.form["desc"]
     releaseDate = flask.request.form["releaseDate"]
@@ -165,6 +497,7 @@ def addGamePost():
 
     message = ""
     valid = True
+    imageOpen = None
     for value, validate in [
         (gameTitle, db.validator.gameTitle),
         (releaseDate, db.validator.releaseDate)
@@ -189,32 +522,53 @@ def addGamePost():
         if size > 6 * 1024 * 1024:
             valid = False
             message += "\nimage must be below 6MB"
-        imageOpen = Image.open(image)
+        try:
+            imageOpen = Image.open(io.BytesIO(imageRead))
+        except Exception:
+            imageOpen = None
+            valid = False
+            message += "\nimage could not be opened"
+    if imageOpen is not None:
         if imageOpen.height < 128 or imageOpen.width < 128:
             valid = False
             message += "\nimage is too small, must be over 128 pixels in width and height"
         if imageOpen.height > 4096 or imageOpen.width > 4096:
             valid = False
             message += "\nimage is too large, must be below 4096 pixels in width and height"
+    if valid:
+        try:
+            db.addGame(gameTitle, desc, releaseDate, selectedGenres, selectedPublishers)
+        except ValueError as error:
+            # A genre or publisher was deleted after the form was sent
+            valid = False
+            message += "\n" + str(error)
     if not valid:
+        genres = db.getGenres()
+        publishers = db.getPublishers()
         return flask.render_template("addGame.html", error=message, 
             genres=genres, genreCount=len(genres),
             publishers=publishers, publisherCount=len(publishers),
             gameName=gameTitle,  desc=desc, releaseDate=releaseDate)
     gameTitleHash = hashlib.md5(gameTitle.lower().encode()).hexdigest()
-    db.addGame(gameTitle, desc, releaseDate, selectedGenres, selectedPublishers)
-    file = f"{db.directory}/images/promo/{gameTitleHash}.png"
-    imageOpen.save(file, "PNG")
+    images.submit("promo", gameTitleHash, imageRead)
     return flask.redirect(flask.url_for("gamelist.allGames"))
 
 
 @gamelist.route("/images/promo/<gameTitleHash>.png", endpoint="promoGet", methods=["GET"])
 def userProfilePicture(gameTitleHash):
-    """Get the profile picture of a user"""
-    file = f"{db.directory}/images/promo/{gameTitleHash}.png"
-    if os.path.exists(file):
-        return flask.send_file(file)
-    return flask.send_file("static/images/defaultPromo.png"), 404
+    """Get the promotional image of a game,
+    ?w= picks the smallest derivative at least that wide,
+    and it is sent in the best format the browser accepts"""
+    width = flask.request.args.get("w", "")
+    accepted = [mimetype for mimetype, quality in flask.request.accept_mimetypes if quality > 0]
+    formats = [format for format in images.formats if f"image/{format}" in accepted] + ["png"]
+    file = images.findDerivative("promo", gameTitleHash,
+        int(width) if width.isdigit() else None, formats)
+    if file is not None:
+        response = versions.send(file, versions.getVersion(promoPath(gameTitleHash)))
+        response.vary.add("Accept")
+        return response
+    return versions.send(staticPath("images/defaultPromo.png")), 404
 
 
 @gamelist.route("/games/addGenre", endpoint="genreAddGet", methods=["GET"])
@@ -227,10 +581,11 @@ def genreAddGet():
 def genreAddPost():
     """Processes the new genre form and adds genre to the database"""
     genreName = flask.request.form["genreName"]
-    if 3 <= len(genreName) < 32:
+    valid, message = db.validator.genreName(genreName)
+    if valid:
         db.addGenre(genreName)
         return flask.redirect(flask.url_for("gamelist.allGames"))
-    return flask.render_template("addGenre.html", error="Genre name must be between 3 and 32 characters long.", genreName=genreName)
+    return flask.render_template("addGenre.html", error=message, genreName=genreName)
 
 
 @gamelist.route("/games/addPublisher", endpoint="publisherAddGet", methods=["GET"])
@@ -243,13 +598,41 @@ def publisherAddGet():
 def publisherAddPost():
     """Processes the new publisher form and adds publisher to the database"""
     publisherName = flask.request.form["publisherName"]
-    if 3 <= len(publisherName) < 64:
+    valid, message = db.validator.publisherName(publisherName)
+    if valid:
         db.addPublisher(publisherName)
         return flask.redirect(flask.url_for("gamelist.allGames"))
-    return flask.render_template("addPublisher.html", error="Publisher name must be between 3 and 64 characters long.", publisherName=publisherName)
+    return flask.render_template("addPublisher.html", error=message, publisherName=publisherName)
+
+
+@gamelist.route("/metrics", endpoint="metrics", methods=["GET"])
+def metrics():
+    """Send the server's metrics in the Prometheus text format,
+    only to admins or requests with the metrics token"""
+    authorization = flask.request.headers.get("Authorization", "")
+    authorised = (metricsToken is not None and authorization.startswith("Bearer ")
+        and hmac.compare_digest(authorization[7:].encode(), metricsToken.encode()))
+    if not authorised and "username" in flask.session:
+        user = db.getUserByUsername(flask.session["username"])
+        authorised = user is not None and user["role"] == "admin"
+    if not authorised:
+        return flask.render_template("error.html", title="403: Forbidden", message="Only admins can see the metrics."), 403
+    response = flask.make_response(formatPrometheus(collectMetrics()))
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.cache_control.no_store = True
+    return response
     
 
 if "__main__" == __name__:
+    import compression
     import database
+    import imageProcessor
+    import pageCache
     import validator
     db = database.database("../data/", validator.validator)
+    images = imageProcessor.imageProcessor(db.directory)
+    compression = compression.compressor("../data/compressed")
+    pages = pageCache.pageCache()
+    db.gameListeners.append(pages.invalidate)
+    metricsToken = None
+    collectMetrics = lambda: {"pool": db.getPoolStats(), "gameCache": db.getGameCacheStats(), "pageCache": pages.getStats()}
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import flask.sessions
+import itsdangerous
+import json
+import os
+import secrets
+import threading
+import time
+import werkzeug.datastructures
+
+def loadSecretKey(path):
+    """Get the secret key from a file, making a new one if it doesn't exist,
+    so sessions are still valid after a restart and in every process."""
+    try:
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) >= 32:
+            return key
+    except FileNotFoundError:
+        pass
+    key = os.urandom(32)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        f.write(key)
+    try:
+        # Another process may have made one first, so only use ours if there isn't one
+        os.link(temporary, path)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            key = f.read()
+    finally:
+        os.remove(temporary)
+    return key
+
+class sqliteSessionStore:
+    """Stores sessions in the sessions table of the database,
+    so they are shared by every process using the data directory."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, sessionID):
+        """Get a tuple of a session's data and when it expires,
+        or None if it doesn't exist or has expired."""
+        rows = self.db.executeQuery(
+            "SELECT data, expires FROM sessions WHERE sessionID = ? AND expires > ?", (sessionID, time.time()))
+        return (json.loads(rows[0][0]), rows[0][1]) if rows else None
+
+    def set(self, sessionID, data, expires):
+        """Save a session's data and when it expires."""
+        con, cur = self.db.connect()
+        try:
+            cur.execute(
+                "INSERT INTO sessions (sessionID, data, expires) VALUES (?, ?, ?) \
+                ON CONFLICT (sessionID) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+                (sessionID, json.dumps(data), expires))
+            con.commit()
+        finally:
+            con.close()
+
+    def delete(self, sessionID):
+        """Delete a session."""
+        con, cur = self.db.connect()
+        try:
+            cur.execute("DELETE FROM sessions WHERE sessionID = ?", (sessionID,))
+            con.commit()
+        finally:
+            con.close()
+
+    def sweep(self):
+        """Delete every expired session, returns how many were deleted."""
+        con, cur = self.db.connect()
+        try:
+            cur.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+            deleted = cur.rowcount
+            con.commit()
+        finally:
+            con.close()
+        return deleted
+
+class memorySessionStore:
+    """Stores sessions in memory, in the place of a networked store
+    like Redis or Memcached. Sessions are only seen by this process
+    and are lost when it stops. Data is stored as JSON like a networked
+    store would, so the same data works with either."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, sessionID):
+        with self.lock:
+            data, expires = self.sessions.get(sessionID, (None, 0))
+        return (json.loads(data), expires) if expires > time.time() else None
+
+    def set(self, sessionID, data, expires):
+        with self.lock:
+            self.sessions[sessionID] = (json.dumps(data), expires)
+
+    def delete(self, sessionID):
+        with self.lock:
+            self.sessions.pop(sessionID, None)
+
+    def sweep(self):
+        now = time.time()
+        with self.lock:
+            expired = [sessionID for sessionID, (_, expires) in self.sessions.items() if expires <= now]
+            for sessionID in expired:
+                del self.sessions[sessionID]
+        return len(expired)
+
+sessionStores = {
+    "sqlite": sqliteSessionStore,
+    "memory": lambda db: memorySessionStore()
+}
+
+def makeSessionStore(name, db):
+    """Make a session store by its name in sessionStores."""
+    if name not in sessionStores:
+        raise ValueError(f"Unknown session store '{name}', must be one of: " + ", ".join(sessionStores))
+    return sessionStores[name](db)
+
+class serverSession(werkzeug.datastructures.CallbackDict, flask.sessions.SessionMixin):
+    """A session whose data is kept in a session store,
+    the cookie only holds its signed ID."""
+
+    def __init__(self, data=None, sessionID=None, expires=0):
+        def onUpdate(self):
+            self.modified = True
+        super().__init__(data, onUpdate)
+        self.sessionID = sessionID
+        self.expires = expires
+        self.new = sessionID is None
+        self.modified = False
+        self.regenerated = False
+
+    def regenerate(self):
+        """Give the session a new ID, call this when logging in
+        so an ID set before logging in can't be used after."""
+        self.regenerated = True
+        self.modified = True
+
+class sessionInterface(flask.sessions.SessionInterface):
+    """Loads each request's session from a session store once,
+    and only saves it if it changed or is close to expiring.
+
+    Session IDs are 16 random bytes, signed with the app's secret key so
+    made up IDs are rejected without looking them up."""
+
+    def __init__(self, store, ttl=7 * 24 * 60 * 60):
+        """Set up the session interface.
+
+        Keyword arguments:
+        store -- the session store to keep sessions in
+        ttl   -- seconds a session lasts after it was last saved"""
+        self.store = store
+        self.ttl = ttl
+
+    def getSigner(self, app):
+        return itsdangerous.Signer(app.secret_key, salt="session")
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sessionID = self.getSigner(app).unsign(cookie).decode("ascii")
+            except itsdangerous.BadSignature:
+                return serverSession()
+            stored = self.store.get(sessionID)
+            if stored is not None:
+                return serverSession(stored[0], sessionID, stored[1])
+        return serverSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.sessionID is not None:
+                self.store.delete(session.sessionID)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        # Sessions are saved again when half of their time is left so active users stay logged in
+        refresh = session.expires - time.time() < self.ttl / 2
+        if not (session.modified or refresh):
+            return
+        if session.regenerated and session.sessionID is not None:
+            self.store.delete(session.sessionID)
+            session.sessionID = None
+        if session.sessionID is None:
+            session.sessionID = secrets.token_urlsafe(16)
+        expires = time.time() + self.ttl
+        self.store.set(session.sessionID, dict(session), expires)
+        response.set_cookie(name, self.getSigner(app).sign(session.sessionID).decode("ascii"),
+            expires=self.get_expiration_time(app, session), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+            samesite=self.get_cookie_samesite(app))
+
+class sessionSweeper:
+    """Deletes expired sessions from a store on a background thread."""
+
+    def __init__(self, store, interval=60 * 60):
+        self.store = store
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start sweeping on a background thread."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.loop, name="sessionSweeper", daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.store.sweep()
+            except Exception as e:
+                print(f"Sweeping sessions failed: {e!r}")
+
+    def stop(self):
+        """Stop sweeping."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
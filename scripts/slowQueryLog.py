@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import datetime
+import functools
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import time
+
+class loggedCursor:
+    """Wraps a sqlite3 cursor so queries slower than the log's threshold are logged.
+
+    A query's time is the time spent running it and fetching its rows,
+    so it is logged once every row has been fetched, the cursor runs
+    another query or the cursor is no longer used. Its plan is read as
+    soon as it is known to be slow, while the connection is still borrowed."""
+
+    def __init__(self, cursor, log, con):
+        self.cursor = cursor
+        self.log = log
+        self.con = con
+        self.query = None
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def start(self, sql, params, kind):
+        self.finish()
+        self.query = {"sql": sql, "params": params, "kind": kind, "seconds": 0.0, "rows": 0, "plan": None}
+
+    def run(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.query["seconds"] += time.perf_counter() - start
+            if self.query["plan"] is None and self.query["seconds"] >= self.log.threshold:
+                self.query["plan"] = self.log.explain(self.con, self.query)
+
+    def execute(self, sql, params=()):
+        self.start(sql, params, "execute")
+        self.run(self.cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, params):
+        params = list(params)
+        self.start(sql, params, "executemany")
+        self.run(self.cursor.executemany, sql, params)
+        return self
+
+    def executescript(self, script):
+        self.start(script, (), "executescript")
+        self.run(self.cursor.executescript, script)
+        return self
+
+    def fetchone(self):
+        if self.query is None:
+            return self.cursor.fetchone()
+        row = self.run(self.cursor.fetchone)
+        if row is None:
+            self.finish()
+        else:
+            self.query["rows"] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if self.query is None:
+            return self.cursor.fetchmany(size or self.cursor.arraysize)
+        size = size or self.cursor.arraysize
+        rows = self.run(self.cursor.fetchmany, size)
+        self.query["rows"] += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        if self.query is None:
+            return self.cursor.fetchall()
+        rows = self.run(self.cursor.fetchall)
+        self.query["rows"] += len(rows)
+        self.finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def finish(self):
+        """Log the current query if it was slow."""
+        query, self.query = self.query, None
+        if query is None or query["seconds"] < self.log.threshold:
+            return
+        # Only queries that return rows have a description, others count the rows they changed
+        rows = query["rows"] if self.cursor.description is not None else self.cursor.rowcount
+        self.log.write(query, rows)
+
+    def __del__(self):
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+class slowQueryLog:
+    """Logs every query that takes longer than a threshold to a rotating
+    file, one JSON object per line, with its parameter types, duration,
+    row count and query plan. The plan shows whether SQLite searched an
+    index or scanned a whole table.
+
+    Several processes can write to the same file, but lines written while
+    another process is rotating it can end up in the rotated file."""
+
+    def __init__(self, path, threshold=0.1, maxBytes=10 * 1024 * 1024, backups=5):
+        """Set up the log, nothing is logged until a database is added with instrumentDatabase.
+
+        Keyword arguments:
+        path      -- the file to log to
+        threshold -- queries that take at least this many seconds are logged
+        maxBytes  -- the size the file is rotated at
+        backups   -- how many rotated files are kept"""
+        self.path = path
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=maxBytes, backupCount=backups, encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"slowQueryLog.{os.path.abspath(path)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.logged = 0
+
+    def instrumentDatabase(self, db):
+        """Log the slow queries of every connection the database hands out."""
+        connect = db.connect
+
+        @functools.wraps(connect)
+        def loggedConnect():
+            con, cur = connect()
+            return con, loggedCursor(cur, self, con)
+        db.connect = loggedConnect
+
+    def explain(self, con, query):
+        """Get the plan of a query as a list of lines,
+        or None if it can't be explained, like a script."""
+        if query["kind"] == "executescript":
+            return None
+        params = query["params"]
+        if query["kind"] == "executemany":
+            if not params:
+                return None
+            params = params[0]
+        try:
+            return [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + query["sql"], params).fetchall()]
+        except sqlite3.Error:
+            return None
+
+    def write(self, query, rows):
+        """Write a slow query to the log."""
+        params = query["params"][0] if query["kind"] == "executemany" and query["params"] else query["params"]
+        entry = {
+            "time":      datetime.datetime.now().isoformat(timespec="seconds"),
+            "pid":       os.getpid(),
+            "statement": " ".join(query["sql"].split()),
+            "kind":      query["kind"],
+            "params":    getParamShapes(params),
+            "seconds":   round(query["seconds"], 6),
+            "rows":      rows,
+            "plan":      query["plan"]
+        }
+        if query["kind"] == "executemany":
+            entry["batch"] = len(query["params"])
+        self.logger.info(json.dumps(entry))
+        self.logged += 1
+
+    def getStats(self):
+        return {"logged": self.logged}
+
+    def close(self):
+        """Stop logging to the file."""
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+def getParamShapes(params):
+    """Get the types of a query's parameters without their values,
+    strings and bytes also have their length."""
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+    if isinstance(params, dict):
+        return {name: shape(value) for name, value in params.items()}
+    return [shape(value) for value in params]
+
+def normaliseStatement(statement):
+    """Turn a statement into the same string for every call of it,
+    literals are replaced by ? and lists of values by (?...)."""
+    statement = " ".join(statement.split())
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", statement)
+    statement = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?...)", statement)
+    return statement
+
+def isFullScan(plan):
+    """Check if a query plan reads every row of a table, rather than searching an index.
+    Scanning a table in the order of an index still reads every row, so it counts."""
+    plan = plan or ()
+    # Subqueries and CTEs are scanned by their name, but aren't tables
+    subqueries = {line.split(" ", 1)[1] for line in plan if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    for line in plan:
+        match = re.match(r"^SCAN (\S+)", line)
+        if match is None or line == "SCAN CONSTANT ROW" or match.group(1).startswith("("):
+            continue
+        # Virtual tables like the search index do their own searching
+        if match.group(1) in subqueries or "VIRTUAL TABLE" in line:
+            continue
+        return True
+    return False
+
+def readSlowQueries(path):
+    """Read every entry in a slow query log and its rotated files, oldest first."""
+    backups = []
+    for name in glob.glob(glob.escape(path) + ".*"):
+        suffix = name.rsplit(".", 1)[1]
+        if suffix.isdigit():
+            backups.append((int(suffix), name))
+    for name in [name for _, name in sorted(backups, reverse=True)] + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def reportSlowQueries(entries):
+    """Group slow queries by their normalised statement.
+    Returns a list of the groups with the most total time first."""
+    groups = {}
+    for entry in entries:
+        statement = normaliseStatement(entry["statement"])
+        group = groups.setdefault(statement, {"statement": statement, "count": 0, "seconds": 0.0,
+            "maxSeconds": 0.0, "rows": 0, "fullScan": False, "plan": None, "durations": []})
+        group["count"] += 1
+        group["seconds"] += entry["seconds"]
+        group["maxSeconds"] = max(group["maxSeconds"], entry["seconds"])
+        group["rows"] += max(entry["rows"], 0)
+        group["durations"].append(entry["seconds"])
+        if entry.get("plan"):
+            group["plan"] = entry["plan"]
+            group["fullScan"] = group["fullScan"] or isFullScan(entry["plan"])
+    for group in groups.values():
+        durations = sorted(group.pop("durations"))
+        group["meanSeconds"] = group["seconds"] / group["count"]
+        group["p95Seconds"] = durations[min(int(len(durations) * 0.95), len(durations) - 1)]
+    return sorted(groups.values(), key=lambda group: group["seconds"], reverse=True)
+
+def printSlowQueryReport(groups, top=20, out=None):
+    """Print the slowest groups of a slow query report."""
+    print(f"{len(groups)} slow statements, {sum(group['count'] for group in groups)} slow queries", file=out)
+    for group in groups[:top]:
+        print(file=out)
+        print(f"{group['seconds'] * 1000:.1f}ms total, {group['count']} calls, {group['meanSeconds'] * 1000:.1f}ms mean, "
+              f"{group['p95Seconds'] * 1000:.1f}ms p95, {group['maxSeconds'] * 1000:.1f}ms max, "
+              f"{group['rows'] / group['count']:.0f} rows per call" + (", FULL SCAN" if group["fullScan"] else ""), file=out)
+        print("  " + group["statement"], file=out)
+        for line in group["plan"] or ():
+            print("    " + line, file=out)
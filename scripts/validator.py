@@ -70,10 +70,17 @@ class validator:
             return True, None
         return False, "Phone number is invalid"
 
-    def gameTitle(self, gameTitle):
-        """Check the game title is valid"""
+    def gameTitleLength(self, gameTitle):
+        """Check the game title is the right length, without checking if it exists"""
         if len(gameTitle) > 64 or len(gameTitle) < 3:
             return False, "Game title must be between 3 and 64 characters long"
+        return True, None
+
+    def gameTitle(self, gameTitle):
+        """Check the game title is valid"""
+        valid = self.gameTitleLength(gameTitle)
+        if not valid[0]:
+            return valid
         if self.db.getGameByName(gameTitle):
             return False, "Game already exists"
         return True, None
@@ -93,6 +100,40 @@ class validator:
                 pass
         return False, "Release date must be in YYYY-MM-DD format"
 
+    def genreName(self, genreName):
+        """Check a genre's name is the right length, without checking if it exists"""
+        if len(genreName) >= 32 or len(genreName) < 3:
+            return False, "Genre name must be between 3 and 32 characters long."
+        return True, None
+
+    def publisherName(self, publisherName):
+        """Check a publisher's name is the right length, without checking if it exists"""
+        if len(publisherName) >= 64 or len(publisherName) < 3:
+            return False, "Publisher name must be between 3 and 64 characters long."
+        return True, None
+
+    def rating(self, rating):
+        """Check a review's rating is a whole number of stars from 1 to 5"""
+        if rating not in ("1", "2", "3", "4", "5"):
+            return False, "Rating must be between 1 and 5 stars"
+        return True, None
+
+    def reviewText(self, reviewText):
+        """Check a review's text is not too long, it can be empty"""
+        if len(reviewText) > 1024:
+            return False, "Review must be at most 1024 characters long"
+        if profanity.contains_profanity(reviewText):
+            return False, "Review contains profanity"
+        return True, None
+
+    def listName(self, listName):
+        """Check a game list's name is valid"""
+        if len(listName.strip()) < 1 or len(listName) > 64:
+            return False, "List name must be between 1 and 64 characters long"
+        if profanity.contains_profanity(listName):
+            return False, "List name contains profanity"
+        return True, None
+
 
 if __name__ == "__main__":
     import database
@@ -1,16 +1,41 @@
 #!/usr/bin/env python3
 
 import flask
+import json
 import logging
 import os
 import sys
+import time
 
 # Get variables from argv or use the defaults
 argv = {}
 for arg, var, default in [
-    ("--host",      "host",     "0.0.0.0"),
-    ("--port",      "port",     "80"),
-    ("--data-dir",  "dataDir",  os.path.join(os.path.dirname(__file__), "data"))
+    ("--host",             "host",           "0.0.0.0"),
+    ("--port",             "port",           "80"),
+    ("--data-dir",         "dataDir",        os.path.join(os.path.dirname(__file__), "data")),
+    ("--pool-size",        "poolSize",       "8"),
+    ("--db-profile",       "dbProfile",      "balanced"),
+    ("--game-cache",       "gameCache",      "1024"),
+    ("--game-cache-ttl",   "gameCacheTTL",   "300"),
+    ("--game-cache-check", "gameCacheCheck", "1"),
+    ("--bcrypt-rounds",    "bcryptRounds",   "12"),
+    ("--hash-workers",     "hashWorkers",    "2"),
+    ("--hash-queue",       "hashQueue",      "16"),
+    ("--image-workers",    "imageWorkers",   "2"),
+    ("--compress-min",     "compressMin",    "1024"),
+    ("--page-cache",       "pageCache",      "1024"),
+    ("--threads",          "threads",        "8"),
+    ("--workers",          "workers",        "1"),
+    ("--session-store",    "sessionStore",   "sqlite"),
+    ("--session-ttl",      "sessionTTL",     str(7 * 24 * 60 * 60)),
+    ("--format",           "format",         None),
+    ("--images",           "imageDir",       None),
+    ("--batch-size",       "batchSize",      "1000"),
+    ("--metrics-token",    "metricsToken",   None),
+    ("--profile-slow",     "profileSlow",    None),
+    ("--profile-every",    "profileEvery",   "0.005"),
+    ("--slow-query-ms",    "slowQueryMS",    None),
+    ("--top",              "top",            "20")
 ]:
     if arg in sys.argv:
         argv[var] =  sys.argv[sys.argv.index(arg) + 1]
@@ -18,22 +43,67 @@ for arg, var, default in [
         argv[var] = default
 
 # Set up database
+from scripts.compression import compressor
 from scripts.database import database
+from scripts.imageProcessor import imageProcessor
+from scripts.instrumentation import instrumentation, samplingProfiler
+from scripts.pageCache import pageCache
+from scripts.passwordHasher import passwordHasher
+from scripts.sessions import loadSecretKey, makeSessionStore, sessionInterface, sessionSweeper
+from scripts.slowQueryLog import slowQueryLog
 from scripts.validator import validator
-db = database(argv["dataDir"], validator)
+hasher = passwordHasher(rounds=int(argv["bcryptRounds"]), workers=int(argv["hashWorkers"]), queueDepth=int(argv["hashQueue"]))
+db = database(argv["dataDir"], validator, poolSize=int(argv["poolSize"]), profile=argv["dbProfile"],
+              gameCacheSize=int(argv["gameCache"]), gameCacheTTL=float(argv["gameCacheTTL"]),
+              gameCacheCheck=float(argv["gameCacheCheck"]), hasher=hasher)
 db.executeScript("databaseStructure.sql")
+db.migrate()
+images = imageProcessor(db.directory, workers=int(argv["imageWorkers"]))
+compression = compressor(os.path.join(db.directory, "compressed"), minimumSize=int(argv["compressMin"]))
+compression.precompress(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+pages = pageCache(int(argv["pageCache"]), os.path.join(db.directory, "pageCache") if "--page-cache-disk" in sys.argv else None)
+db.gameListeners.append(pages.invalidate)
+metricsDirectory = os.path.join(db.directory, "metrics")
+slowQueryPath = os.path.join(db.directory, "logs", "slowQueries.log")
+
+# Log queries slower than --slow-query-ms with their query plans
+slowQueries = None
+if argv["slowQueryMS"] is not None:
+    slowQueries = slowQueryLog(slowQueryPath, float(argv["slowQueryMS"]) / 1000)
+    slowQueries.instrumentDatabase(db)
+
+# Time requests and the SQL, hashing, image and template work done for them
+profiler = None
+if argv["profileSlow"] is not None:
+    profiler = samplingProfiler(os.path.join(db.directory, "profiles"), float(argv["profileSlow"]), float(argv["profileEvery"]))
+instruments = instrumentation(profiler)
+instruments.instrumentDatabase(db)
+instruments.wrap(hasher, "run", "hash")
+instruments.wrap(images, "submit", "image")
+instruments.wrap(images, "process", "image")
  
 # Set up flask
-gamelist = flask.Flask(__name__)
+# Static files are sent by the blueprint so they get versioned caching
+gamelist = flask.Flask(__name__, static_folder=None)
 gamelist.url_map.strict_slashes = False
 gamelist.config["TEMPLATES_AUTO_RELOAD"] = True
 gamelist.config["SESSION_PERMANENT"] = False
-gamelist.config["SESSION_TYPE"] = "filesystem"
-gamelist.secret_key = os.urandom(32)
+# The largest form is adding a game with its image, which can be up to 6MB,
+# bigger request bodies get a 413 before they are read, whichever server is used
+gamelist.config["MAX_CONTENT_LENGTH"] = 8 * 1024 * 1024
+gamelist.secret_key = loadSecretKey(os.path.join(db.directory, "secretKey"))
+sessionStore = makeSessionStore(argv["sessionStore"], db)
+gamelist.session_interface = sessionInterface(sessionStore, ttl=float(argv["sessionTTL"]))
+sweeper = sessionSweeper(sessionStore)
 
 import scripts.routes
 scripts.routes.db = db
+scripts.routes.images = images
+scripts.routes.compression = compression
+scripts.routes.pages = pages
+scripts.routes.metricsToken = argv["metricsToken"]
 gamelist.register_blueprint(scripts.routes.gamelist)
+instruments.instrumentApp(gamelist)
 
 @gamelist.after_request
 def afterRequest(response):
@@ -41,34 +111,206 @@ def afterRequest(response):
     response.headers["Server"] = f"TeamMungGameList Python/{sys.version.split()[0]}"
     return response
 
-# Use waitress as the WSGI server if it is installed,
+gamelist.after_request(compression.afterRequest)
+
+# Use uvicorn as an ASGI server if --asgi argument and it and a2wsgi are installed,
+# otherwise use waitress as the WSGI server if it is installed,
 # but use built-in if it isnt, or if --werkzeug argument.
+useASGI = False
 useWaitress = False
-if not "--werkzeug" in sys.argv:
+if "--asgi" in sys.argv:
+    try:
+        import uvicorn
+        import a2wsgi
+        useASGI = True
+    except ImportError:
+        print("Uvicorn or a2wsgi is not installed, using a WSGI server instead.")
+if not useASGI and not "--werkzeug" in sys.argv:
     try:
         import waitress
         useWaitress = True
     except:
         print("Waitress is not installed, using built-in WSGI server (werkzeug).")
 
+def getMetrics():
+    """Get the counters and timings of everything in this process."""
+    return {
+        "pool":        db.getPoolStats(),
+        "gameCache":   db.getGameCacheStats(),
+        "pageCache":   pages.getStats(),
+        "hasher":      hasher.getStats(),
+        "compression": compression.getStats(),
+        **instruments.getStats(),
+        **({"slowQueries": slowQueries.getStats()} if slowQueries is not None else {})
+    }
+
+scripts.routes.collectMetrics = getMetrics
+
+def serve(sock=None):
+    """Serve requests until interrupted, on a listening socket if given
+    or on the host and port otherwise."""
+    threads = int(argv["threads"])
+    if useASGI:
+        from scripts.asgi import asgiApp
+        address = {"fd": sock.fileno()} if sock is not None else {"host": argv["host"], "port": int(argv["port"])}
+        uvicorn.run(asgiApp(gamelist, threads=threads, db=db, images=images),
+            **address, log_level="warning", lifespan="on")
+    elif useWaitress:
+        logging.getLogger("waitress.queue").setLevel(logging.CRITICAL)
+        address = {"sockets": [sock]} if sock is not None else {"host": argv["host"], "port": argv["port"]}
+        waitress.serve(gamelist, **address, threads=threads)
+    elif sock is not None:
+        import werkzeug.serving
+        werkzeug.serving.make_server(argv["host"], int(argv["port"]), gamelist,
+            threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        gamelist.run(host=argv["host"], port=argv["port"])
+
 if __name__ == "__main__":
     if "--help" in sys.argv:
         print("Team Mung's Game List Server")
         print("All Rights Reserved Copyright (c) 2022")
         print("Charlottieee, HenryMullins, JoeBlakeB, Thek9cow")
-        print("Usage: ./server.py [options]")
+        print("Usage: ./server.py [command] [options]")
+        print("Commands:")
+        print("  backfill-images       Make the missing promo image derivatives then exit")
+        print("  stats                 Show the added up metrics of the running workers then exit")
+        print("  import FILE           Import games from a CSV or JSONL file, - for stdin, then exit")
+        print("  export FILE           Export every game to a CSV or JSONL file, - for stdout, then exit")
+        print("  slow-queries          Show the slow query log grouped by statement, slowest first, then exit")
         print("Options:")
-        print("  --help            Display this help and exit")
-        print("  --host HOST       Set the servers host IP")
-        print("  --port PORT       Set the servers port")
-        print("  --werkzeug        Use werkzeug instead of waitress")
-        print("  --data-dir DIR    Set the directory where data is stored")
+        print("  --help                Display this help and exit")
+        print("  --host HOST           Set the servers host IP")
+        print("  --port PORT           Set the servers port")
+        print("  --werkzeug            Use werkzeug instead of waitress")
+        print("  --asgi                Use uvicorn as an ASGI server instead of waitress")
+        print("  --data-dir DIR        Set the directory where data is stored")
+        print("  --pool-size N         Set the maximum number of open database connections")
+        print("  --db-profile NAME     Set the database performance profile (durable, balanced, fast)")
+        print("  --game-cache N        Set how many games to cache in memory, 0 to disable")
+        print("  --game-cache-ttl S    Set how many seconds games are cached for")
+        print("  --game-cache-check S  Set how often cached games are checked for changes made by other workers")
+        print("  --bcrypt-rounds N     Set the BCrypt cost factor, passwords are rehashed on login when it changes")
+        print("  --hash-workers N      Set the number of password hashing processes")
+        print("  --hash-queue N        Set how many logins can wait for a hashing process before getting a 503")
+        print("  --image-workers N     Set how many uploaded images are processed at the same time")
+        print("  --compress-min BYTES  Set the smallest page size that is compressed")
+        print("  --page-cache N        Set how many rendered game pages to cache in memory, 0 to disable")
+        print("  --page-cache-disk     Also cache rendered game pages on disk in the data directory")
+        print("  --threads N           Set how many requests each process handles at the same time")
+        print("  --workers N           Set how many server processes to run, SIGHUP restarts them")
+        print("  --session-store NAME  Set where sessions are stored (sqlite, memory)")
+        print("  --session-ttl S       Set how many seconds users stay logged in for without visiting")
+        print("  --format FORMAT       Set the format to import or export (csv, jsonl, ndjson)")
+        print("  --images DIR          Set the folder to import promo images from or export them to")
+        print("  --batch-size N        Set how many games are imported in each transaction")
+        print("  --metrics-token TOKEN Let requests with this bearer token see /metrics as well as admins")
+        print("  --profile-slow S      Save sampled stacks of requests slower than S seconds to data/profiles")
+        print("  --profile-every S     Set how many seconds apart the profiler samples stacks")
+        print("  --slow-query-ms MS    Log queries slower than MS milliseconds and their plans to data/logs")
+        print("  --top N               Set how many statements slow-queries shows")
+        exit()
+
+    # Before anything is printed so it can export to stdout
+    if sys.argv[1:2] == ["export"] and len(sys.argv) > 2:
+        from scripts.catalogue import exportGames, getFormat
+        path = sys.argv[2]
+        start = time.perf_counter()
+        format = getFormat(path, argv["format"])
+        if path == "-":
+            written = exportGames(db, sys.stdout, format, argv["imageDir"], int(argv["batchSize"]))
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                written = exportGames(db, f, format, argv["imageDir"], int(argv["batchSize"]))
+        seconds = time.perf_counter() - start
+        print(f"Exported {written} games in {seconds:.1f}s ({written / max(seconds, 1e-9):.0f} rows/s)", file=sys.stderr)
+        db.close()
+        exit()
+
+    print(f"Database profile {db.profileName}: " + ", ".join(f"{pragma}={value}" for pragma, value in db.getSettings().items()))
+
+    if sys.argv[1:2] == ["backfill-images"]:
+        start = time.perf_counter()
+        made = images.backfill("promo", lambda done, total: print(f"\rBackfilling promo images {done}/{total}", end=""))
+        print(f"\nMade derivatives for {made} images in {time.perf_counter() - start:.1f}s")
+        images.close()
+        db.close()
         exit()
 
+    if sys.argv[1:2] == ["stats"]:
+        from scripts.prefork import readMetrics
+        print(json.dumps(readMetrics(metricsDirectory), indent=4))
+        db.close()
+        exit()
+
+    if sys.argv[1:2] == ["slow-queries"]:
+        from scripts.slowQueryLog import printSlowQueryReport, readSlowQueries, reportSlowQueries
+        printSlowQueryReport(reportSlowQueries(readSlowQueries(slowQueryPath)), int(argv["top"]))
+        db.close()
+        exit()
+
+    if sys.argv[1:2] == ["import"] and len(sys.argv) > 2:
+        from scripts.catalogue import catalogueImporter
+        importer = catalogueImporter(db, images, argv["imageDir"], batchSize=int(argv["batchSize"]))
+        try:
+            stats = importer.importFile(sys.argv[2], argv["format"], lambda stats: print(
+                f"\rImported {stats['imported']} of {stats['rows']} rows, {stats['rowsPerSecond']:.0f} rows/s", end="", file=sys.stderr))
+        finally:
+            print("\nFinishing image jobs", file=sys.stderr)
+            images.close()
+            db.close()
+        if stats["resumedAt"]:
+            print(f"Resumed after row {stats['resumedAt']}")
+        print(f"Imported {stats['imported']} games and {stats['images']} images, skipped {stats['skipped']} invalid or existing games "
+              f"and {stats['imageErrors']} missing images in {stats['seconds']:.1f}s ({stats['rowsPerSecond']:.0f} rows/s)")
+        exit()
+
+    # Finish processing images uploaded before the last shutdown
+    images.resume()
+
     # Run server
-    if useWaitress:
-        logging.getLogger("waitress.queue").setLevel(logging.CRITICAL)
-        waitress.serve(gamelist, host=argv["host"], port=argv["port"], threads=8)
-    else:
-        gamelist.run(host=argv["host"], port=argv["port"])
+    workers = int(argv["workers"])
+    if workers > 1 and not hasattr(os, "fork"):
+        print("Multiple workers need os.fork, running one server process.")
+        workers = 1
+    if workers > 1:
+        if argv["sessionStore"] == "memory":
+            print("Sessions in memory are not shared between workers, users will be logged out when they reach a different worker.")
+        from scripts.prefork import preforkServer, metricsWriter, readMetrics
+        metrics = metricsWriter(metricsDirectory, getMetrics)
+        # Every worker serves /metrics, so each shows the totals of them all
+        scripts.routes.collectMetrics = lambda: readMetrics(metricsDirectory)
+
+        def beforeFork():
+            # Workers must not share database connections or worker threads
+            images.close()
+            db.close()
 
+        def afterFork():
+            db.pool.reopen()
+            metrics.start()
+            sweeper.start()
+            if profiler is not None:
+                profiler.start()
+
+        def onExit():
+            if profiler is not None:
+                profiler.stop()
+            sweeper.stop()
+            images.close()
+            db.close()
+            metrics.stop()
+
+        preforkServer(argv["host"], argv["port"], workers, serve, beforeFork, afterFork, onExit).run()
+    else:
+        sweeper.start()
+        if profiler is not None:
+            profiler.start()
+        try:
+            serve()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            sweeper.stop()
+            images.close()
+            db.close()
@@ -0,0 +1,23 @@
+var searchInput = document.getElementById("q");
+var suggestions = document.getElementById("searchSuggestions");
+var lastQuery = "";
+
+searchInput.addEventListener("input", function() {
+    let query = searchInput.value.trim();
+    if (query == lastQuery || query.length < 2) {
+        return;
+    }
+    lastQuery = query;
+    fetch("/search?format=json&limit=8&q=" + encodeURIComponent(query))
+        .then(response => response.json()).then(data => {
+            if (data.query != lastQuery) {
+                return;
+            }
+            suggestions.innerHTML = "";
+            for (let result of data.results) {
+                let option = document.createElement("option");
+                option.value = result.name;
+                suggestions.appendChild(option);
+            }
+    });
+});
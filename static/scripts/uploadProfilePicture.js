@@ -1,3 +1,17 @@
+function waitForImage(job) {
+    fetch("/images/jobs/" + job).then(response => response.json()).then(data => {
+        if (data.status == "done") {
+            document.getElementById("profilePicture").src = document.getElementById("profilePicture").src.split("?")[0] + "?" + new Date().getTime();
+        }
+        else if (data.status == "failed") {
+            alert("The image could not be processed.");
+        }
+        else {
+            setTimeout(waitForImage, 250, job);
+        }
+    });
+}
+
 function uploadProfilePicture(image) {
     let formData = new FormData();
     formData.append("image", image);
@@ -7,7 +21,7 @@ function uploadProfilePicture(image) {
         body: formData
     }).then(response => response.json()).then(data => {
         if (data.success) {
-            document.getElementById("profilePicture").src += "?" + new Date().getTime();
+            waitForImage(data.job);
         }
         else {
             alert(data.error);
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""Benchmarks for the database layer and HTTP routes.
+
+Makes a synthetic dataset in a temporary data directory, times each
+database method and loads the main routes through the Flask test client
+and a real waitress server, then saves the p50/p95/p99 latencies and
+throughput as JSON so runs can be compared.
+
+Usage: python3 -m testing.benchmark [options]
+"""
+
+import bcrypt
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# The number of rows of each kind made for each scale
+scales = {
+    "small":  {"users": 200,    "games": 2000,   "genres": 20,  "publishers": 200,   "links": 3, "reviews": 5000},
+    "medium": {"users": 2000,   "games": 20000,  "genres": 50,  "publishers": 2000,  "links": 3, "reviews": 50000},
+    "large":  {"users": 20000,  "games": 200000, "genres": 100, "publishers": 20000, "links": 3, "reviews": 500000}
+}
+
+words = ("mung", "quest", "shadow", "legend", "star", "dungeon", "craft", "racing", "island", "knight",
+         "space", "farm", "city", "dragon", "puzzle", "tower", "ocean", "galaxy", "zombie", "kart")
+
+def getArguments():
+    """Get the options from argv, in the same way as server.py."""
+    argv = {}
+    for arg, var, default in [
+        ("--scale",      "scale",      "small"),
+        ("--users",      "users",      None),
+        ("--games",      "games",      None),
+        ("--genres",     "genres",     None),
+        ("--publishers", "publishers", None),
+        ("--links",      "links",      None),
+        ("--reviews",    "reviews",    None),
+        ("--iterations", "iterations", "200"),
+        ("--duration",   "duration",   "5"),
+        ("--clients",    "clients",    "16"),
+        ("--threads",    "threads",    "8"),
+        ("--seed",       "seed",       "1"),
+        ("--output",     "output",     None),
+        ("--compare",    "compare",    None),
+        ("--threshold",  "threshold",  "0.1")
+    ]:
+        if arg in sys.argv:
+            argv[var] = sys.argv[sys.argv.index(arg) + 1]
+        else:
+            argv[var] = default
+    return argv
+
+def summarise(latencies, seconds=None):
+    """Get the percentiles of a list of latencies in seconds, and the throughput.
+    seconds is the wall time the latencies were measured over, their sum if None."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0}
+    percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    seconds = seconds if seconds is not None else sum(latencies)
+    return {
+        "count":        len(latencies),
+        "meanMs":       sum(latencies) / len(latencies) * 1000,
+        "p50Ms":        percentile(0.50),
+        "p95Ms":        percentile(0.95),
+        "p99Ms":        percentile(0.99),
+        "maxMs":        latencies[-1] * 1000,
+        "perSecond":    len(latencies) / seconds if seconds else 0.0
+    }
+
+def timeCalls(function, iterations):
+    """Call a function repeatedly, returning the latency of each call.
+    The function is given the number of the call so it can vary its arguments."""
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def makeDataset(db, sizes, seed):
+    """Fill a database with random users, games, genres, publishers and reviews.
+    Returns samples of what was made to use as benchmark arguments."""
+    from scripts.catalogue import catalogueImporter
+    rng = random.Random(seed)
+    genres = [f"Genre {i}" for i in range(sizes["genres"])]
+    publishers = [f"Publisher {i}" for i in range(sizes["publishers"])]
+
+    def gameRows():
+        for i in range(sizes["games"]):
+            name = " ".join(rng.choice(words).title() for _ in range(2)) + f" {i}"
+            yield {
+                "name":        name,
+                "description": " ".join(rng.choice(words) for _ in range(20)),
+                "releaseDate": (datetime.date(1980, 1, 1) + datetime.timedelta(days=rng.randrange(15000))).isoformat(),
+                "genres":      rng.sample(genres, min(sizes["links"], len(genres))),
+                "publishers":  rng.sample(publishers, min(sizes["links"], len(publishers))),
+                "image":       None
+            }
+    catalogueImporter(db, batchSize=5000).importRows(gameRows())
+
+    # Users all share one cheap hash so making them doesn't take minutes
+    passwordHash = bcrypt.hashpw(b"Pa55w0rd!123", bcrypt.gensalt(4)).decode()
+    con, cur = db.connect()
+    cur.executemany(
+        "INSERT INTO users (roleID, username, passwordHash, email, dateOfBirth, phoneNumber) VALUES (2, ?, ?, ?, '2000-01-01', '07000000000')",
+        [(f"user{i}", passwordHash, f"user{i}@example.com") for i in range(sizes["users"])])
+    # Users only get one review of each game, so a few are dropped
+    cur.executemany(
+        "INSERT OR IGNORE INTO gameReviews (userID, gameID, datePosted, rating, reviewText) VALUES (?, ?, '2022-01-01', ?, ?)",
+        [(rng.randrange(1, sizes["users"] + 1), rng.randrange(1, sizes["games"] + 1), rng.randrange(1, 6),
+          " ".join(rng.choice(words) for _ in range(30))) for _ in range(sizes["reviews"])])
+    con.commit()
+    con.close()
+
+    # One big public list, like a user who has added every game they've played
+    listID = db.createList("user0", "Everything", public=True)
+    db.addGamesToList(listID, rng.sample(range(1, sizes["games"] + 1), min(10000, sizes["games"])))
+    listPage = {"next": None}
+    while True:
+        page = db.getListGames(listID, after=listPage["next"], limit=100)
+        if page["next"] is None:
+            break
+        listPage = page
+
+    names = [name for name, in db.executeQuery("SELECT gameName FROM games ORDER BY RANDOM() LIMIT 100", ())]
+    return {
+        "names":     names,
+        "gameIDs":   [gameID for gameID, in db.executeQuery("SELECT gameID FROM games ORDER BY RANDOM() LIMIT 100", ())],
+        "usernames": [f"user{rng.randrange(sizes['users'])}" for _ in range(100)],
+        "words":     words,
+        "deepCursor": db.encodeCursor(*db.executeQuery(
+            "SELECT LOWER(gameName), gameID FROM games ORDER BY LOWER(gameName), gameID LIMIT 1 OFFSET ?",
+            (max(sizes["games"] - 100, 0),))[0]),
+        "listID":     listID,
+        "listCursor": listPage["next"]
+    }
+
+def benchmarkDatabase(db, samples, iterations):
+    """Time each database method, returns the results by name."""
+    pick = lambda values: lambda i: values[i % len(values)]
+    name, gameID, username, word = (pick(samples[key]) for key in ("names", "gameIDs", "usernames", "words"))
+    added = iter(range(10 ** 9))
+
+    def uncached(function):
+        def call(i):
+            db.gameCache.clear()
+            function(i)
+        return call
+
+    benchmarks = {
+        "db.getGameByName.cached":     lambda i: db.getGameByName(name(i)),
+        "db.getGameByName.uncached":   uncached(lambda i: db.getGameByName(name(i))),
+        "db.getGameByID.cached":       lambda i: db.getGameByID(gameID(i)),
+        "db.getGameByID.uncached":     uncached(lambda i: db.getGameByID(gameID(i))),
+        "db.getGamesByIDs.uncached":   uncached(lambda i: db.getGamesByIDs(samples["gameIDs"][:50])),
+        "db.getGamesPage.first":       lambda i: db.getGamesPage(limit=50),
+        "db.getGamesPage.deep":        lambda i: db.getGamesPage(after=samples["deepCursor"], limit=50),
+        "db.getGamesPage.releaseDate": lambda i: db.getGamesPage(limit=50, order="releaseDate"),
+        "db.streamGamesPage.first":    lambda i: list(db.streamGamesPage(limit=50)),
+        "db.searchGames":              lambda i: db.searchGames(word(i) + " " + word(i + 3)),
+        "db.searchGames.namesOnly":    lambda i: db.searchGames(word(i)[:3], 10, namesOnly=True),
+        "db.getReviewsByGame":         lambda i: db.getReviewsByGame(gameID(i)),
+        "db.getReviewsByUser":         lambda i: db.getReviewsByUser(username(i)),
+        "db.getTopRatedGames":         lambda i: db.getTopRatedGames(minReviews=3),
+        "db.getListGames.first":       lambda i: db.getListGames(samples["listID"], limit=50),
+        "db.getListGames.deep":        lambda i: db.getListGames(samples["listID"], after=samples["listCursor"], limit=50),
+        "db.getUserLists":             lambda i: db.getUserLists("user0"),
+        "db.getUserByUsername":        lambda i: db.getUserByUsername(username(i)),
+        "db.checkPassword":            lambda i: db.checkPassword(username(i), "Pa55w0rd!123"),
+        "db.getGenres":                lambda i: db.getGenres(),
+        "db.getPublishers":            lambda i: db.getPublishers(),
+        "db.addGame":                  lambda i: db.addGame(f"Benchmark Game {next(added)}", "Added by the benchmark",
+                                                            "2020-01-01", ["Genre 1"], ["Publisher 1"])
+    }
+    results = {}
+    for benchmark, function in benchmarks.items():
+        function(0)
+        results[benchmark] = summarise(timeCalls(function, iterations))
+        print(f"{benchmark:<32}{results[benchmark]['p50Ms']:9.3f}ms p50 {results[benchmark]['p99Ms']:9.3f}ms p99", file=sys.stderr)
+    return results
+
+def getRoutes(samples):
+    """Get the routes to load test, by name."""
+    quote = urllib.parse.quote
+    return {
+        "/games":               lambda i: "/games",
+        "/games?after":         lambda i: "/games?after=" + samples["deepCursor"],
+        "/game/<game>":         lambda i: "/game/" + quote(samples["names"][i % len(samples["names"])]),
+        "/search":              lambda i: "/search?q=" + samples["words"][i % len(samples["words"])],
+        "/search?format=json":  lambda i: "/search?format=json&q=" + samples["words"][i % len(samples["words"])][:3],
+        "/lists/<listID>":      lambda i: f"/lists/{samples['listID']}",
+        "/static":              lambda i: "/static/styles/style.css"
+    }
+
+def benchmarkTestClient(app, samples, iterations):
+    """Time each route through the Flask test client, without any network."""
+    client = app.test_client()
+    results = {}
+    for route, getPath in getRoutes(samples).items():
+        client.get(getPath(0), headers={"Accept-Encoding": "gzip"})
+        results["client" + route] = summarise(timeCalls(
+            lambda i: client.get(getPath(i), headers={"Accept-Encoding": "gzip"}).close(), iterations))
+        print(f"{'client' + route:<32}{results['client' + route]['p50Ms']:9.3f}ms p50 "
+              f"{results['client' + route]['perSecond']:9.0f}/s", file=sys.stderr)
+    return results
+
+def benchmarkWaitress(app, samples, duration, clients, threads):
+    """Load each route on a real waitress server with keep-alive clients,
+    each sending requests one after another for duration seconds."""
+    import waitress
+    server = waitress.create_server(app, host="127.0.0.1", port=0, threads=threads)
+    stopped = threading.Event()
+
+    def run():
+        # server.run loops forever, so poll in steps that can be stopped
+        while not stopped.is_set():
+            server.asyncore.loop(timeout=0.1, map=server._map, count=1)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    results = {}
+    try:
+        for route, getPath in getRoutes(samples).items():
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+            deadline = time.perf_counter() + duration
+
+            def client(number):
+                con = http.client.HTTPConnection("127.0.0.1", server.effective_port, timeout=30)
+                mine, i = [], number
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        con.request("GET", getPath(i), headers={"Accept-Encoding": "gzip"})
+                        response = con.getresponse()
+                        response.read()
+                        if response.status >= 400:
+                            errors[0] += 1
+                    except (OSError, http.client.HTTPException):
+                        errors[0] += 1
+                        con.close()
+                        con = http.client.HTTPConnection("127.0.0.1", server.effective_port, timeout=30)
+                    mine.append(time.perf_counter() - start)
+                    i += clients
+                con.close()
+                with lock:
+                    latencies.extend(mine)
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            results["waitress" + route] = {**summarise(latencies, time.perf_counter() - start), "errors": errors[0]}
+            print(f"{'waitress' + route:<32}{results['waitress' + route]['p50Ms']:9.3f}ms p50 "
+                  f"{results['waitress' + route]['perSecond']:9.0f}/s", file=sys.stderr)
+    finally:
+        stopped.set()
+        thread.join()
+        server.close()
+    return results
+
+def getMeta(argv, sizes):
+    """Get what the benchmark was run on, so results can be compared fairly."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time":     datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit":   commit,
+        "python":   platform.python_version(),
+        "sqlite":   sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus":     os.cpu_count(),
+        "sizes":    sizes,
+        "options":  {key: argv[key] for key in ("iterations", "duration", "clients", "threads", "seed")}
+    }
+
+def compare(results, baseline, threshold):
+    """Print how much slower or faster each benchmark's p50 and throughput are than a baseline.
+    Returns the names of the benchmarks that regressed by more than threshold."""
+    regressions = []
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or not old.get("count") or not result.get("count"):
+            continue
+        change = result["p50Ms"] / old["p50Ms"] - 1 if old["p50Ms"] else 0.0
+        marker = ""
+        if change > threshold:
+            regressions.append(name)
+            marker = "  REGRESSION"
+        print(f"{name:<32}{old['p50Ms']:9.3f}ms -> {result['p50Ms']:9.3f}ms ({change:+.0%}){marker}")
+    return regressions
+
+def main():
+    argv = getArguments()
+    if "--help" in sys.argv:
+        print(__doc__)
+        print("Options:")
+        print("  --scale NAME".ljust(24) + "Set the dataset size (" + ", ".join(scales) + ")")
+        print("  --users N".ljust(24) + "Set the number of users, also --games, --genres, --publishers and --reviews")
+        print("  --links N".ljust(24) + "Set how many genres and publishers each game has")
+        print("  --iterations N".ljust(24) + "Set how many times each database method and route is called")
+        print("  --duration S".ljust(24) + "Set how long each route is loaded on waitress for")
+        print("  --clients N".ljust(24) + "Set how many keep-alive clients load waitress at once")
+        print("  --threads N".ljust(24) + "Set the number of waitress threads")
+        print("  --output FILE".ljust(24) + "Set where to save the results, benchmark-<time>.json by default")
+        print("  --compare FILE".ljust(24) + "Compare with a previous run, exits with 1 if any benchmark regressed")
+        print("  --threshold R".ljust(24) + "Set how much slower counts as a regression (default 0.1 for 10%)")
+        print("  --no-http".ljust(24) + "Only benchmark the database")
+        return 0
+    if argv["scale"] not in scales:
+        print(f"Unknown scale '{argv['scale']}', must be one of: " + ", ".join(scales))
+        return 2
+    http = "--no-http" not in sys.argv
+    sizes = {key: int(argv[key]) if argv[key] is not None else value for key, value in scales[argv["scale"]].items()}
+    dataDirectory = tempfile.mkdtemp(prefix="TeamMungBenchmark")
+    try:
+        # server.py reads its options from argv when it is imported
+        sys.argv = ["server.py", "--data-dir", dataDirectory, "--bcrypt-rounds", "4", "--hash-workers", "0"]
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import server
+        start = time.perf_counter()
+        samples = makeDataset(server.db, sizes, int(argv["seed"]))
+        print(f"Made dataset {sizes} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        results = {"meta": getMeta(argv, sizes), "results": {}}
+        results["results"].update(benchmarkDatabase(server.db, samples, int(argv["iterations"])))
+        if http:
+            results["results"].update(benchmarkTestClient(server.gamelist, samples, int(argv["iterations"])))
+            try:
+                results["results"].update(benchmarkWaitress(server.gamelist, samples, float(argv["duration"]),
+                    int(argv["clients"]), int(argv["threads"])))
+            except ImportError:
+                print("Waitress is not installed, skipping the waitress benchmarks.", file=sys.stderr)
+        server.images.close()
+        server.db.close()
+    finally:
+        shutil.rmtree(dataDirectory, ignore_errors=True)
+
+    output = argv["output"] or f"benchmark-{results['meta']['time'].replace(':', '')}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Saved results to {output}", file=sys.stderr)
+    if argv["compare"] is not None:
+        with open(argv["compare"]) as f:
+            regressions = compare(results, json.load(f), float(argv["threshold"]))
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed: " + ", ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+from scripts.catalogue import catalogueImporter, exportGames, readRows
+from scripts.database import database
+from scripts.imageProcessor import imageProcessor
+from scripts.validator import validator
+from testing.utils import baseTests
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import unittest
+
+class catalogueTests(baseTests):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.db = database(self.tempDataDir, validator)
+        self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
+
+    @classmethod
+    def tearDownClass(self):
+        self.db.close()
+        super().tearDownClass()
+
+    def write(self, filename, text):
+        path = os.path.join(self.tempDataDir, filename)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def testCSV(self):
+        """Test importing a CSV file, adding missing genres and skipping bad rows"""
+        self.db.addGenre("Puzzle")
+        path = self.write("games.csv",
+            "name,description,releaseDate,genres,publishers\n"
+            "Portal,Think with portals,2007-10-10,puzzle|First Person,Valve\n"
+            "Braid,Rewind time,2008-08-06,Puzzle,Number None\n"
+            "X,Too short,2008-08-06,,\n"
+            "PORTAL,Already imported,2007-10-10,,\n"
+            "Undated,No date,,,\n"
+            "Bad Genre,Genre too short,2008-08-06,RP,\n"
+            "Bad Publisher,Publisher too long,2008-08-06,," + "P" * 64 + "\n")
+        stats = catalogueImporter(self.db, batchSize=2).importFile(path)
+        self.assertEqual((stats["rows"], stats["imported"], stats["skipped"]), (7, 2, 5))
+        self.assertNotIn("RP", self.db.getGenres())
+        self.assertIsNone(self.db.getGameByName("Bad Genre"))
+        portal = self.db.getGameByName("Portal")
+        self.assertEqual(portal["genres"], ["Puzzle", "First Person"])
+        self.assertEqual(portal["developers"], ["Valve"])
+        self.assertIn("First Person", self.db.getGenres(), "Vocabulary not reloaded")
+        self.assertEqual(self.db.searchGames("rewind")[0]["name"], "Braid", "Search not updated")
+
+    def testUnreadableRows(self):
+        """Test that rows that can't be read are skipped without stopping the import"""
+        path = self.write("unreadable.jsonl",
+            '{"name": "Readable A", "releaseDate": "2012-01-01"}\n'
+            'not json\n'
+            '["a", "list"]\n'
+            '{"name": 5}\n'
+            '{"name": "Bad Genres", "releaseDate": "2012-01-01", "genres": [1, 2]}\n'
+            '{"name": "Readable B", "releaseDate": "2012-01-01", "description": null}\n')
+        stats = catalogueImporter(self.db, batchSize=4).importFile(path)
+        self.assertEqual((stats["rows"], stats["imported"], stats["skipped"]), (6, 2, 4))
+        self.assertIsNotNone(self.db.getGameByName("Readable B"))
+
+    def testResume(self):
+        """Test that an interrupted import carries on after the last committed batch"""
+        path = self.write("resume.jsonl", "".join(
+            json.dumps({"name": f"Resumed {i:02}", "releaseDate": "2010-01-01", "genres": ["Resumable"]}) + "\n"
+            for i in range(10)))
+        importer = catalogueImporter(self.db, batchSize=4)
+
+        def interrupted():
+            with open(path) as f:
+                for number, row in enumerate(readRows(f, "jsonl")):
+                    if number == 6:
+                        raise KeyboardInterrupt
+                    yield row
+        self.assertRaises(KeyboardInterrupt, importer.importRows, interrupted(), importer.getImportID(path))
+        self.assertEqual(importer.getRowsDone(importer.getImportID(path)), 4)
+        stats = importer.importFile(path)
+        self.assertEqual((stats["resumedAt"], stats["imported"], stats["skipped"]), (4, 6, 0))
+        self.assertEqual(len(self.db.executeQuery("SELECT 1 FROM games WHERE gameName LIKE 'Resumed %'", ())), 10)
+        self.assertEqual(self.db.getGenres().count("Resumable"), 1)
+
+    def testImages(self):
+        """Test that promo images are imported from a folder"""
+        imageDirectory = os.path.join(self.tempDataDir, "importImages")
+        os.makedirs(imageDirectory)
+        shutil.copy("static/images/evil mung.png", os.path.join(imageDirectory, "mung.png"))
+        path = self.write("images.jsonl",
+            json.dumps({"name": "Mung Simulator", "releaseDate": "2020-02-02", "image": "mung.png"}) + "\n" +
+            json.dumps({"name": "Missing Image", "releaseDate": "2020-02-02", "image": "missing.png"}) + "\n")
+        images = imageProcessor(self.tempDataDir)
+        try:
+            stats = catalogueImporter(self.db, images, imageDirectory).importFile(path)
+        finally:
+            images.close()
+        self.assertEqual((stats["imported"], stats["images"], stats["imageErrors"]), (2, 1, 1))
+        self.assertTrue(os.path.exists(images.getPath("promo", hashlib.md5(b"mung simulator").hexdigest())))
+
+    def testExport(self):
+        """Test that exported games can be imported again"""
+        self.db.addGenre("Party, Family")
+        self.db.addGame("Exported Game", "Has a \"quote\"", "2001-01-01", ["Party, Family"], [])
+        for format in ("csv", "jsonl"):
+            f = io.StringIO()
+            written = exportGames(self.db, f, format, batchSize=3)
+            self.assertEqual(written, len(self.db.executeQuery("SELECT 1 FROM games", ())))
+            f.seek(0)
+            exported = [row for row in readRows(f, format) if row["name"] == "Exported Game"]
+            self.assertEqual(exported, [{"name": "Exported Game", "description": "Has a \"quote\"",
+                "releaseDate": "2001-01-01", "genres": ["Party, Family"], "publishers": [], "image": None}], format)
+
+
+if __name__ == "__main__":
+    unittest.main()
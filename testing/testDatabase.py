@@ -1,11 +1,34 @@
 #!/usr/bin/env python3
 
 from scripts.validator import validator
-from scripts.database import database
+from scripts.database import database, gamesPageOrders, performanceProfiles
+from scripts.cache import lruCache
+from scripts.connectionPool import poolClosedError
+from scripts.passwordHasher import hasherBusyError, passwordHasher
 from testing.utils import baseTests
 
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import threading
+import time
 import unittest
 
+# Changes the database from another process, as another server worker would
+otherProcessScript = textwrap.dedent("""
+    import sys
+    from scripts.database import database
+    from scripts.validator import validator
+
+    db = database(sys.argv[1], validator)
+    with db.connect()[0] as con:
+        con.execute(sys.argv[2])
+    db.close()
+""")
+
 class databaseTests(baseTests):
 
     @classmethod
@@ -13,6 +36,7 @@ class databaseTests(baseTests):
         super().setUpClass()
         self.db = database(self.tempDataDir, validator)
         self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
 
 class structureTests(databaseTests):
     def testTablesExist(self):
@@ -21,6 +45,196 @@ class structureTests(databaseTests):
         for tablename in ["users", "userRoles", "games", "gameImages", "gameReviews", "gameLists", "gameListLink", "gameGenres", "gameGenresLink", "gamePublishers", "gamePublishersLink"]:
             self.assertIn((tablename,), tables)
 
+class poolTests(databaseTests):
+    def testConnectionsReused(self):
+        """Test that closed connections go back to the pool."""
+        before = self.db.getPoolStats()
+        for _ in range(5):
+            self.db.executeQuery("SELECT 1", ())
+        after = self.db.getPoolStats()
+        self.assertGreaterEqual(after["hits"] - before["hits"], 4)
+        self.assertLessEqual(after["open"], after["size"])
+
+    def testThreadsShareThePool(self):
+        """Test that many threads never open more connections than the pool size."""
+        threads = [threading.Thread(target=self.db.executeQuery, args=("SELECT 1", ())) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(self.db.getPoolStats()["open"], self.db.pool.size)
+
+    def testUncommittedRolledBack(self):
+        """Test that a connection is rolled back when it is given back."""
+        con, cur = self.db.connect()
+        cur.execute("INSERT INTO gameGenres (genre) VALUES (?)", ("Uncommitted",))
+        con.close()
+        self.assertNotIn("Uncommitted", self.db.getGenres())
+
+    def testErrorsReleaseConnections(self):
+        """Test that a query failing gives its connection back to the pool rolled back."""
+        db = database(self.tempDataDir, validator, poolSize=2)
+        db.pool.timeout = 1
+        db.addGenre("Leaky")
+        for _ in range(4):
+            self.assertRaises(sqlite3.IntegrityError, db.addGenre, "Leaky")
+            self.assertRaises(sqlite3.OperationalError, db.executeQuery, "SELECT * FROM missingTable", ())
+        db.addGenre("Not Leaky")
+        self.assertEqual(db.getGenres().count("Leaky"), 1)
+        self.assertIn("Not Leaky", db.getGenres())
+        stats = db.getPoolStats()
+        self.assertEqual(stats["idle"], stats["open"])
+        db.close()
+
+    def testUnclosedConnectionReleased(self):
+        """Test that a connection that is dropped without being closed goes back to the pool."""
+        db = database(self.tempDataDir, validator, poolSize=1)
+        db.pool.timeout = 1
+        con, cur = db.connect()
+        cur.execute("INSERT INTO gameGenres (genre) VALUES (?)", ("Dropped",))
+        del con, cur
+        self.assertNotIn("Dropped", db.getGenres())
+        db.close()
+
+    def testClose(self):
+        """Test that a closed pool closes its connections and refuses new ones."""
+        db = database(self.tempDataDir, validator, poolSize=2)
+        db.getSchemaVersion()
+        db.close()
+        self.assertEqual(db.getPoolStats()["open"], 0)
+        self.assertRaises(poolClosedError, db.getSchemaVersion)
+
+class profileTests(databaseTests):
+    def testProfilesApplied(self):
+        """Test that each profile's PRAGMAs are set on its connections."""
+        for name, profile in performanceProfiles.items():
+            db = database(self.tempDataDir, validator, profile=name)
+            settings = db.getSettings()
+            db.close()
+            self.assertEqual(settings["journal_mode"], "wal")
+            for pragma in ("synchronous", "cache_size", "temp_store", "busy_timeout"):
+                self.assertEqual(settings[pragma], profile[pragma], name + " " + pragma)
+
+    def testUnknownProfile(self):
+        """Test that an unknown profile is rejected."""
+        self.assertRaises(ValueError, database, self.tempDataDir, validator, profile="ludicrous")
+
+class migrationTests(databaseTests):
+    def testUpToDate(self):
+        """Test that every migration has been applied and none run twice."""
+        self.assertEqual(self.db.getSchemaVersion(), self.db.getMigrations()[-1][0])
+        self.assertEqual(self.db.migrate(), [])
+
+    def testUpgradeInPlace(self):
+        """Test that an existing database without migrations is upgraded and keeps its data."""
+        db = database(self.tempDataDir + "old/", validator)
+        db.executeScript("databaseStructure.sql")
+        db.addGenre("Puzzle")
+        self.assertEqual(db.getSchemaVersion(), 0)
+        self.assertEqual(db.migrate(), [version for version, _ in db.getMigrations()])
+        self.assertEqual(db.getGenres(), ["Puzzle"])
+        db.close()
+
+    def testLinksCleanedUp(self):
+        """Test that upgrading removes duplicate links and reviews, and rows pointing at deleted rows."""
+        db = database(self.tempDataDir + "links/", validator)
+        db.executeScript("databaseStructure.sql")
+        # Written without foreign keys, as older versions did
+        con = sqlite3.connect(db.filename)
+        con.executescript("""
+            INSERT INTO games (gameID, gameName, gameDescription, releaseDate, approved) VALUES (1, 'Kept', '', '2020-01-01', 1);
+            INSERT INTO gameGenres (genreID, genre) VALUES (1, 'Puzzle');
+            INSERT INTO gamePublishers (publisherID, publisherName) VALUES (1, 'Mung');
+            INSERT INTO gameGenresLink (gameID, genreID) VALUES (1, 1), (1, 1), (1, 2), (2, 1);
+            INSERT INTO gamePublishersLink (gameID, publisherID) VALUES (1, 1), (1, 1), (2, 1);
+            INSERT INTO gameListLink (listID, gameID) VALUES (1, 1);
+            INSERT INTO gameImages (gameID, imageHash, imageType) VALUES (1, 'kept', 'png'), (2, 'orphan', 'png');
+            INSERT INTO users (userID, roleID, username, passwordHash, email, dateOfBirth, phoneNumber)
+                VALUES (1, 2, 'Reviewer', '', 'reviewer@example.com', '2000-01-01', '07777777777');
+            INSERT INTO gameReviews (userID, gameID, datePosted, rating, reviewText) VALUES
+                (1, 1, '2020-01-01', 1, 'Old'), (1, 1, '2020-01-02', 4, 'New'), (1, 2, '2020-01-03', 5, 'Orphan');""")
+        con.commit()
+        con.close()
+        db.migrate()
+        self.assertEqual(db.executeQuery("SELECT gameID, genreID FROM gameGenresLink", ()), [(1, 1)])
+        self.assertEqual(db.executeQuery("SELECT gameID, publisherID FROM gamePublishersLink", ()), [(1, 1)])
+        self.assertEqual(db.executeQuery("SELECT * FROM gameListLink", ()), [])
+        self.assertEqual(db.executeQuery("SELECT imageHash FROM gameImages", ()), [("kept",)])
+        self.assertEqual([review["text"] for review in db.getReviewsByUser("Reviewer")["reviews"]], ["New"])
+        game = db.getGameByName("Kept")
+        self.assertEqual(game["rating"], {"reviews": 1, "average": 4, "stars": [0, 0, 0, 1, 0]})
+        self.assertEqual((game["genres"], game["developers"]), (["Puzzle"], ["Mung"]))
+        self.assertEqual([game["name"] for game in db.searchGames("puzzle mung")], ["Kept"], "Search triggers not recreated")
+        con, cur = db.connect()
+        with self.assertRaises(sqlite3.IntegrityError):
+            cur.execute("INSERT INTO gameGenresLink (gameID, genreID) VALUES (1, 1)")
+        con.rollback()
+        con.close()
+        db.close()
+
+class queryPlanTests(databaseTests):
+    """Check that lookups use an index instead of scanning the whole table."""
+
+    indexedTables = ["users", "userRoles", "games", "gameGenres", "gamePublishers"]
+
+    @classmethod
+    def setUpClass(self):
+        """Use a single connection so every statement can be traced."""
+        super().setUpClass()
+        self.db.close()
+        self.db = database(self.tempDataDir, validator, poolSize=1)
+        self.db.addGenre("Adventure")
+        self.db.addPublisher("Finji")
+
+    def tracedStatements(self, method, *args):
+        """Call a database method and return the SQL statements it ran."""
+        statements = []
+        con, cur = self.db.connect()
+        con.set_trace_callback(statements.append)
+        con.close()
+        try:
+            method(*args)
+        finally:
+            con, cur = self.db.connect()
+            con.set_trace_callback(None)
+            con.close()
+        return [statement for statement in statements
+                if re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", statement, re.IGNORECASE)]
+
+    def assertNoScans(self, method, *args):
+        """Fail if a statement run by the method scans an indexed table."""
+        statements = self.tracedStatements(method, *args)
+        self.assertTrue(statements, "No statements were run")
+        for statement in statements:
+            for row in self.db.executeQuery("EXPLAIN QUERY PLAN " + statement, ()):
+                for table in self.indexedTables:
+                    self.assertNotRegex(row[3], rf"^SCAN {table}\b", statement)
+
+    def testUserLookups(self):
+        """Test that users are found by username and email with an index."""
+        self.assertNoScans(self.db.getUserByUsername, "TestUser")
+        self.assertNoScans(self.db.getUserByEmail, "test@example.com")
+        self.assertNoScans(self.db.changeUserRole, "TestUser", "admin")
+
+    def testGameLookups(self):
+        """Test that games, genres and publishers are found by name with an index."""
+        self.assertNoScans(self.db.getGameByName, "Night In The Woods")
+        self.assertNoScans(self.db.getGamesByIDs, [1, 2, 3])
+        self.assertEqual(len(self.tracedStatements(self.db.getGamesByIDs, [4, 5, 6])), 1, "Not one query for every game")
+        self.db.getVocabulary()
+        self.assertNoScans(self.db.addGame, "Night In The Woods", "Mae goes home", "2017-02-21", ["adventure"], ["finji"])
+
+    def testLinkTables(self):
+        """Test that links are found by either of their IDs without reading the table they point to."""
+        for query in ["SELECT genreID FROM gameGenresLink WHERE gameID = 1",
+                      "SELECT gameID FROM gameGenresLink WHERE genreID = 1",
+                      "SELECT publisherID FROM gamePublishersLink WHERE gameID = 1",
+                      "SELECT gameID FROM gamePublishersLink WHERE publisherID = 1",
+                      "SELECT gameID FROM gameListLink WHERE listID = 1",
+                      "SELECT listID FROM gameListLink WHERE gameID = 1"]:
+            plan = " ".join(row[3] for row in self.db.executeQuery("EXPLAIN QUERY PLAN " + query, ()))
+            self.assertRegex(plan, r"^SEARCH \w+ USING (PRIMARY KEY|COVERING INDEX)", query)
+
 class userTests(databaseTests):
 
     @classmethod
@@ -51,6 +265,40 @@ class userTests(databaseTests):
         self.assertTrue(self.db.checkPassword("TestUser", "Pa55word!"))
         self.assertFalse(self.db.checkPassword("TestUser", "Mung1!sus"))
 
+class passwordHasherTests(databaseTests):
+
+    def testRehashOnLogin(self):
+        """Test that a password is hashed again when the cost factor changes."""
+        db = database(self.tempDataDir, validator, hasher=passwordHasher(rounds=4))
+        db.addUser("RehashUser", "Pa55word!", "rehash@example.com", "2003-07-23", "07777777777")
+        self.assertTrue(db.getUserByUsername("RehashUser")["passwordHash"].startswith(b"$2b$04$"))
+        db.close()
+        db = database(self.tempDataDir, validator, hasher=passwordHasher(rounds=5))
+        self.assertFalse(db.checkPassword("RehashUser", "wrong"))
+        self.assertTrue(db.getUserByUsername("RehashUser")["passwordHash"].startswith(b"$2b$04$"))
+        self.assertTrue(db.checkPassword("RehashUser", "Pa55word!"))
+        self.assertTrue(db.getUserByUsername("RehashUser")["passwordHash"].startswith(b"$2b$05$"))
+        self.assertTrue(db.checkPassword("RehashUser", "Pa55word!"))
+        db.close()
+
+    def testBusy(self):
+        """Test that calls are rejected when the workers and queue are full."""
+        hasher = passwordHasher(rounds=4, workers=1, queueDepth=0)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(hasher.hash("a" * 8)))
+        hasher.slots.acquire()
+        try:
+            self.assertRaises(hasherBusyError, hasher.hash, "Pa55word!")
+        finally:
+            hasher.slots.release()
+        thread.start()
+        thread.join()
+        self.assertEqual(len(results), 1)
+        stats = hasher.getStats()
+        self.assertEqual((stats["rejected"], stats["hashes"]), (1, 1))
+        self.assertGreater(stats["hashSeconds"], 0)
+        hasher.close()
+
 class gameTests(databaseTests):
     game = ["Night In The Woods",
             "College dropout Mae Borowski returns home to the crumbling former mining town of Possum Springs seeking to resume her aimless former life and reconnect with the friends she left behind. But things aren't the same. Home seems different now and her friends have grown and changed. Leaves are falling and the wind is growing colder. Strange things are happening as the light fades.",
@@ -59,9 +307,11 @@ class gameTests(databaseTests):
             ["Infinite Fall", "Finji"]]
 
     def testGameOnItsOwn(self):
-        """Test adding a game with the genres publishers not existing.
-        Then delete the game."""
-        self.db.addGame(*self.game)
+        """Test adding a game with the genres publishers not existing,
+        which is refused, then without any. Then delete the game."""
+        self.assertRaises(ValueError, self.db.addGame, *self.game)
+        self.assertIsNone(self.db.getGameByName(self.game[0]))
+        self.db.addGame(*self.game[:3], [], [])
         getGame = self.db.getGameByName(self.game[0])
         self.assertDictContainsSubset({
             "name": self.game[0],
@@ -99,6 +349,60 @@ class gameTests(databaseTests):
         self.db.deletePublisher("Finji")
         self.assertIsNone(self.db.getGameByName(self.game[0]))
     
+    def testManyGenresAndPublishers(self):
+        """Test that genres and publishers are in order, with commas in their names kept."""
+        genres = [f"Genre, Part {i}" for i in range(10)]
+        publishers = [f"Publisher {i}, Inc." for i in range(10)]
+        for genre, publisher in zip(genres, publishers):
+            self.db.addGenre(genre)
+            self.db.addPublisher(publisher)
+        self.db.addGame("Commas", "Lots of links", "2020-01-01", genres, publishers)
+        game = self.db.getGameByName("Commas")
+        self.assertEqual(game["genres"], genres)
+        self.assertEqual(game["developers"], publishers)
+        self.db.deleteGameByID(game["gameID"])
+        for genre, publisher in zip(genres, publishers):
+            self.db.deleteGenre(genre)
+            self.db.deletePublisher(publisher)
+
+    def testDeletesCascade(self):
+        """Test that deleting a game, genre or publisher deletes its links."""
+        self.db.addGenre("Roguelike")
+        self.db.addGenre("Action")
+        self.db.addPublisher("Supergiant")
+        self.db.addGame("Hades", "Escape the underworld", "2020-09-17", ["Roguelike", "Action", "Roguelike"], ["Supergiant"])
+        gameID = self.db.getGameByName("Hades")["gameID"]
+        con, cur = self.db.connect()
+        with self.assertRaises(sqlite3.IntegrityError, msg="Foreign keys not enforced"):
+            cur.execute("INSERT INTO gameGenresLink (gameID, genreID) VALUES (?, 1000000)", (gameID,))
+        con.rollback()
+        con.close()
+        self.db.deleteGenre("Roguelike")
+        self.assertEqual(self.db.getGameByID(gameID)["genres"], ["Action"])
+        self.db.deletePublisher("Supergiant")
+        self.assertEqual(self.db.getGameByID(gameID)["developers"], [])
+        self.db.deleteGameByID(gameID)
+        self.db.deleteGenre("Action")
+        for table in ["gameGenresLink", "gamePublishersLink"]:
+            self.assertEqual(self.db.executeQuery(f"SELECT COUNT(*) FROM {table} WHERE gameID = ?", (gameID,)), [(0,)])
+
+    def testGetGamesByIDs(self):
+        """Test getting several games at once, in the order asked for."""
+        ids = []
+        for name in ("Batch A", "Batch B", "Batch C"):
+            self.db.addGame(name, "In a batch", "2020-01-01", [], [])
+            ids.append(self.db.getGameByName(name)["gameID"])
+        self.db.gameCache.clear()
+        self.db.getGameByID(ids[1])
+        before = self.db.getGameCacheStats()
+        games = self.db.getGamesByIDs([ids[2], 10 ** 9, ids[0], ids[1]])
+        self.assertEqual([game["name"] for game in games], ["Batch C", "Batch A", "Batch B"])
+        self.assertEqual(games[1], self.db.getGameByID(ids[0]))
+        self.assertEqual(self.db.getGameCacheStats()["hits"] - before["hits"], 2, "Fetched games not cached")
+        self.assertEqual(self.db.getGamesByIDs([]), [])
+        for gameID in ids:
+            self.db.deleteGameByID(gameID)
+
     def adGetDeleteTest(self, values, add, delete, get):
         """Used by the genre and publisher tests"""
         add(values[0])
@@ -125,5 +429,461 @@ class gameTests(databaseTests):
             self.db.deletePublisher,
             self.db.getPublishers)
 
+class gameCacheTests(databaseTests):
+
+    def testCached(self):
+        """Test that a game is only fetched from the database once."""
+        self.db.addGame("Celeste", "Climb a mountain", "2018-01-25", [], [])
+        before = self.db.getGameCacheStats()
+        game = self.db.getGameByName("Celeste")
+        self.assertEqual(self.db.getGameByName("CELESTE"), game)
+        self.assertEqual(self.db.getGameByID(game["gameID"]), game)
+        after = self.db.getGameCacheStats()
+        self.assertEqual(after["hits"] - before["hits"], 3)
+
+    def testCopies(self):
+        """Test that changing a returned game doesn't change the cache."""
+        self.db.addGame("Terraria", "Dig and build", "2011-05-16", [], [])
+        self.db.getGameByName("Terraria")["genres"].append("Changed")
+        self.assertEqual(self.db.getGameByName("Terraria")["genres"], [])
+
+    def testInvalidated(self):
+        """Test that deleting games, genres and publishers updates cached games."""
+        self.db.addGenre("Platformer")
+        self.db.addPublisher("Team Cherry")
+        self.db.addGame("Hollow Knight", "Bugs", "2017-02-24", ["Platformer"], ["Team Cherry"])
+        game = self.db.getGameByName("Hollow Knight")
+        self.db.addGame("Silksong", "More bugs", "2025-09-04", [], [])
+        other = self.db.getGameByName("Silksong")
+        self.db.deleteGenre("Platformer")
+        self.assertIsNotNone(self.db.gameCache.get(("id", other["gameID"])), "Game without the genre invalidated")
+        self.assertEqual(self.db.getGameByName("Hollow Knight")["genres"], [])
+        self.db.deletePublisher("Team Cherry")
+        self.assertEqual(self.db.getGameByID(game["gameID"])["developers"], [])
+        self.db.deleteGameByID(game["gameID"])
+        self.assertIsNone(self.db.getGameByName("Hollow Knight"))
+        self.assertIsNone(self.db.getGameByID(game["gameID"]))
+
+    def testVersion(self):
+        """Test that a game's version changes with it and listeners are told."""
+        changed = []
+        self.db.gameListeners.append(changed.append)
+        try:
+            self.db.addGenre("Metroidvania")
+            self.db.addGame("Axiom Verge", "Glitches", "2015-03-31", ["Metroidvania"], [])
+            game = self.db.getGameByName("Axiom Verge")
+            self.assertEqual(changed, [game["gameID"]])
+            with self.db.connect()[0] as con:
+                con.execute("UPDATE games SET approved = 1 WHERE gameID = ?", (game["gameID"],))
+            self.db.deleteGenre("Metroidvania")
+            self.assertEqual(changed, [game["gameID"], game["gameID"]], "Only the genre's games should change")
+            self.assertEqual(self.db.getGameByID(game["gameID"])["version"], game["version"] + 2)
+        finally:
+            self.db.gameListeners.remove(changed.append)
+
+    def testChangedWhileReading(self):
+        """Test that a game read before it changed isn't cached after the change."""
+        self.db.addGame("Spelunky", "Caves", "2008-12-21", [], [])
+        gameID = self.db.getGameByName("Spelunky")["gameID"]
+        self.db.gameChanged(gameID)
+        getGame = self.db.getGame
+
+        def changedDuringRead(where, value):
+            game = getGame(where, value)
+            with self.db.connect()[0] as con:
+                con.execute("UPDATE games SET gameDescription = 'Deeper caves' WHERE gameID = ?", (gameID,))
+            self.db.gameChanged(gameID)
+            return game
+
+        self.db.getGame = changedDuringRead
+        try:
+            self.assertEqual(self.db.getGameByID(gameID)["description"], "Caves")
+        finally:
+            del self.db.getGame
+        self.assertIsNone(self.db.gameCache.get(("id", gameID)), "Stale game cached")
+        self.assertEqual(self.db.getGameByID(gameID)["description"], "Deeper caves")
+        self.assertIsNotNone(self.db.gameCache.get(("id", gameID)))
+
+    def testOtherProcess(self):
+        """Test that changes made by another process are seen by games already cached."""
+        db = database(self.tempDataDir, validator, gameCacheCheck=0)
+        db.addGame("Stardew Valley", "Farming", "2016-02-26", [], [])
+        game = db.getGameByName("Stardew Valley")
+        self.assertEqual(db.getGamesByIDs([game["gameID"]]), [game])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for change in (f"UPDATE games SET gameDescription = 'Farming and fishing' WHERE gameID = {game['gameID']}",
+                       f"DELETE FROM games WHERE gameID = {game['gameID']}"):
+            subprocess.run([sys.executable, "-c", otherProcessScript, self.tempDataDir, change], cwd=root, check=True)
+            if change.startswith("UPDATE"):
+                self.assertEqual(db.getGameByName("Stardew Valley")["description"], "Farming and fishing")
+                self.assertEqual(db.getGameByID(game["gameID"])["version"], game["version"] + 1)
+        self.assertIsNone(db.getGameByName("Stardew Valley"))
+        self.assertIsNone(db.getGameByID(game["gameID"]))
+        self.assertEqual(db.getGamesByIDs([game["gameID"]]), [])
+        db.close()
+
+    def testCheckInterval(self):
+        """Test that cached games are only checked for changes by other processes
+        once per interval, and only when a game has changed."""
+        db = database(self.tempDataDir, validator, gameCacheCheck=60)
+        db.addGame("Hades", "Escape the underworld", "2020-09-17", [], [])
+        game = db.getGameByName("Hades")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        change = f"UPDATE games SET gameDescription = 'Escape again' WHERE gameID = {game['gameID']}"
+        subprocess.run([sys.executable, "-c", otherProcessScript, self.tempDataDir, change], cwd=root, check=True)
+        self.assertEqual(db.getGameByID(game["gameID"])["description"], "Escape the underworld")
+        db.gamesCheckedAt -= 60
+        self.assertEqual(db.getGameByID(game["gameID"])["description"], "Escape again")
+        # Nothing has changed since, so the game stays cached after the next check
+        db.gamesCheckedAt -= 60
+        hits = db.getGameCacheStats()["hits"]
+        db.getGameByID(game["gameID"])
+        self.assertEqual(db.getGameCacheStats()["hits"], hits + 1)
+        db.close()
+
+    def testDisabled(self):
+        """Test that a cache size of 0 turns off the cache."""
+        db = database(self.tempDataDir, validator, gameCacheSize=0)
+        db.addGame("Fez", "Rotate the world", "2012-04-13", [], [])
+        db.getGameByName("Fez")
+        db.getGameByName("Fez")
+        self.assertEqual(db.getGameCacheStats()["hits"], 0)
+        self.assertEqual(db.getGameCacheStats()["size"], 0)
+        db.close()
+
+    def testEvictionAndExpiry(self):
+        """Test that the least recently used entry is evicted and old entries expire."""
+        cache = lruCache(2, 0.05)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.getStats()["evictions"], 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.getStats()["expirations"], 1)
+
+class gamesPageTests(databaseTests):
+
+    @classmethod
+    def setUpClass(self):
+        """Add games to page through."""
+        super().setUpClass()
+        for i in range(25):
+            self.db.addGame(f"Game {i:02}", "A game", f"{2000 + i % 5}-01-01", [], [])
+
+    def pages(self, order, limit):
+        """Follow next cursors to the end of the list, then back with prev cursors."""
+        forwards = [self.db.getGamesPage(limit=limit, order=order)]
+        while forwards[-1]["next"]:
+            forwards.append(self.db.getGamesPage(after=forwards[-1]["next"], limit=limit, order=order))
+        backwards = [forwards[-1]]
+        while backwards[-1]["prev"]:
+            backwards.append(self.db.getGamesPage(before=backwards[-1]["prev"], limit=limit, order=order))
+        return forwards, backwards[::-1]
+
+    def testOrders(self):
+        """Test that every order visits each game once in the right order."""
+        for order, key in (("name", lambda game: game["name"].lower()),
+                           ("releaseDate", lambda game: game["releaseDate"]),
+                           ("id", lambda game: game["gameID"])):
+            forwards, backwards = self.pages(order, 7)
+            games = [game for page in forwards for game in page["games"]]
+            self.assertEqual(len(games), 25)
+            self.assertEqual(games, sorted(games, key=lambda game: (key(game), game["gameID"])))
+            self.assertEqual([page["games"] for page in forwards], [page["games"] for page in backwards])
+            self.assertIsNone(forwards[0]["prev"])
+            self.assertIsNone(forwards[-1]["next"])
+
+    def testInvalid(self):
+        """Test that bad cursors and orders are rejected."""
+        self.assertRaises(ValueError, self.db.getGamesPage, after="notACursor")
+        for order, sortValue, gameID in (("name", [1], 1), ("name", 1, 1), ("releaseDate", None, 1),
+                                         ("id", "1", 1), ("id", True, 1), ("id", 2 ** 64, 1), ("name", "a", 2 ** 63)):
+            cursor = self.db.encodeCursor(sortValue, gameID)
+            self.assertRaises(ValueError, self.db.getGamesPage, after=cursor, order=order)
+        self.assertRaises(ValueError, self.db.getGamesPage, order="gameName; DROP TABLE games")
+
+    def testStream(self):
+        """Test that a streamed page releases its connection when it is finished or abandoned."""
+        page = self.db.streamGamesPage(limit=7, order="id")
+        games = iter(page)
+        next(games)
+        self.assertEqual(self.db.getPoolStats()["idle"], self.db.getPoolStats()["open"] - 1)
+        games.close()
+        self.assertEqual(self.db.getPoolStats()["idle"], self.db.getPoolStats()["open"])
+        first = self.db.getGamesPage(limit=7, order="id")
+        page = self.db.streamGamesPage(after=first["next"], limit=7, order="id")
+        expected = self.db.getGamesPage(after=first["next"], limit=7, order="id")
+        self.assertEqual(list(page), expected["games"])
+        self.assertEqual((page.prev, page.next), (expected["prev"], expected["next"]))
+
+    def testUsesIndex(self):
+        """Test that a page is read from an index instead of sorting the whole table."""
+        for order in ("name", "releaseDate"):
+            page = self.db.getGamesPage(limit=5, order=order)
+            sortValue, gameID = self.db.decodeCursor(page["next"], str)
+            sortKey = gamesPageOrders[order]
+            plan = self.db.executeQuery(
+                f"EXPLAIN QUERY PLAN SELECT gameID FROM games \
+                WHERE {sortKey} >= ? AND ({sortKey} > ? OR games.gameID > ?) \
+                ORDER BY {sortKey}, games.gameID LIMIT 5", (sortValue, sortValue, gameID))
+            for row in plan:
+                self.assertNotIn("TEMP B-TREE", row[3], order)
+                self.assertNotRegex(row[3], r"^SCAN games", order)
+
+class reviewTests(databaseTests):
+
+    @classmethod
+    def setUpClass(self):
+        """Add users and games to review."""
+        super().setUpClass()
+        self.usernames = [f"Reviewer{i}" for i in range(5)]
+        for i, username in enumerate(self.usernames):
+            self.db.addUser(username, "Pa55word!", f"reviewer{i}@example.com", "2003-07-23", "07777777777")
+        self.gameIDs = []
+        for name in ("Outer Wilds", "Tunic", "Inside"):
+            self.db.addGame(name, "Reviewed", "2019-05-28", [], [])
+            self.gameIDs.append(self.db.getGameByName(name)["gameID"])
+
+    def testRatingKept(self):
+        """Test that a game's rating follows its reviews being added, replaced, edited and deleted."""
+        gameID = self.gameIDs[0]
+        self.assertIsNone(self.db.getGameByID(gameID)["rating"])
+        reviewIDs = [self.db.addReview(username, gameID, rating, "") for username, rating in zip(self.usernames, [5, 4, 4, 1])]
+        self.assertEqual(self.db.getGameByID(gameID)["rating"], {"reviews": 4, "average": 3.5, "stars": [1, 0, 0, 2, 1]})
+        self.assertEqual(self.db.addReview(self.usernames[0], gameID, 2, "Changed my mind"), reviewIDs[0], "Review not replaced")
+        self.assertTrue(self.db.editReview(reviewIDs[3], 3, "Not that bad"))
+        self.assertEqual(self.db.getGameByID(gameID)["rating"], {"reviews": 4, "average": 3.25, "stars": [0, 1, 1, 2, 0]})
+        for reviewID in reviewIDs:
+            self.assertTrue(self.db.deleteReview(reviewID))
+        self.assertFalse(self.db.deleteReview(reviewIDs[0]))
+        self.assertFalse(self.db.editReview(reviewIDs[0], 1, ""))
+        self.assertIsNone(self.db.getGameByID(gameID)["rating"])
+        self.assertIsNone(self.db.addReview("Nobody", gameID, 3, ""))
+        self.assertIsNone(self.db.addReview(self.usernames[0], 10 ** 9, 3, ""))
+        reviewID = self.db.addReview(self.usernames[0], gameID, 3, "")
+        con, cur = self.db.connect()
+        with self.assertRaises(sqlite3.IntegrityError, msg="Rating out of range accepted"):
+            cur.execute("UPDATE gameReviews SET rating = 6 WHERE reviewID = ?", (reviewID,))
+        con.rollback()
+        con.close()
+        self.db.deleteReview(reviewID)
+
+    def testPages(self):
+        """Test paging through a game's and a user's reviews, newest first."""
+        gameID = self.gameIDs[1]
+        reviewIDs = [self.db.addReview(username, gameID, 3, username) for username in self.usernames]
+        first = self.db.getReviewsByGame(gameID, limit=3)
+        self.assertEqual([review["reviewID"] for review in first["reviews"]], reviewIDs[:1:-1])
+        second = self.db.getReviewsByGame(gameID, after=first["next"], limit=3)
+        self.assertEqual([review["reviewID"] for review in second["reviews"]], reviewIDs[1::-1])
+        self.assertIsNone(second["next"])
+        self.assertEqual(second["reviews"][-1]["username"], self.usernames[0])
+        byUser = self.db.getReviewsByUser(self.usernames[2].lower())
+        self.assertEqual([review["gameName"] for review in byUser["reviews"]], ["Tunic"])
+        for reviewID in reviewIDs:
+            self.db.deleteReview(reviewID)
+
+    def testTopRated(self):
+        """Test that the top rated games are read from the ratings index."""
+        for gameID, ratings in zip(self.gameIDs, [[3, 3], [5], [5, 5]]):
+            for username, rating in zip(self.usernames, ratings):
+                self.db.addReview(username, gameID, rating, "")
+        self.assertEqual([game["name"] for game in self.db.getTopRatedGames()], ["Inside", "Tunic", "Outer Wilds"])
+        self.assertEqual([game["name"] for game in self.db.getTopRatedGames(minReviews=2)], ["Inside", "Outer Wilds"])
+        for query in ["SELECT gameID FROM gameRatings WHERE reviews >= 1 ORDER BY averageRating DESC, reviews DESC LIMIT 10",
+                      "SELECT reviewID FROM gameReviews WHERE gameID = 1 AND reviewID < 10 ORDER BY reviewID DESC LIMIT 10",
+                      "SELECT reviewID FROM gameReviews WHERE userID = 1 ORDER BY reviewID DESC LIMIT 10"]:
+            plan = [row[3] for row in self.db.executeQuery("EXPLAIN QUERY PLAN " + query, ())]
+            self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, query)
+            self.assertNotRegex(" ".join(plan), r"SCAN \w+$", query)
+        self.db.deleteGameByID(self.gameIDs[2])
+        self.assertEqual([game["name"] for game in self.db.getTopRatedGames()], ["Tunic", "Outer Wilds"], "Deleted game's rating kept")
+        self.assertEqual(self.db.getReviewsByUser(self.usernames[0])["reviews"][0]["gameName"], "Tunic")
+
+class listTests(databaseTests):
+
+    @classmethod
+    def setUpClass(self):
+        """Add a user and games to put in lists."""
+        super().setUpClass()
+        self.db.addUser("Lister", "Pa55word!", "lister@example.com", "2003-07-23", "07777777777")
+        con, cur = self.db.connect()
+        cur.executemany(
+            "INSERT INTO games (gameName, gameDescription, releaseDate, approved) VALUES (?, 'Listed', '2020-01-01', 1)",
+            [(f"Listed Game {i}",) for i in range(10000)])
+        con.commit()
+        con.close()
+        self.gameIDs = [gameID for gameID, in self.db.executeQuery(
+            "SELECT gameID FROM games WHERE gameName LIKE 'Listed Game %' ORDER BY gameID", ())]
+
+    def listedIDs(self, listID, limit=50):
+        return [game["gameID"] for game in self.db.getListGames(listID, limit=limit)["games"]]
+
+    def testLists(self):
+        """Test creating, renaming and deleting lists, and that private lists are left out for others."""
+        listID = self.db.createList("Lister", "Favourites", public=True)
+        privateID = self.db.createList("lister", "Secret")
+        self.assertIsNone(self.db.createList("Nobody", "Missing"))
+        self.assertTrue(self.db.renameList(listID, "Best Ever"))
+        self.assertEqual(self.db.getList(listID), {"listID": listID, "username": "Lister", "name": "Best Ever", "public": True, "gameCount": 0})
+        self.assertEqual([gameList["name"] for gameList in self.db.getUserLists("Lister")], ["Best Ever", "Secret"])
+        self.assertEqual([gameList["name"] for gameList in self.db.getUserLists("Lister", includePrivate=False)], ["Best Ever"])
+        self.db.addGamesToList(privateID, self.gameIDs[:3])
+        self.assertTrue(self.db.deleteList(privateID))
+        self.assertFalse(self.db.deleteList(privateID))
+        self.assertFalse(self.db.renameList(privateID, "Gone"))
+        self.assertIsNone(self.db.getList(privateID))
+        self.assertEqual(self.db.executeQuery("SELECT COUNT(*) FROM gameListLink WHERE listID = ?", (privateID,)), [(0,)])
+        self.db.deleteList(listID)
+
+    def testBulkAddAndRemove(self):
+        """Test adding and removing many games at once, with the count kept."""
+        listID = self.db.createList("Lister", "Bulk")
+        ids = self.gameIDs[:5]
+        self.assertEqual(self.db.addGamesToList(listID, [ids[2], ids[0], ids[2], 10 ** 9]), 2)
+        self.assertEqual(self.db.addGamesToList(listID, ids), 3, "Games already in the list added again")
+        self.assertEqual(self.listedIDs(listID), [ids[2], ids[0], ids[1], ids[3], ids[4]])
+        self.assertIsNone(self.db.addGamesToList(10 ** 9, ids))
+        self.assertEqual(self.db.removeGamesFromList(listID, [ids[0], ids[1], 10 ** 9]), 2)
+        self.assertEqual(self.db.getList(listID)["gameCount"], 3)
+        self.db.addGame("Short Lived", "Deleted", "2020-01-01", [], [])
+        gameID = self.db.getGameByName("Short Lived")["gameID"]
+        self.db.addGamesToList(listID, [gameID])
+        self.db.deleteGameByID(gameID)
+        self.assertEqual(self.db.getList(listID)["gameCount"], 3, "Count not kept when a game is deleted")
+        self.db.deleteList(listID)
+
+    def testMove(self):
+        """Test moving games, including after the gaps between positions run out."""
+        listID = self.db.createList("Lister", "Ordered")
+        ids = self.gameIDs[:20]
+        self.db.addGamesToList(listID, ids[:4])
+        self.assertTrue(self.db.moveGameInList(listID, ids[3]))
+        self.assertTrue(self.db.moveGameInList(listID, ids[0], ids[1]))
+        self.assertEqual(self.listedIDs(listID), [ids[3], ids[1], ids[0], ids[2]])
+        self.assertFalse(self.db.moveGameInList(listID, ids[10]))
+        self.assertFalse(self.db.moveGameInList(listID, ids[0], ids[10]))
+        # Each game moved after the first halves the gap, so the list is renumbered along the way
+        self.db.addGamesToList(listID, ids[4:])
+        for gameID in ids[4:]:
+            self.db.moveGameInList(listID, gameID, ids[3])
+        self.assertEqual(self.listedIDs(listID), [ids[3], *ids[:3:-1], ids[1], ids[0], ids[2]])
+        self.db.deleteList(listID)
+
+    def testLongList(self):
+        """Test paging through a long list reads only each page from an index."""
+        listID = self.db.createList("Lister", "Everything")
+        self.assertEqual(self.db.addGamesToList(listID, self.gameIDs), 10000)
+        self.assertEqual(self.db.getList(listID)["gameCount"], 10000)
+        page, seen = {"next": None}, []
+        for _ in range(3):
+            page = self.db.getListGames(listID, after=page["next"], limit=100)
+            seen.extend(game["gameID"] for game in page["games"])
+        self.assertEqual(seen, self.gameIDs[:300])
+        with self.assertRaises(ValueError):
+            self.db.getListGames(listID, after="invalid")
+        plan = [row[3] for row in self.db.executeQuery(
+            "EXPLAIN QUERY PLAN SELECT l.position, games.gameID, games.gameName, games.releaseDate FROM gameListLink l \
+            INNER JOIN games ON l.gameID = games.gameID \
+            WHERE l.listID = ? AND l.position >= ? AND (l.position > ? OR l.gameID > ?) \
+            ORDER BY l.position, l.gameID LIMIT 51", (listID, 1024, 1024, 1))]
+        self.assertRegex(plan[0], r"^SEARCH l USING COVERING INDEX gameListLinkPosition \(listID=\? AND position>\?\)")
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+        self.db.deleteList(listID)
+
+class vocabularyTests(databaseTests):
+
+    def testLoadedOnce(self):
+        """Test that genres and publishers are only read again after they change."""
+        self.db.addGenre("Racing")
+        vocabulary = self.db.getVocabulary()
+        self.assertIs(self.db.getVocabulary(), vocabulary)
+        self.db.getGenres()
+        self.db.getPublishers()
+        self.assertIs(self.db.getVocabulary(), vocabulary)
+        for change, name in ((self.db.addPublisher, "Nintendo"), (self.db.deletePublisher, "Nintendo"),
+                             (self.db.addGenre, "Party"), (self.db.deleteGenre, "Party")):
+            change(name)
+            self.assertIsNot(self.db.getVocabulary(), vocabulary)
+            vocabulary = self.db.getVocabulary()
+
+    def testAddGameResolvesNames(self):
+        """Test that addGame matches genres and publishers without caring about case or duplicates."""
+        self.db.addGenre("Kart")
+        self.db.addPublisher("Mungtendo")
+        self.assertRaises(ValueError, self.db.addGame, "Mung Kart", "Racing mungs", "2008-04-10", ["kart", "Missing"], [])
+        self.db.addGame("Mung Kart", "Racing mungs", "2008-04-10", ["kart", "KART"], ["mungtendo"])
+        game = self.db.getGameByName("Mung Kart")
+        self.assertEqual(game["genres"], ["Kart"])
+        self.assertEqual(game["developers"], ["Mungtendo"])
+
+    def testSharedBetweenInstances(self):
+        """Test that a change made by another database on the same file is seen straight away."""
+        other = database(self.tempDataDir, validator)
+        self.db.addGenre("Shared")
+        self.assertIn("Shared", other.getGenres())
+        other.addGame("Shared Game", "Uses a genre added elsewhere", "2020-01-01", ["Shared"], [])
+        self.assertEqual(other.getGameByName("Shared Game")["genres"], ["Shared"])
+        self.db.deleteGenre("Shared")
+        self.assertNotIn("Shared", other.getGenres())
+        self.assertRaises(ValueError, other.addGame, "Shared Again", "The genre is gone", "2020-01-01", ["Shared"], [])
+        other.close()
+
+class searchTests(databaseTests):
+
+    @classmethod
+    def setUpClass(self):
+        """Add games to search for."""
+        super().setUpClass()
+        self.db.addGenre("Roguelike")
+        self.db.addPublisher("Supergiant Games")
+        self.db.addGame("Hades", "Battle out of hell", "2020-09-17", ["Roguelike"], ["Supergiant Games"])
+        self.db.addGame("Hollow Knight", "Explore a ruined kingdom of insects, with a hades like afterlife", "2017-02-24", [], [])
+        self.db.addGame("Halo", "Finish the fight", "2001-11-15", [], [])
+
+    def names(self, query, **kwargs):
+        return [result["name"] for result in self.db.searchGames(query, **kwargs)]
+
+    def testPrefix(self):
+        """Test that the last word matches as a prefix."""
+        self.assertEqual(self.names("hol"), ["Hollow Knight"])
+        self.assertEqual(sorted(self.names("ha", namesOnly=True)), ["Hades", "Halo"])
+        self.assertEqual(self.names("hollow kni"), ["Hollow Knight"])
+
+    def testRanking(self):
+        """Test that a name match ranks above a description match."""
+        self.assertEqual(self.names("hades"), ["Hades", "Hollow Knight"])
+        self.assertEqual(self.names("hades", namesOnly=True), ["Hades"])
+
+    def testGenresAndPublishers(self):
+        """Test that games can be found by genre and publisher."""
+        self.assertEqual(self.names("roguelike"), ["Hades"])
+        self.assertEqual(self.names("supergiant"), ["Hades"])
+
+    def testHighlight(self):
+        """Test that matching words are highlighted."""
+        result = self.db.searchGames("kingdom")[0]
+        self.assertEqual(result["highlight"], "Hollow Knight")
+        self.assertIn("[kingdom]", result["snippet"])
+
+    def testKeptInSync(self):
+        """Test that changes to games, genres and publishers update the search."""
+        self.db.addGenre("Shooter")
+        self.db.addGame("Doom", "Rip and tear", "1993-12-10", ["Shooter"], [])
+        self.assertEqual(self.names("shooter"), ["Doom"])
+        self.db.deleteGenre("Shooter")
+        self.assertEqual(self.names("shooter"), [])
+        self.db.deleteGameByID(self.db.getGameByName("Doom")["gameID"])
+        self.assertEqual(self.names("doom"), [])
+
+    def testNoWords(self):
+        """Test that a query with nothing to search for finds nothing."""
+        self.assertEqual(self.names(""), [])
+        self.assertEqual(self.names("\"*:^ -"), [])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+from scripts.imageProcessor import imageProcessor
+from testing.utils import baseTests
+
+from PIL import Image
+import io
+import os
+import unittest
+
+class imageProcessorTests(baseTests):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.images = imageProcessor(self.tempDataDir)
+        with open("static/images/evil mung.png", "rb") as f:
+            self.data = f.read()
+        large = io.BytesIO()
+        Image.new("RGB", (2048, 1024), (200, 100, 50)).save(large, "PNG")
+        self.large = large.getvalue()
+
+    @classmethod
+    def tearDownClass(self):
+        self.images.close()
+        super().tearDownClass()
+
+    def testProfilePicture(self):
+        """Test that profile pictures are resized"""
+        job = self.images.submit("pfp", "mung", self.data)
+        self.assertEqual(self.images.wait(job, 10)["status"], "done")
+        with Image.open(self.images.getPath("pfp", "mung")) as image:
+            self.assertEqual(image.size, (512, 512))
+        self.assertEqual(os.listdir(self.images.staging), [])
+
+    def testDerivatives(self):
+        """Test that promo images get derivatives smaller than the image"""
+        job = self.images.submit("promo", "derived", self.large)
+        self.assertEqual(self.images.wait(job, 30)["status"], "done")
+        for width in (128, 256, 512, 1024):
+            for format in self.images.formats:
+                with Image.open(self.images.getDerivativePath("promo", "derived", width, format)) as image:
+                    self.assertEqual(image.size, (width, width // 2))
+        self.assertFalse(os.path.exists(self.images.getDerivativePath("promo", "derived", 2048, "png")))
+
+    def testFindDerivative(self):
+        """Test picking the smallest derivative that is wide enough in an accepted format"""
+        job = self.images.submit("promo", "found", self.large)
+        self.images.wait(job, 30)
+        find = lambda width, formats=("png",): self.images.findDerivative("promo", "found", width, formats)
+        self.assertEqual(find(100), self.images.getDerivativePath("promo", "found", 128, "png"))
+        self.assertEqual(find(300, ("webp", "png")), self.images.getDerivativePath("promo", "found", 512, "webp"))
+        self.assertEqual(find(2000), self.images.getPath("promo", "found"))
+        self.assertEqual(find(None), self.images.getPath("promo", "found"))
+        self.assertIsNone(self.images.findDerivative("promo", "missing", 128))
+
+    def testBackfill(self):
+        """Test making derivatives for images saved before they existed"""
+        Image.new("RGB", (600, 300)).save(self.images.getPath("promo", "old"))
+        self.assertGreaterEqual(self.images.backfill("promo"), 1)
+        for width in (128, 256, 512):
+            self.assertTrue(os.path.exists(self.images.getDerivativePath("promo", "old", width, "webp")))
+        self.assertFalse(os.path.exists(self.images.getDerivativePath("promo", "old", 1024, "webp")))
+        self.assertEqual(self.images.backfill("promo"), 0)
+
+    def testInvalidImage(self):
+        """Test that a job fails if the upload can't be opened"""
+        job = self.images.submit("promo", "broken", b"not an image")
+        status = self.images.wait(job, 10)
+        self.assertEqual(status["status"], "failed")
+        self.assertFalse(os.path.exists(self.images.getPath("promo", "broken")))
+        self.assertEqual(os.listdir(self.images.staging), [])
+
+    def testResume(self):
+        """Test that staged images left over from a restart are processed"""
+        with open(os.path.join(self.images.staging, "promo.leftover.0123456789abcdef"), "wb") as f:
+            f.write(self.data)
+        self.assertEqual(self.images.resume(), ["0123456789abcdef"])
+        self.assertEqual(self.images.wait("0123456789abcdef", 10)["status"], "done")
+        self.assertTrue(os.path.exists(self.images.getPath("promo", "leftover")))
+
+    def testOtherProcess(self):
+        """Test that jobs run by another process can be reported on"""
+        other = imageProcessor(self.tempDataDir)
+        job = self.images.submit("pfp", "elsewhere", self.data)
+        self.assertIn(other.getJob(job)["status"], ("queued", "done"))
+        self.images.wait(job, 10)
+        self.assertEqual(other.getJob(job), self.images.getJob(job))
+        self.assertIsNone(other.getJob("../../database"))
+
+    def testUnknownJob(self):
+        """Test that unknown jobs have no status"""
+        self.assertIsNone(self.images.getJob("missing"))
+        self.assertIsNone(self.images.wait("missing", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
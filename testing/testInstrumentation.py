@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+from scripts.database import database
+from scripts.instrumentation import formatPrometheus, instrumentation, samplingProfiler
+from scripts.validator import validator
+from testing.utils import baseTests
+
+import flask
+import os
+import time
+import unittest
+
+class instrumentationTests(baseTests):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.db = database(self.tempDataDir, validator)
+        self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
+
+    @classmethod
+    def tearDownClass(self):
+        self.db.close()
+        super().tearDownClass()
+
+    def makeApp(self, profiler=None):
+        """Make an app with instrumented routes that use the database and templates."""
+        instruments = instrumentation(profiler)
+        app = flask.Flask(__name__)
+        instruments.instrumentApp(app)
+
+        @app.route("/query")
+        def query():
+            self.db.executeQuery("SELECT 1", ())
+            self.db.executeQuery("SELECT 2", ())
+            return flask.render_template_string("{{ value }}", value="done")
+
+        @app.route("/stream")
+        def stream():
+            return flask.Response(flask.stream_template_string(
+                "{% for row in rows %}{{ row[0] }}{% endfor %}", rows=self.db.executeQuery("SELECT 3", ())))
+
+        @app.route("/slow")
+        def slow():
+            time.sleep(0.1)
+            return "slow"
+        return instruments, app.test_client()
+
+    def testPhases(self):
+        """Test that a request's queries and rendering are counted against its route"""
+        instruments, client = self.makeApp()
+        instruments.instrumentDatabase(self.db)
+        self.addCleanup(delattr, self.db, "connect")
+        self.assertEqual(client.get("/query").data, b"done")
+        stats = instruments.getStats()
+        route = stats["requests"]["query"]["200"]
+        self.assertEqual(route["count"], 1)
+        self.assertEqual(route["phases"]["db"]["calls"], 2)
+        self.assertGreater(route["phases"]["db"]["seconds"], 0)
+        self.assertEqual(route["phases"]["render"]["calls"], 1)
+        self.assertEqual(route["buckets"]["10"], 1)
+        self.db.executeQuery("SELECT 1", ())
+        self.assertEqual(instruments.getStats()["phases"]["db"]["calls"], 3, "Query outside a request not in the totals")
+        self.assertIn(b"Not Found", client.get("/missing").data)
+        self.assertEqual(instruments.getStats()["requests"]["unknown"]["404"]["count"], 1)
+
+    def testStreamed(self):
+        """Test that streamed responses are timed until they have been sent"""
+        instruments, client = self.makeApp()
+        response = client.get("/stream")
+        self.assertEqual(response.data, b"3")
+        self.assertEqual(instruments.getStats()["requests"]["stream"]["200"]["phases"]["render"]["calls"], 1)
+
+    def testProfiler(self):
+        """Test that slow requests have their sampled stacks written"""
+        profiler = samplingProfiler(os.path.join(self.tempDataDir, "profiles"), threshold=0.05, interval=0.002)
+        instruments, client = self.makeApp(profiler)
+        profiler.start()
+        try:
+            self.assertEqual(client.get("/query").data, b"done")
+            self.assertEqual(client.get("/slow").data, b"slow")
+        finally:
+            profiler.stop()
+        files = os.listdir(profiler.directory)
+        self.assertEqual(len(files), 1, "Only the slow request should be written")
+        self.assertIn(".slow.", files[0])
+        with open(os.path.join(profiler.directory, files[0])) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertIn("slow (testInstrumentation.py:", stack.split(";")[-1])
+        self.assertGreater(int(count), 0)
+
+    def testPrometheus(self):
+        """Test formatting metrics as a Prometheus histogram, counters and gauges"""
+        text = formatPrometheus({
+            "workers": 2,
+            "pool": {"hits": 5, "misses": 1},
+            "compression": {"gamelist.game": {"bytesIn": 100, "bytesOut": 40}},
+            "requests": {"gamelist.game": {"200": {"count": 3, "seconds": 0.3, "maxSeconds": 0.2,
+                "buckets": {"0.1": 2, "0.5": 3}, "phases": {"db": {"seconds": 0.1, "calls": 6}}}}},
+            "phases": {"db": {"seconds": 0.1, "calls": 6}}
+        })
+        lines = text.splitlines()
+        self.assertIn('teammung_request_duration_seconds_bucket{endpoint="gamelist.game",status="200",le="0.1"} 2', lines)
+        self.assertIn('teammung_request_duration_seconds_bucket{endpoint="gamelist.game",status="200",le="+Inf"} 3', lines)
+        self.assertIn('teammung_request_duration_seconds_count{endpoint="gamelist.game",status="200"} 3', lines)
+        self.assertIn('teammung_request_phase_calls_total{endpoint="gamelist.game",status="200",phase="db"} 6', lines)
+        self.assertIn("teammung_workers 2", lines)
+        self.assertIn("teammung_pool_misses 1", lines)
+        self.assertIn('teammung_compression_bytes_out{route="gamelist.game"} 40', lines)
+        self.assertEqual(lines.count("# TYPE teammung_request_duration_seconds histogram"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
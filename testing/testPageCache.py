@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+from scripts.pageCache import pageCache
+from testing.utils import baseTests
+
+import os
+import unittest
+
+class pageCacheTests(baseTests):
+
+    def testMemory(self):
+        """Test that pages are cached in memory only"""
+        pages = pageCache(directory=os.path.join(self.tempDataDir, "memory"))
+        pages.set(("page", 1, 0), "<p>One</p>")
+        self.assertEqual(pages.get(("page", 1, 0)), "<p>One</p>")
+        self.assertIsNone(pages.get(("page", 1, 1)))
+        self.assertEqual(os.listdir(pages.directory), [])
+
+    def testDisk(self):
+        """Test that fragments are read back from disk by a new cache"""
+        directory = os.path.join(self.tempDataDir, "disk")
+        pageCache(directory=directory).set(("fragment", 2, 0), "<p>Two</p>")
+        pages = pageCache(directory=directory)
+        self.assertEqual(pages.get(("fragment", 2, 0)), "<p>Two</p>")
+        self.assertEqual(pages.getStats()["diskHits"], 1)
+        self.assertEqual(pages.get(("fragment", 2, 0)), "<p>Two</p>")
+        self.assertEqual(pages.getStats()["diskHits"], 1, "Not kept in memory after reading from disk")
+
+    def testInvalidate(self):
+        """Test that invalidating a game only removes its pages"""
+        pages = pageCache(directory=os.path.join(self.tempDataDir, "invalidate"))
+        for gameID in (3, 33):
+            pages.set(("page", gameID, 0), "page")
+            pages.set(("fragment", gameID, 0), "fragment")
+        pages.invalidate(3)
+        self.assertIsNone(pages.get(("page", 3, 0)))
+        self.assertIsNone(pages.get(("fragment", 3, 0)))
+        self.assertEqual(pages.get(("fragment", 33, 0)), "fragment")
+        pages.invalidate()
+        self.assertIsNone(pages.get(("page", 33, 0)))
+        self.assertEqual(os.listdir(pages.directory), [])
+
+    def testOlderVersionsRemoved(self):
+        """Test that writing a page removes the game's older pages of the same kind from disk"""
+        pages = pageCache(directory=os.path.join(self.tempDataDir, "versions"))
+        for version in range(3):
+            pages.set(("fragment", 5, version), f"fragment {version}")
+        pages.set(("fragment", 55, 0), "other game")
+        self.assertEqual(os.listdir(pages.getGameDirectory(5)), [os.path.basename(pages.getPath(("fragment", 5, 2)))])
+        self.assertEqual(pageCache(directory=pages.directory).get(("fragment", 5, 2)), "fragment 2")
+        self.assertIsNone(pageCache(directory=pages.directory).get(("fragment", 5, 1)))
+        self.assertEqual(pageCache(directory=pages.directory).get(("fragment", 55, 0)), "other game")
+
+    def testDisabled(self):
+        """Test that a size of 0 turns off the cache"""
+        pages = pageCache(0, os.path.join(self.tempDataDir, "disabled"))
+        pages.set(("fragment", 4, 0), "fragment")
+        self.assertIsNone(pages.get(("fragment", 4, 0)))
+        self.assertEqual(os.listdir(pages.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
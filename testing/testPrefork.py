@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+from scripts.prefork import readMetrics
+from testing.utils import baseTests
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+import unittest
+
+# Runs a preforkServer whose workers reply to each connection with their process ID
+workerScript = textwrap.dedent("""
+    import os, sys
+    from scripts.prefork import preforkServer, metricsWriter
+
+    metrics = metricsWriter(sys.argv[2], lambda: {"requests": 1}, interval=0.1)
+
+    def serve(sock):
+        while True:
+            con, _ = sock.accept()
+            con.sendall(str(os.getpid()).encode())
+            con.close()
+
+    preforkServer("127.0.0.1", sys.argv[1], 2, serve, afterFork=metrics.start, onExit=metrics.stop).run()
+""")
+
+class preforkTests(baseTests):
+
+    def testAddMetrics(self):
+        """Test that worker metrics are added up"""
+        directory = os.path.join(self.tempDataDir, "added")
+        os.makedirs(directory)
+        for pid, metrics in ((os.getpid(), {"pool": {"hits": 2, "size": 8}, "maxSeconds": 1.5, "ratio": 0.5}),
+                             (os.getppid(), {"pool": {"hits": 3, "size": 8}, "maxSeconds": 0.5, "ratio": 0.5})):
+            with open(os.path.join(directory, f"worker.{pid}.json"), "w") as f:
+                json.dump(metrics, f)
+        with open(os.path.join(directory, "worker.999999999.json"), "w") as f:
+            f.write("{}")
+        self.assertEqual(readMetrics(directory), {"workers": 2, "pool": {"hits": 5, "size": 16}, "maxSeconds": 1.5})
+        self.assertFalse(os.path.exists(os.path.join(directory, "worker.999999999.json")), "Dead worker not removed")
+
+    def getWorkers(self, directory, count, exclude=(), timeout=10):
+        """Wait until count workers that aren't excluded have written metrics"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pids = {int(filename.split(".")[1]) for filename in os.listdir(directory)
+                    if filename.endswith(".json")} - set(exclude)
+            if len(pids) == count:
+                return pids
+            time.sleep(0.05)
+        self.fail(f"Expected {count} workers, found {pids}")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork")
+    def testWorkers(self):
+        """Test that workers share the socket and are restarted and reloaded"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        directory = os.path.join(self.tempDataDir, "workers")
+        os.makedirs(directory)
+        server = subprocess.Popen([sys.executable, "-c", workerScript, str(port), directory],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stderr=subprocess.PIPE)
+        try:
+            workers = self.getWorkers(directory, 2)
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as con:
+                self.assertIn(int(con.recv(16)), workers)
+            crashed = workers.pop()
+            os.kill(crashed, signal.SIGKILL)
+            os.remove(os.path.join(directory, f"worker.{crashed}.json"))
+            workers |= self.getWorkers(directory, 1, workers)
+            server.send_signal(signal.SIGHUP)
+            self.getWorkers(directory, 2, workers)
+            server.send_signal(signal.SIGTERM)
+            errors = server.communicate(timeout=10)[1]
+            self.assertEqual(server.returncode, 0)
+            self.assertIn(f"Worker {crashed} exited with status -9, restarting it".encode(), errors)
+            self.assertEqual(os.listdir(directory), [], "Workers not stopped")
+        finally:
+            if server.poll() is None:
+                server.kill()
+                server.communicate()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,12 +4,20 @@ from scripts.database import database
 from scripts.validator import validator
 import testing.utils
 
+import asyncio
 import flask
+import gzip
 import hashlib
 import os
+import re
 import sys
 import unittest
 
+try:
+    from scripts.asgi import asgiApp
+except ImportError:
+    asgiApp = None
+
 class serverTests(testing.utils.baseTests):
 
     @classmethod
@@ -18,6 +26,9 @@ class serverTests(testing.utils.baseTests):
         sys.argv = ["server.py", "--data-dir", self.tempDataDir]
         import server
         self.db = server.db
+        self.images = server.images
+        self.compression = server.compression
+        self.pages = server.pages
         self.client = server.gamelist.test_client()
         self.client.testing = True
 
@@ -26,6 +37,58 @@ class serverTests(testing.utils.baseTests):
         response = self.client.get("/static/images/defaultPFP.png")
         self.assertEqual(response.status_code, 200, "Not found")
     
+    def testStaticCaching(self):
+        """Test that static files have versioned URLs, ETags and 304 responses"""
+        page = self.client.get("/").data.decode()
+        url = re.search(r'href="(/static/styles/style.css\?v=\w+)"', page).group(1)
+        response = self.client.get(url)
+        self.assertTrue(response.cache_control.immutable, "Versioned URL not immutable")
+        self.assertGreater(response.cache_control.max_age, 86400)
+        etag = response.headers["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/static/styles/style.css")
+        self.assertTrue(response.cache_control.no_cache, "Unversioned URL cached without checking")
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.client.get("/static/../server.py").status_code, 404)
+
+    def testStaticCompressed(self):
+        """Test that static files are sent precompressed"""
+        response = self.client.get("/static/styles/style.css", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.mimetype, "text/css")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        with open("static/styles/style.css", "rb") as f:
+            self.assertEqual(gzip.decompress(response.data), f.read())
+        self.assertNotEqual(response.headers["ETag"], self.client.get("/static/styles/style.css").headers["ETag"])
+
+    def testPageCompressed(self):
+        """Test that large pages are compressed and small ones aren't"""
+        for i in range(20):
+            self.db.addGame(f"Compressible Game {i}", "Compressed", "2012-01-01", [], [])
+        response = self.client.get("/games", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn(b"Compressible Game", gzip.decompress(response.data))
+        stats = self.compression.getStats()["gamelist.allGames"]
+        self.assertLess(stats["ratio"], 1)
+        response = self.client.get("/images/jobs/missing", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        # Streamed pages are only compressed once they reach the minimum size too
+        minimumSize = self.compression.minimumSize
+        self.compression.minimumSize = 10 * 1024 * 1024
+        try:
+            response = self.client.get("/games", headers={"Accept-Encoding": "gzip"})
+        finally:
+            self.compression.minimumSize = minimumSize
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn(b"Compressible Game", response.data)
+
+    def testDefaultProfilePicture(self):
+        """Test that the default profile picture is sent without a redirect"""
+        response = self.client.get("/images/profile/nobody.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/png")
+
     def testRegisterValid(self):
         """Test registering with valid data"""
         self.client.post("/register", data={
@@ -93,6 +156,25 @@ class serverTests(testing.utils.baseTests):
             self.assertIn(b"<title>Log-in</title>", response.data, "Not on login page")
             self.assertIn(b"Invalid username or password", response.data, "Error message not in response login page")
 
+    def testLoginBusy(self):
+        """Test that logins get a 503 when the password hashers are overloaded"""
+        self.db.addUser("joe5", "Pa55w0rd!123", "test555@example.com",
+            "2003-07-23", "07000000000")
+        hasher = self.db.hasher
+        taken = 0
+        while hasher.slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.client.post("/login", data={
+                "username": "joe5",
+                "password": "Pa55w0rd!123"
+            })
+        finally:
+            for _ in range(taken):
+                hasher.slots.release()
+        self.assertEqual(response.status_code, 503, "Not rejected")
+        self.assertIn("Retry-After", response.headers)
+
     def testLogout(self):
         """Test that the user is logged out
         uses the nav bar to know"""
@@ -118,7 +200,11 @@ class serverTests(testing.utils.baseTests):
             response = self.client.post("/images/profile/upload", data={
                 "image": (f, "testImage.png")
             })
-        self.assertEqual(b"{\"success\":true}\n", response.data, "Not successful")
+        self.assertTrue(response.json["success"], "Not successful")
+        job = self.client.get("/images/jobs/" + response.json["job"]).json
+        self.assertIn(job["status"], ("queued", "processing", "done"))
+        self.assertEqual(self.images.wait(response.json["job"], 10)["status"], "done", "Not processed")
+        self.assertEqual(self.client.get("/images/jobs/" + response.json["job"]).json["progress"], 100)
         filename = self.db.directory + "/images/pfp/" + hashlib.md5(b"joe4").hexdigest() + ".png"
         self.assertTrue(os.path.exists(filename), "File not uploaded")
 
@@ -136,6 +222,18 @@ class serverTests(testing.utils.baseTests):
         })
         self.assertIn("TestPublisher", self.db.getPublishers(), "Publisher not added to database")
 
+    def testPromoDerivative(self):
+        """Test that promo images are sent at the asked for width in an accepted format"""
+        with open("static/images/evil mung.png", "rb") as f:
+            job = self.images.submit("promo", "testpromo", f.read())
+        self.images.wait(job, 10)
+        response = self.client.get("/images/promo/testpromo.png?w=100", headers={"Accept": "image/webp,*/*"})
+        self.assertEqual(response.mimetype, "image/webp")
+        self.assertIn("Accept", response.headers["Vary"])
+        response = self.client.get("/images/promo/testpromo.png?w=100", headers={"Accept": "*/*"})
+        self.assertEqual(response.mimetype, "image/png")
+        self.assertEqual(self.client.get("/images/promo/missing.png").status_code, 404)
+
     def testGetGame(self):
         """Test getting a game"""
         self.db.addGenre("Adventure")
@@ -148,6 +246,186 @@ class serverTests(testing.utils.baseTests):
         self.assertIn(b"Adventure", response.data, "No Genre")
         self.assertIn(b"Infinite Fall", response.data, "No Publisher")
 
+    def testGamePageCached(self):
+        """Test that game pages are cached until the game changes
+        and that logged in users don't get a cached nav bar"""
+        self.db.addGenre("Roguelike")
+        self.db.addGame("Hades", "Escape the underworld", "2020-09-17", ["Roguelike"], [])
+        client = self.client.application.test_client()
+        before = self.pages.getStats()["hits"]
+        first = client.get("/game/Hades").data
+        self.assertEqual(client.get("/game/Hades").data, first)
+        self.assertEqual(self.pages.getStats()["hits"] - before, 1, "Page not cached")
+        self.db.deleteGenre("Roguelike")
+        self.assertNotIn(b"Roguelike", client.get("/game/Hades").data, "Page not invalidated")
+        self.db.addUser("joe6", "Pa55w0rd!123", "test666@example.com",
+            "2003-07-23", "07000000000")
+        client.post("/login", data={
+            "username": "joe6",
+            "password": "Pa55w0rd!123"
+        })
+        response = client.get("/game/Hades")
+        self.assertIn(b"joe6", response.data, "Cached logged out page sent to logged in user")
+        self.assertIn(b"Escape the underworld", response.data)
+
+    def testReviews(self):
+        """Test posting, replacing and deleting a review, and that the game page shows it"""
+        self.db.addGame("Celeste", "Climb the mountain", "2018-01-25", [], [])
+        client = self.client.application.test_client()
+        self.assertIn(b"No one has reviewed this game yet", client.get("/game/Celeste").data)
+        for username, email in [("joe8", "test881@example.com"), ("joe9", "test882@example.com")]:
+            self.db.addUser(username, "Pa55w0rd!123", email, "2003-07-23", "07000000000")
+        client.post("/login", data={"username": "joe8", "password": "Pa55w0rd!123"})
+        self.assertEqual(client.post("/game/Celeste/reviews", data={"rating": "6", "reviewText": ""}).status_code, 400)
+        response = client.post("/game/Celeste/reviews", data={"rating": "2", "reviewText": "Too hard"})
+        self.assertEqual(response.status_code, 302, "Not redirected")
+        client.post("/game/Celeste/reviews", data={"rating": "5", "reviewText": "Got good"})
+        page = client.get("/game/Celeste").data
+        self.assertIn(b"5.0 out of 5 stars from 1 review", page, "Review not replaced")
+        self.assertIn(b"Got good", page)
+        self.assertIn(b"Edit your review", page)
+        reviewID = self.db.getUserReview("joe8", self.db.getGameByName("Celeste")["gameID"])["reviewID"]
+        other = self.client.application.test_client()
+        other.post("/login", data={"username": "joe9", "password": "Pa55w0rd!123"})
+        self.assertEqual(other.post(f"/reviews/{reviewID}/delete").status_code, 403)
+        self.assertEqual(client.post(f"/reviews/{reviewID}/delete").status_code, 302)
+        self.assertIsNone(self.db.getReviewByID(reviewID))
+        self.assertIn(b"No one has reviewed this game yet", other.get("/game/Celeste").data, "Page not invalidated")
+
+    def testLists(self):
+        """Test making a list, adding, moving and removing games, and that others can't change it"""
+        for name in ("Braid", "Fez", "Limbo"):
+            self.db.addGame(name, "A list game", "2010-01-01", [], [])
+        ids = [self.db.getGameByName(name)["gameID"] for name in ("Braid", "Fez", "Limbo")]
+        for username, email in [("joe10", "test1010@example.com"), ("joe11", "test1111@example.com")]:
+            self.db.addUser(username, "Pa55w0rd!123", email, "2003-07-23", "07000000000")
+        client = self.client.application.test_client()
+        self.assertEqual(client.get("/lists").status_code, 302, "Lists sent to a logged out user")
+        client.post("/login", data={"username": "joe10", "password": "Pa55w0rd!123"})
+        self.assertIn(b"List name must be", client.post("/lists", data={"listName": ""}).data)
+        response = client.post("/lists", data={"listName": "Puzzlers"})
+        self.assertEqual(response.status_code, 302)
+        listURL = response.location
+        client.post(listURL + "/games", data={"gameID": [str(gameID) for gameID in ids]})
+        client.post(listURL + "/games/move", data={"gameID": str(ids[2]), "after": ""})
+        page = client.get(listURL).data.decode()
+        self.assertIn("3 games", page)
+        self.assertLess(page.index("Limbo"), page.index("Braid"), "Game not moved")
+        self.assertIn("Puzzlers", client.get("/lists").data.decode())
+        other = self.client.application.test_client()
+        other.post("/login", data={"username": "joe11", "password": "Pa55w0rd!123"})
+        self.assertEqual(other.get(listURL).status_code, 404, "Private list sent to another user")
+        self.assertEqual(other.post(listURL + "/delete").status_code, 404)
+        self.assertNotIn(b"Puzzlers", other.get("/user?username=joe10").data)
+        client.post(listURL + "/games/remove", data={"gameID": [str(ids[0]), str(ids[1])]})
+        self.assertIn("1 game ", client.get(listURL).data.decode())
+        client.post(listURL + "/rename", data={"listName": "Just Limbo"})
+        self.assertIn(b"Just Limbo", client.get("/user").data)
+        self.assertEqual(client.post(listURL + "/delete").status_code, 302)
+        self.assertEqual(client.get(listURL).status_code, 404)
+
+    def testMetrics(self):
+        """Test that only admins can see the metrics, and that requests are counted"""
+        client = self.client.application.test_client()
+        self.assertEqual(client.get("/metrics").status_code, 403)
+        self.db.addUser("admin7", "Pa55w0rd!123", "test777@example.com",
+            "2003-07-23", "07000000000")
+        client.post("/login", data={
+            "username": "admin7",
+            "password": "Pa55w0rd!123"
+        }).data
+        self.assertEqual(client.get("/metrics").status_code, 403, "Metrics sent to a user who isn't an admin")
+        self.db.changeUserRole("admin7", "admin")
+        client.get("/games").data
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.data.decode()
+        self.assertRegex(text, r'teammung_request_duration_seconds_count\{endpoint="gamelist.allGames",status="200"\} [1-9]')
+        self.assertRegex(text, r'teammung_request_phase_calls_total\{endpoint="gamelist.loginPost",status="302",phase="hash"\} [1-9]')
+        self.assertIn("teammung_pool_hits", text)
+
+    def asgiRequest(self, app, method, path, query=b"", headers=(), body=()):
+        """Send a request to an ASGI app, with the body split into the given chunks"""
+        messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in body]
+        messages.append({"type": "http.request", "body": b"", "more_body": False})
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "http_version": "1.1", "method": method, "path": path, "query_string": query,
+                 "headers": [(name.lower().encode(), value.encode()) for name, value in headers]}
+        asyncio.run(app(scope, receive, send))
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    @unittest.skipIf(asgiApp is None, "Needs a2wsgi")
+    def testASGI(self):
+        """Test that the same routes work when run as an ASGI app"""
+        app = asgiApp(self.client.application, threads=2, db=self.db)
+        try:
+            self.db.addGame("Async Game", "Served on an event loop", "2021-01-01", [], [])
+            status, body = self.asgiRequest(app, "GET", "/games", b"limit=200&order=id")
+            self.assertEqual(status, 200)
+            self.assertIn(b"Async Game", body, "Streamed page not sent")
+            status, _ = self.asgiRequest(app, "POST", "/games/addGenre",
+                headers=[("Content-Type", "application/x-www-form-urlencoded"), ("Content-Length", "23")],
+                body=[b"genreName=", b"AsyncGenre", b"123"])
+            self.assertIn("AsyncGenre123", self.db.getGenres(), "Chunked request body not read")
+            # An HTTP/2 client sends each cookie in its own header
+            scope = app.joinCookies({"headers": [(b"cookie", b"a=1"), (b"accept", b"*/*"), (b"cookie", b"session=2")]})
+            self.assertEqual(scope["headers"], [(b"accept", b"*/*"), (b"cookie", b"a=1; session=2")])
+            status, _ = self.asgiRequest(app, "POST", "/games/addGenre",
+                headers=[("Content-Type", "application/x-www-form-urlencoded"),
+                         ("Content-Length", str(9 * 1024 * 1024))], body=[b"genreName="])
+            self.assertEqual(status, 413)
+        finally:
+            app.executor.shutdown()
+
+    @unittest.skipIf(asgiApp is None, "Needs a2wsgi")
+    def testASGILifespan(self):
+        """Test that the ASGI app checks the database on startup and closes it on shutdown"""
+        db = database(self.tempDataDir, validator)
+        app = asgiApp(self.client.application, threads=1, db=db)
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(app({"type": "lifespan"}, receive, send))
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertTrue(db.pool.closed, "Database not closed")
+
+    def testGamesPage(self):
+        """Test paging through the games list"""
+        for name in ("Paged Game A", "Paged Game B"):
+            self.db.addGame(name, "A game on a page", "2010-01-01", [], [])
+        response = self.client.get("/games?limit=1&order=id")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed, "Games list not streamed")
+        self.assertEqual(response.data.count(b"<li>"), 1, "Page not limited")
+        self.assertIn(b"Next</a>", response.data, "No next page link")
+        self.assertNotIn(b"Previous</a>", response.data, "Previous link on first page")
+        self.assertEqual(self.client.get("/games?limit=1000").status_code, 400)
+        self.assertEqual(self.client.get("/games?after=bad").status_code, 400)
+        # A cursor whose sort value has the wrong type is refused before the page starts being sent
+        self.assertEqual(self.client.get("/games?after=W1sxXSwxXQ").status_code, 400)
+
+    def testSearch(self):
+        """Test searching for games"""
+        self.db.addGame("Searchable <Game>", "Findable with search", "2015-03-04", [], [])
+        response = self.client.get("/search?q=searchab")
+        self.assertIn(b"<mark>Searchable</mark> &lt;Game&gt;", response.data, "Result not highlighted and escaped")
+        response = self.client.get("/search?q=searchab&format=json")
+        self.assertEqual(["Searchable <Game>"], [result["name"] for result in response.json["results"]])
+
     def testAddGame(self):
         """Test adding a game"""
         self.db.addGenre("Sandbox")
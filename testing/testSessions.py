@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from scripts.database import database
+from scripts.sessions import loadSecretKey, makeSessionStore, sessionInterface
+from scripts.validator import validator
+from testing.utils import baseTests
+
+import flask
+import os
+import time
+import unittest
+
+class sessionTests(baseTests):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.db = database(self.tempDataDir, validator)
+        self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
+
+    @classmethod
+    def tearDownClass(self):
+        self.db.close()
+        super().tearDownClass()
+
+    def makeApp(self, store, ttl=60):
+        """Make an app that logs in, logs out and shows the session"""
+        app = flask.Flask(__name__)
+        app.secret_key = loadSecretKey(os.path.join(self.tempDataDir, "secretKey"))
+        app.session_interface = sessionInterface(store, ttl)
+        app.add_url_rule("/", "show", lambda: dict(flask.session))
+
+        @app.route("/login/<username>")
+        def login(username):
+            flask.session.regenerate()
+            flask.session["username"] = username
+            return ""
+
+        @app.route("/logout")
+        def logout():
+            flask.session.clear()
+            return ""
+        return app
+
+    def testSecretKey(self):
+        """Test that the secret key is kept between restarts"""
+        path = os.path.join(self.tempDataDir, "keptKey")
+        key = loadSecretKey(path)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(loadSecretKey(path), key)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def testStores(self):
+        """Test saving, loading, expiring and sweeping sessions"""
+        for name in ("sqlite", "memory"):
+            store = makeSessionStore(name, self.db)
+            store.set("kept", {"username": "joe"}, time.time() + 60)
+            store.set("expired", {"username": "old"}, time.time() - 1)
+            self.assertEqual(store.get("kept")[0], {"username": "joe"}, name)
+            self.assertIsNone(store.get("expired"), name)
+            self.assertEqual(store.sweep(), 1, name)
+            store.delete("kept")
+            self.assertIsNone(store.get("kept"), name)
+        self.assertRaises(ValueError, makeSessionStore, "floppy", self.db)
+
+    def testRestart(self):
+        """Test that a session is still valid in a new app with the same store"""
+        store = makeSessionStore("sqlite", self.db)
+        client = self.makeApp(store).test_client()
+        client.get("/login/joe")
+        cookie = client.get_cookie("session").value
+        self.assertLess(len(cookie), 64, "Session cookie not compact")
+        restarted = self.makeApp(makeSessionStore("sqlite", self.db)).test_client()
+        restarted.set_cookie("session", cookie)
+        self.assertEqual(restarted.get("/").json, {"username": "joe"})
+        restarted.set_cookie("session", cookie[:-2] + "xx")
+        self.assertEqual(restarted.get("/").json, {}, "Tampered cookie accepted")
+
+    def testLoginLogout(self):
+        """Test that logging in gives a new ID and logging out deletes the session"""
+        store = makeSessionStore("memory", self.db)
+        client = self.makeApp(store).test_client()
+        client.get("/login/joe")
+        first = client.get_cookie("session").value
+        client.get("/login/joe")
+        self.assertNotEqual(client.get_cookie("session").value, first, "ID not regenerated")
+        self.assertEqual(len(store.sessions), 1, "Old session not deleted")
+        client.get("/logout")
+        self.assertEqual(store.sessions, {})
+        self.assertIsNone(client.get_cookie("session"))
+
+    def testRefresh(self):
+        """Test that sessions are only saved again once half their time is used"""
+        store = makeSessionStore("memory", self.db)
+        client = self.makeApp(store, ttl=60).test_client()
+        client.get("/login/joe")
+        sessionID, (_, expires) = next(iter(store.sessions.items()))
+        client.get("/")
+        self.assertEqual(store.sessions[sessionID][1], expires, "Saved when unchanged")
+        store.sessions[sessionID] = (store.sessions[sessionID][0], time.time() + 20)
+        client.get("/")
+        self.assertGreater(store.sessions[sessionID][1], time.time() + 50, "Not refreshed")
+
+
+if __name__ == "__main__":
+    unittest.main()
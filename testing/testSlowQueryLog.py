@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+from scripts.database import database
+from scripts.slowQueryLog import isFullScan, normaliseStatement, readSlowQueries, reportSlowQueries, slowQueryLog
+from scripts.validator import validator
+from testing.utils import baseTests
+
+import gc
+import os
+import unittest
+
+class slowQueryLogTests(baseTests):
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.db = database(self.tempDataDir, validator)
+        self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
+        for i in range(5):
+            self.db.addGame(f"Slow Game {i}", "Logged", "2015-01-01", [], [])
+
+    @classmethod
+    def tearDownClass(self):
+        self.db.close()
+        super().tearDownClass()
+
+    def makeLog(self, name, threshold=0, **kwargs):
+        log = slowQueryLog(os.path.join(self.tempDataDir, name, "slowQueries.log"), threshold, **kwargs)
+        log.instrumentDatabase(self.db)
+        self.addCleanup(log.close)
+        self.addCleanup(delattr, self.db, "connect")
+        return log
+
+    def testLogged(self):
+        """Test that queries are logged with their parameter types, rows and plan"""
+        log = self.makeLog("logged")
+        self.db.executeQuery("SELECT gameID FROM games WHERE gameName LIKE ?", ("Slow%",))
+        self.db.getGameByName("Slow Game 1")
+        gc.collect()
+        entries = list(readSlowQueries(log.path))
+        scan = [entry for entry in entries if entry["statement"].startswith("SELECT gameID FROM games WHERE")][0]
+        self.assertEqual(scan["params"], ["str(5)"])
+        self.assertEqual(scan["rows"], 5)
+        self.assertTrue(isFullScan(scan["plan"]), scan["plan"])
+        game = [entry for entry in entries if "LOWER(games.gameName) = ?" in entry["statement"]][0]
+        self.assertEqual(game["rows"], 1, "Query fetched with fetchone not logged when the cursor was dropped")
+        self.assertFalse(isFullScan(game["plan"]), game["plan"])
+
+    def testFullScans(self):
+        """Test that scans of a table are found, even in the order of an index"""
+        plan = lambda query: [row[3] for row in self.db.executeQuery("EXPLAIN QUERY PLAN " + query, ())]
+        for query in ("SELECT gameID FROM games WHERE gameDescription LIKE '%a%'",
+                      "SELECT gameID, gameDescription FROM games ORDER BY LOWER(gameName)",
+                      "SELECT gameID FROM games ORDER BY LOWER(gameName)"):
+            self.assertTrue(isFullScan(plan(query)), plan(query))
+        for query in ("SELECT gameName FROM games WHERE gameID = 1",
+                      "SELECT value FROM json_each('[1, 2]')",
+                      "SELECT 1",
+                      "SELECT * FROM (SELECT genreID, COUNT(*) FROM gameGenresLink WHERE gameID = 1 GROUP BY genreID) ORDER BY 2"):
+            self.assertFalse(isFullScan(plan(query)), plan(query))
+
+    def testThreshold(self):
+        """Test that only queries over the threshold are logged"""
+        log = self.makeLog("threshold", threshold=60)
+        self.db.executeQuery("SELECT COUNT(*) FROM games", ())
+        self.assertEqual(list(readSlowQueries(log.path)), [])
+
+    def testRotation(self):
+        """Test that the log is rotated and the report reads the rotated files"""
+        log = self.makeLog("rotation", maxBytes=1024, backups=3)
+        for i in range(30):
+            self.db.executeQuery(f"SELECT gameName FROM games WHERE gameID = {i}", ())
+        self.assertTrue(os.path.exists(log.path + ".1"), "Log not rotated")
+        self.assertFalse(os.path.exists(log.path + ".4"), "Too many rotated logs kept")
+        groups = reportSlowQueries(readSlowQueries(log.path))
+        self.assertEqual(len(groups), 1, "Statements with different literals not grouped")
+        self.assertEqual(groups[0]["statement"], "SELECT gameName FROM games WHERE gameID = ?")
+        self.assertGreater(groups[0]["count"], 4)
+        self.assertLess(groups[0]["count"], 30)
+
+    def testNormalise(self):
+        """Test that statements are normalised the same for every call"""
+        self.assertEqual(normaliseStatement("SELECT * FROM games\n    WHERE gameName = 'Hades' AND gameID IN (1, 2, 3)"),
+            "SELECT * FROM games WHERE gameName = ? AND gameID IN (?...)")
+        self.assertEqual(normaliseStatement("SELECT a1 FROM t2 LIMIT 10"), "SELECT a1 FROM t2 LIMIT ?")
+
+if __name__ == "__main__":
+    unittest.main()
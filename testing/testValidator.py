@@ -50,6 +50,7 @@ class usernameTests(validatorTests):
     def setUpClass(self):
         super().setUpClass()
         self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
         self.method = self.validator.username
     
     def testLength(self):
@@ -103,6 +104,7 @@ class emailTests(validatorTests):
     def setUpClass(self):
         super().setUpClass()
         self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
         self.method = self.validator.email
 
     def testValid(self):
@@ -175,6 +177,7 @@ class gameTitleTests(validatorTests):
     def setUpClass(self):
         super().setUpClass()
         self.db.executeScript("databaseStructure.sql")
+        self.db.migrate()
         self.method = self.validator.gameTitle
     
     def testLength(self):
@@ -220,5 +223,48 @@ class releaseDateTests(validatorTests):
             "1959-12-31", "1959-01-01", "1959-06-07", "1959-06-23", "1959-04-19", "1959-07-23", "1959-11-29"])
 
 
+class reviewTests(validatorTests):
+    """Test the review rating and text validator methods"""
+
+    def testRating(self):
+        """Test the rating is a whole number of stars"""
+        self.method = self.validator.rating
+        self.validInvalid("Rating must be between 1 and 5 stars",
+            ["1", "2", "3", "4", "5"],
+            ["0", "6", "", "3.5", "-1", " 3", "five", "10"])
+
+    def testLength(self):
+        """Test the length of the review text"""
+        self.method = self.validator.reviewText
+        self.length("Review must be at most 1024 characters long",
+            (0, 1, 100, 1024), (1025, 2048))
+
+
+class genreAndPublisherNameTests(validatorTests):
+    """Test the genre and publisher name validator methods"""
+
+    def testLength(self):
+        """Test the length of genre and publisher names"""
+        self.method = self.validator.genreName
+        self.length("Genre name must be between 3 and 32 characters long.", (3, 16, 31), (0, 2, 32))
+        self.method = self.validator.publisherName
+        self.length("Publisher name must be between 3 and 64 characters long.", (3, 32, 63), (0, 2, 64))
+
+
+class listNameTests(validatorTests):
+    """Test the list name validator method"""
+
+    @classmethod
+    def setUpClass(self):
+        super().setUpClass()
+        self.method = self.validator.listName
+
+    def testLength(self):
+        """Test the length of the list name"""
+        self.length("List name must be between 1 and 64 characters long",
+            (1, 2, 32, 64), (0, 65, 128))
+        self.validInvalid("List name must be between 1 and 64 characters long", [], ["   "])
+
+
 if __name__ == "__main__":
     unittest.main()